@@ -0,0 +1,344 @@
+"""Microbenchmarks dos pontos quentes do detector, tracker, overlay e logger.
+
+Uso:
+    python benchmarks/bench_hotpaths.py                  # roda e compara com benchmarks/baseline.json
+    python benchmarks/bench_hotpaths.py --quick          # só mede (amostragem reduzida, sem comparação)
+    python benchmarks/bench_hotpaths.py --save-baseline --runs 3  # grava a baseline desta máquina
+
+benchmarks/baseline.json (versionada) é a referência gerada na máquina de desenvolvimento;
+a comparação sai com código 1 se algum ponto quente ficar mais lento que a tolerância.
+Cada execução também mede uma carga fixa de calibração (Python + NumPy + OpenCV) e os
+tempos são comparados relativos a ela, então a referência vale em outra máquina e a
+variação de velocidade da própria máquina entre execuções não vira falsa regressão.
+A comparação usa a melhor amostra desta execução (min_us) contra a mediana da baseline:
+ruído só deixa uma amostra mais lenta, então um pico passageiro não acusa regressão,
+mas um ponto quente que ficou mais lento em todas as amostras acusa.
+A baseline é gravada com --runs 3 (mediana de três passadas), para não herdar uma passada
+fora da curva. Para uma comparação mais estrita na estação, grave a baseline dela.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cube_time_logger import CubeTimeLogger
+from webcam_detect_adaptive import CubeDetector
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Benchmarks que gravam em disco (logger): variam mais entre execuções, usam --io-tolerance
+IO_BENCHMARKS = ('add_cube', 'save_to_files')
+
+FRAME_SIZE = (480, 640)
+COLORS_BGR = {
+    'white': (235, 235, 235),
+    'yellow': (20, 220, 230),
+    'red': (30, 30, 200),
+    'orange': (10, 130, 245),
+    'blue': (190, 70, 20),
+    'green': (40, 190, 40)
+}
+
+
+def make_frame(n_cubes, shift=0, seed=0):
+    """Frame 640x480 com ruído e n_cubes quadrados coloridos; retorna (frame, bboxes)"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 60, (*FRAME_SIZE, 3), dtype=np.uint8)
+    bboxes = []
+    for i, color in enumerate(list(COLORS_BGR)[:n_cubes]):
+        x1 = 20 + (i % 3) * 200 + shift
+        y1 = 40 + (i // 3) * 220
+        x2, y2 = x1 + 140, y1 + 140
+        cv2.rectangle(frame, (x1, y1), (x2, y2), COLORS_BGR[color], -1)
+        bboxes.append((x1, y1, x2, y2))
+    return frame, bboxes
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """Mede func() e retorna estatísticas em microssegundos por chamada"""
+    # Calibra o número de chamadas por amostra
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+
+    samples.sort()
+    return {
+        'median_us': samples[len(samples) // 2],
+        'min_us': samples[0],
+        'max_us': samples[-1],
+        'calls_per_sample': number
+    }
+
+
+def make_logger(directory, n_groups, persistence='rewrite'):
+    """Logger gravando em directory, já com n_groups grupos finalizados no histórico"""
+    logger = CubeTimeLogger(persistence=persistence,
+                            baselines_file=os.path.join(directory, 'bench_baselines.json'))
+    logger.log_file = os.path.join(directory, 'bench_times.txt')
+    logger.json_file = os.path.join(directory, 'bench_times.json')
+    logger.jsonl_file = os.path.join(directory, 'bench_times.jsonl')
+    colors = list(COLORS_BGR)
+    for group in range(n_groups):
+        cubes = [{
+            'color': colors[(group + i) % 6],
+            'face_name': logger.color_mapping[colors[(group + i) % 6]],
+            'individual_time': 4.0 + i,
+            'timestamp': '2025-10-13T20:00:00'
+        } for i in range(3)]
+        logger.all_groups.append({
+            'group_number': group + 1,
+            'cubes': cubes,
+            'total_group_time': sum(cube['individual_time'] for cube in cubes),
+            'timestamp': '2025-10-13T20:00:00'
+        })
+    logger.group_number = n_groups + 1
+    return logger
+
+
+def bench_detect_cube_color(detector, results, measure_kwargs):
+    for n_cubes in (1, 3, 6):
+        frame, bboxes = make_frame(n_cubes)
+
+        def run():
+            for bbox in bboxes:
+                detector.detect_cube_color(frame, bbox)
+
+        results[f'detect_cube_color[{n_cubes} cubos]'] = measure(run, **measure_kwargs)
+
+
+def bench_update_tracking(detector, results, measure_kwargs):
+    for n_cubes in (1, 3, 6):
+        # Sequência de frames com os cubos andando, em ciclo
+        frames = [make_frame(n_cubes, shift=step * 4) for step in range(8)]
+        detections_per_frame = [
+            [{'bbox': bbox, 'confidence': 0.9, 'frame': frame} for bbox in bboxes]
+            for frame, bboxes in frames
+        ]
+        state = {'index': 0, 'time': 0.0}
+
+        def run():
+            detections = detections_per_frame[state['index'] % len(detections_per_frame)]
+            state['index'] += 1
+            state['time'] += 1 / 30
+            detector.update_tracking(detections, state['time'])
+
+        results[f'update_tracking[{n_cubes} cubos]'] = measure(run, **measure_kwargs)
+        detector.end_all_cubes(state['time'])
+
+
+def bench_draw_time_block(detector, results, measure_kwargs):
+    for color in COLORS_BGR:
+        detector.color_total_times[color] = 12.5
+    frame, _ = make_frame(0)
+
+    def run():
+        detector.draw_time_block(frame, detector)
+
+    results['draw_time_block[6 cores]'] = measure(run, **measure_kwargs)
+    detector.color_total_times.clear()
+
+
+def bench_logger(directory, results, measure_kwargs, history_sizes):
+    colors = list(COLORS_BGR)
+    for n_groups in history_sizes:
+        for persistence in ('rewrite', 'append'):
+            logger = make_logger(directory, n_groups, persistence)
+
+            def add_group():
+                # Três cores diferentes completam um grupo: finalize + save + análise
+                for i in range(3):
+                    logger.add_cube(colors[(logger.group_number + i) % 6], 5.0)
+
+            name = 'add_cube' if persistence == 'rewrite' else 'add_cube[append]'
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[f'{name}[grupo completo, {n_groups} grupos]'] = measure(add_group, **measure_kwargs)
+            logger.close()
+
+        logger = make_logger(directory, n_groups)
+        results[f'save_to_files[{n_groups} grupos]'] = measure(logger.save_to_files, **measure_kwargs)
+
+
+def calibration_workload():
+    """Carga fixa que mistura o que os pontos quentes fazem (laço Python, NumPy e OpenCV)"""
+    frame, _ = make_frame(3)
+    patch = frame[:160, :160]
+
+    def work():
+        hsv = cv2.cvtColor(patch, cv2.COLOR_BGR2HSV)
+        np.count_nonzero(hsv[:, :, 0] > 90)
+        total = 0
+        for i in range(300):
+            total += i * i
+        return total
+    return work
+
+
+def measure_calibration(measure_kwargs):
+    return measure(calibration_workload(), **measure_kwargs)['median_us']
+
+
+def run_benchmarks(quick=False, runs=1):
+    """Executa todos os benchmarks; retorna (resultados, tempo da carga de calibração em us)
+
+    Com runs > 1, repete a bateria inteira e fica com a mediana de cada benchmark: um surto
+    de lentidão (ou de velocidade) da máquina numa passada não entra no resultado.
+    """
+    measure_kwargs = {'min_time': 0.05, 'repeat': 3} if quick else {'min_time': 0.5, 'repeat': 7}
+    history_sizes = (10, 200) if quick else (10, 1000, 5000)
+
+    detector = CubeDetector(None)
+    passes = []
+    # Calibração antes de cada grupo e no fim (mediana): acompanha a velocidade da máquina
+    # ao longo da execução sem depender de uma única medida
+    calibration = []
+    for _ in range(runs):
+        results = {}
+        for bench in (bench_detect_cube_color, bench_update_tracking, bench_draw_time_block):
+            calibration.append(measure_calibration(measure_kwargs))
+            bench(detector, results, measure_kwargs)
+        calibration.append(measure_calibration(measure_kwargs))
+        with tempfile.TemporaryDirectory() as directory:
+            bench_logger(directory, results, measure_kwargs, history_sizes)
+        calibration.append(measure_calibration(measure_kwargs))
+        passes.append(results)
+    return merge_runs(passes), float(np.median(calibration))
+
+
+def merge_runs(passes):
+    """Combina as passadas: mediana das medianas, mínimo e máximo de todas"""
+    if len(passes) == 1:
+        return passes[0]
+    merged = {}
+    for name in passes[0]:
+        stats = [results[name] for results in passes]
+        merged[name] = {
+            'median_us': float(np.median([stat['median_us'] for stat in stats])),
+            'min_us': min(stat['min_us'] for stat in stats),
+            'max_us': max(stat['max_us'] for stat in stats),
+            'calls_per_sample': stats[0]['calls_per_sample'],
+            'runs': len(stats)
+        }
+    return merged
+
+
+def speed_factor(report, baseline):
+    """Quanto esta execução está mais lenta que a da baseline na carga de calibração (1.0 sem ela)"""
+    if not baseline.get('calibration_us') or not report.get('calibration_us'):
+        return 1.0
+    return report['calibration_us'] / baseline['calibration_us']
+
+
+def compare(results, baseline, tolerance, factor=1.0, io_tolerance=None):
+    """Lista os benchmarks mais lentos que a baseline além da tolerância (descontado o fator da máquina)
+
+    Compara a melhor amostra desta execução com a mediana da baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+        ratio = result['min_us'] / reference['median_us'] / factor
+        limit = io_tolerance if io_tolerance is not None and name.startswith(IO_BENCHMARKS) else tolerance
+        if ratio > 1 + limit:
+            regressions.append((name, reference['median_us'], result['min_us'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos pontos quentes do detector de cubos")
+    parser.add_argument('--output', default='bench_results.json', help="arquivo JSON com os resultados")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline para comparação")
+    parser.add_argument('--save-baseline', action='store_true', help="grava os resultados como nova baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="piora relativa aceita antes de acusar regressão (0.25 = 25%%)")
+    parser.add_argument('--io-tolerance', type=float, default=1.0,
+                        help="tolerância dos benchmarks que gravam em disco (logger), mais ruidosos (padrão 1.0)")
+    parser.add_argument('--quick', action='store_true',
+                        help="menos repetições e históricos menores; só mede, sem comparar com a baseline")
+    parser.add_argument('--runs', type=int, default=1,
+                        help="passadas completas; fica com a mediana de cada benchmark (use 3 ao gravar a baseline)")
+    args = parser.parse_args(argv)
+    if args.quick and args.save_baseline:
+        parser.error("--save-baseline precisa da execução completa (sem --quick)")
+
+    results, calibration_us = run_benchmarks(args.quick, max(1, args.runs))
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__
+        },
+        'calibration_us': calibration_us,
+        'results': results
+    }
+
+    for name, result in report['results'].items():
+        print(f"{name:<45} {result['median_us']:12.1f} us")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Baseline gravada em {args.baseline}")
+        return 0
+
+    if args.quick:
+        # Poucas amostras e históricos menores: não comparável com a baseline completa
+        print("Modo --quick: resultados não comparados com a baseline")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Sem baseline em {args.baseline}; grave uma com --save-baseline")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    factor = speed_factor(report, baseline)
+    if baseline.get('machine', {}).get('platform') != report['machine']['platform']:
+        print(f"Baseline de outra máquina ({baseline.get('machine', {}).get('platform')})")
+    print(f"Carga de calibração: {report['calibration_us']:.1f}us ({factor:.2f}x a da baseline); "
+          f"tempos comparados relativos a ela")
+    regressions = compare(report['results'], baseline, args.tolerance, factor, args.io_tolerance)
+    if not regressions:
+        print("Nenhuma regressão em relação à baseline")
+        return 0
+
+    print("\nREGRESSÕES:")
+    for name, before, after, ratio in regressions:
+        print(f"  {name}: mediana {before:.1f}us -> melhor amostra {after:.1f}us ({ratio:.2f}x descontada a máquina)")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+
+class OpticalFlowPropagator:
+    def __init__(self, max_points=20, min_points=4, max_match_distance=120):
+        """Carrega as bboxes da última detecção para os frames seguintes usando fluxo óptico esparso"""
+        self.max_points = max_points
+        self.min_points = min_points
+        self.lk_params = dict(
+            winSize=(15, 15),
+            maxLevel=2,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+
+        self.max_match_distance = max_match_distance  # px entre detecções para ser o mesmo cubo
+
+        self.prev_gray = None
+        self.boxes = []   # [(bbox, confiança)]
+        self.points = []  # pontos rastreados de cada bbox
+
+        # Movimento medido (px/frame), média móvel exponencial; None = ainda não medido
+        self.motion = None
+        self.motion_alpha = 0.3
+        self.detected_centers = []  # centros das bboxes da última detecção do YOLO
+
+    def _update_motion(self, value):
+        if self.motion is None:
+            self.motion = value
+        else:
+            self.motion += self.motion_alpha * (value - self.motion)
+
+    def observe_detection(self, boxes, frames):
+        """Mede o movimento pelo deslocamento das bboxes entre duas detecções do YOLO
+
+        Roda a cada detecção (mesmo com o YOLO em todo frame, quando não há propagação),
+        então o movimento acompanha a cena nos dois sentidos. Sem bbox correspondente
+        (cena vazia, cubos novos), o movimento decai em direção a zero.
+        """
+        centers = [((x1 + x2) / 2, (y1 + y2) / 2) for (x1, y1, x2, y2), _ in boxes]
+        shifts = []
+        if self.detected_centers:
+            previous = np.float32(self.detected_centers)
+            for center in centers:
+                distances = np.hypot(*(previous - np.float32(center)).T)
+                nearest = float(distances.min())
+                if nearest <= self.max_match_distance:
+                    shifts.append(nearest / max(frames, 1))
+        self.detected_centers = centers
+
+        if shifts:
+            self._update_motion(max(shifts))
+        elif self.motion is not None:
+            self._update_motion(0.0)
+
+    def has_boxes(self):
+        return bool(self.boxes)
+
+    def reset(self, frame, boxes):
+        """Reinicia a partir de uma detecção completa do YOLO"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.prev_gray = gray
+        self.boxes = list(boxes)
+        self.points = []
+
+        for (x1, y1, x2, y2), _ in self.boxes:
+            roi = gray[max(0, y1):y2, max(0, x1):x2]
+            points = None
+            if roi.size:
+                points = cv2.goodFeaturesToTrack(roi, maxCorners=self.max_points,
+                                                 qualityLevel=0.01, minDistance=5)
+            if points is None:
+                points = np.empty((0, 1, 2), dtype=np.float32)
+            else:
+                points = (points + np.float32([max(0, x1), max(0, y1)])).astype(np.float32)
+            self.points.append(points)
+
+    def propagate(self, frame):
+        """Desloca as bboxes para o frame atual; bboxes cujos pontos se perderam são descartadas"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        counts = [len(points) for points in self.points]
+        if not sum(counts):
+            self.prev_gray = gray
+            return list(self.boxes)
+
+        # Um único cálculo de fluxo para os pontos de todas as bboxes
+        old_points = np.concatenate(self.points)
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, old_points, None, **self.lk_params
+        )
+        status = status.ravel().astype(bool)
+
+        frame_h, frame_w = gray.shape[:2]
+        boxes, points, motions = [], [], []
+        start = 0
+        for (bbox, conf), count in zip(self.boxes, counts):
+            end = start + count
+            good = status[start:end]
+            box_old, box_new = old_points[start:end][good], new_points[start:end][good]
+            start = end
+
+            # Sem textura suficiente desde a detecção: mantém a bbox parada
+            if count < self.min_points:
+                boxes.append((bbox, conf))
+                points.append(box_new)
+                continue
+
+            # Perdeu o rastro (provavelmente saiu da tela): espera a próxima detecção
+            if len(box_new) < self.min_points:
+                continue
+
+            dx, dy = np.median((box_new - box_old).reshape(-1, 2), axis=0)
+            x1, y1, x2, y2 = bbox
+            shift_x, shift_y = int(round(dx)), int(round(dy))
+            moved = (
+                min(max(0, x1 + shift_x), frame_w), min(max(0, y1 + shift_y), frame_h),
+                min(max(0, x2 + shift_x), frame_w), min(max(0, y2 + shift_y), frame_h)
+            )
+            boxes.append((moved, conf))
+            points.append(box_new)
+            motions.append(float(np.hypot(dx, dy)))
+
+        if motions:
+            self._update_motion(max(motions))
+
+        self.prev_gray = gray
+        self.boxes = boxes
+        self.points = points
+        return list(boxes)
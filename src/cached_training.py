@@ -0,0 +1,110 @@
+"""Treino e validação do YOLO lendo as imagens do cache pré-decodificado (dataset_cache.py).
+
+O ultralytics continua fazendo as augmentations; só a leitura muda: em vez de decodificar
+e redimensionar cada JPEG a cada época, a imagem sai pronta de um shard mapeado em memória.
+"""
+import os
+
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.data.utils import get_split_fraction
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import unwrap_model
+
+from dataset_cache import DatasetCache
+
+
+class CachedYOLODataset(YOLODataset):
+    def __init__(self, *args, image_cache, split, **kwargs):
+        """YOLODataset de um split do cache (imagens e rótulos vêm do índice, não das pastas)"""
+        self.image_cache = image_cache
+        self.split = split
+        self.entries = image_cache.entries(split)
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        if isinstance(self.fraction, float) and self.fraction < 1:
+            self.entries = self.entries[:round(len(self.entries) * self.fraction)]
+        if not self.entries:
+            raise FileNotFoundError(f"{self.prefix}Nenhuma imagem do split '{self.split}' no cache")
+        return [entry['source'] for entry in self.entries]
+
+    def get_labels(self):
+        labels = []
+        for entry in self.entries:
+            boxes = np.array(entry['labels'], dtype=np.float32).reshape(-1, 5)
+            labels.append({
+                'im_file': entry['source'],
+                'shape': tuple(entry['shape']),
+                'cls': boxes[:, 0:1],
+                'bboxes': boxes[:, 1:],
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh'
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True, resize_short=False):
+        """Mesma saída do load_image original (imagem com lado maior = imgsz), lida do shard"""
+        entry = self.entries[i]
+        # Cópia: as augmentations podem escrever na imagem e o shard é somente leitura
+        image = np.array(self.image_cache.image(entry))
+
+        # O mosaico sorteia as outras imagens entre as lidas recentemente (buffer do BaseDataset);
+        # não precisam ficar em self.ims, reler do shard é barato
+        if self.augment:
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return image, tuple(entry['shape']), image.shape[:2]
+
+
+def build_cached_dataset(cfg, img_path, batch, data, mode='train', rect=False, stride=32):
+    """Equivalente ao build_yolo_dataset do ultralytics para o cache (img_path = <cache>/<split>)"""
+    cache = DatasetCache(os.path.dirname(os.path.normpath(img_path)))
+    if cache.imgsz != cfg.imgsz:
+        raise ValueError(f"O cache foi gerado com imgsz={cache.imgsz}, mas o treino usa imgsz={cfg.imgsz}")
+    return CachedYOLODataset(
+        image_cache=cache,
+        split=os.path.basename(os.path.normpath(img_path)),
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == 'train',
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=None,
+        single_cls=cfg.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == 'train' else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+        fraction=get_split_fraction(cfg.fraction, 'train' if mode == 'train' else cfg.split)
+    )
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    def build_dataset(self, img_path, mode='train', batch=None):
+        stride = max(int(unwrap_model(self.model).stride.max()), 32)
+        return build_cached_dataset(self.args, img_path, batch, self.data, mode=mode,
+                                    rect=mode == 'val', stride=stride)
+
+
+class CachedDetectionValidator(DetectionValidator):
+    def build_dataset(self, img_path, mode='val', batch=None):
+        return build_cached_dataset(self.args, img_path, batch, self.data, mode=mode, stride=self.stride)
+
+
+def train_cached(model_path, data, **kwargs):
+    """Treina a partir de model_path com o data.yaml do cache"""
+    return YOLO(model_path).train(data=data, trainer=CachedDetectionTrainer, **kwargs)
+
+
+def validate_cached(model_path, data, **kwargs):
+    """Valida model_path no split de validação do cache"""
+    return YOLO(model_path).val(data=data, validator=CachedDetectionValidator, **kwargs)
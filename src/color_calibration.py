@@ -0,0 +1,532 @@
+"""Calibração offline dos ranges HSV e thresholds de cor a partir de recortes rotulados.
+
+Os datasets de treino só marcam onde está o cubo, não a cor. As cores ficam num CSV
+(uma linha por bbox) que a própria ferramenta gera pré-preenchido com a classificação
+atual, junto de uma miniatura de cada recorte para revisão.
+
+Uso:
+    python src/color_calibration.py --init-labels calibracao/cores.csv
+    python src/color_calibration.py --init-labels calibracao/cores.csv --video clips/*.mp4
+    python src/color_calibration.py --labels calibracao/cores.csv      # grava color_calibration.json
+"""
+import argparse
+import csv
+import functools
+import glob
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from inference_backends import load_first_backend
+from webcam_detect_adaptive import ALT_COLOR_RANGES, CALIBRATION_FILE, MODEL_PATHS, CubeDetector
+
+DEFAULT_DATASETS = ('dataset', 'dataset2')
+UNKNOWN = 'unknown'
+SKIP_LABELS = ('', 'skip')  # linhas ignoradas na calibração
+
+# Variações testadas em torno de cada limite dos ranges atuais
+HUE_DELTAS = (-4, -2, 0, 2, 4)
+SV_DELTAS = (-40, -20, 0, 20, 40)
+THRESHOLDS = np.round(np.arange(0.01, 0.31, 0.01), 2)
+CHANNEL_MAX = (180, 255, 255)
+
+CHUNK_SIZE = 16  # recortes por tarefa do pool
+DETECTION_CONFIDENCE = 0.5  # mesma confiança do detector em tempo real
+CSV_FIELDS = ('image', 'box', 'color', 'confidence', 'thumbnail')
+
+
+# -------------------------------
+# RANGES CANDIDATOS
+# -------------------------------
+def color_boxes(color_ranges):
+    """Ranges agrupados por cor (red2 soma no vermelho): {cor: [(nome, lower, upper)]}"""
+    grouped = {}
+    for name, (lower, upper) in color_ranges.items():
+        color = 'red' if name == 'red2' else name
+        grouped.setdefault(color, []).append((name, list(lower), list(upper)))
+    return grouped
+
+
+def hue_disjoint(boxes):
+    """Caixas da mesma cor não podem se sobrepor em H (a contagem é a soma das caixas)"""
+    spans = sorted((lower[0], upper[0]) for lower, upper in boxes)
+    return all(previous[1] < current[0] for previous, current in zip(spans, spans[1:]))
+
+
+def candidate_boxes(boxes, extra=()):
+    """Variações de uma cor em torno dos limites atuais; a primeira é a configuração atual
+
+    boxes: [(lower, upper)] da cor. H varia limite a limite; S e V variam juntos em todas
+    as caixas da cor. Limites nos extremos (0 e 180/255) ficam fixos.
+    """
+    params = []
+    for index, (lower, upper) in enumerate(boxes):
+        for side, bound in ((0, lower[0]), (1, upper[0])):
+            if 0 < bound < CHANNEL_MAX[0]:
+                params.append((HUE_DELTAS, [(index, side, 0)]))
+    for channel in (1, 2):
+        for side in (0, 1):
+            if any(0 < box[side][channel] < CHANNEL_MAX[channel] for box in boxes):
+                params.append((SV_DELTAS, [(index, side, channel) for index in range(len(boxes))]))
+
+    candidates = [[(list(lower), list(upper)) for lower, upper in boxes]]
+    seen = {repr(candidates[0])}
+    variations = itertools.product(*(deltas for deltas, _ in params))
+    for option in itertools.chain(variations, ([box] for box in extra)):
+        if isinstance(option, list):
+            varied = [(list(lower), list(upper)) for lower, upper in option]
+        else:
+            varied = [(list(lower), list(upper)) for lower, upper in boxes]
+            for delta, (_, targets) in zip(option, params):
+                for index, side, channel in targets:
+                    value = varied[index][side][channel] + delta
+                    varied[index][side][channel] = min(max(value, 0), CHANNEL_MAX[channel])
+
+        key = repr(varied)
+        if key in seen:
+            continue
+        if any(lower[c] > upper[c] for lower, upper in varied for c in range(3)) or not hue_disjoint(varied):
+            continue
+        seen.add(key)
+        candidates.append(varied)
+    return candidates
+
+
+def build_candidates(color_ranges):
+    """Candidatos de todas as cores -> (cores, nomes dos ranges por cor, candidatos, fatias por cor)"""
+    grouped = color_boxes(color_ranges)
+    colors = list(grouped)
+    candidates, slices = [], []
+    for color in colors:
+        boxes = [(lower, upper) for _, lower, upper in grouped[color]]
+        # Ranges alternativos da tecla 't' entram como candidatos de cores com uma única caixa
+        extra = [range_ for name, range_ in ALT_COLOR_RANGES.items()
+                 if name.split('_')[0] == color] if len(boxes) == 1 else []
+        options = candidate_boxes(boxes, extra)
+        slices.append(slice(len(candidates), len(candidates) + len(options)))
+        candidates.extend(options)
+    names = {color: [name for name, _, _ in grouped[color]] for color in colors}
+    return colors, names, candidates, slices
+
+
+def box_edges(candidates):
+    """Bordas por canal onde algum candidato começa ou termina (bins do histograma)"""
+    edges = [{0, 256} for _ in range(3)]
+    for boxes in candidates:
+        for lower, upper in boxes:
+            for channel in range(3):
+                edges[channel].add(lower[channel])
+                edges[channel].add(min(upper[channel] + 1, 256))
+    return [np.array(sorted(channel_edges)) for channel_edges in edges]
+
+
+def box_indices(candidates, edges):
+    """Candidatos -> (K, caixas, 6) índices (h0, h1, s0, s1, v0, v1) na tabela acumulada
+
+    Cores com menos caixas são completadas com caixas vazias (contagem zero).
+    """
+    max_boxes = max(len(boxes) for boxes in candidates)
+    indices = np.zeros((len(candidates), max_boxes, 6), dtype=np.int64)
+    for k, boxes in enumerate(candidates):
+        for b, (lower, upper) in enumerate(boxes):
+            for channel in range(3):
+                indices[k, b, 2 * channel] = np.searchsorted(edges[channel], lower[channel])
+                indices[k, b, 2 * channel + 1] = np.searchsorted(edges[channel], min(upper[channel] + 1, 256))
+    return indices
+
+
+# -------------------------------
+# PONTUAÇÃO DOS RECORTES (PROCESSOS DO POOL)
+# -------------------------------
+_worker = {}
+
+
+def make_detector(color_ranges=None, color_thresholds=None):
+    """Detector sem modelo, só para a classificação de cor (mesmo pré-processamento do tempo real)"""
+    detector = CubeDetector(None, calibration_file=None)
+    if color_ranges is not None:
+        detector.color_ranges = color_ranges
+        detector.color_thresholds = dict(color_thresholds)
+        detector.build_color_lut()
+    return detector
+
+
+def _init_worker(color_ranges, color_thresholds, thumbnails=None, edges=None, indices=None):
+    _worker['detector'] = make_detector(color_ranges, color_thresholds)
+    _worker['thumbnails'] = thumbnails
+    if edges is not None:
+        # valor do canal (0-255) -> bin do histograma
+        _worker['bins'] = [np.searchsorted(channel_edges, np.arange(256), side='right') - 1
+                           for channel_edges in edges]
+        _worker['shape'] = tuple(len(channel_edges) - 1 for channel_edges in edges)
+        _worker['indices'] = indices
+
+
+@functools.lru_cache(maxsize=8)
+def read_image(path):
+    return cv2.imread(path)
+
+
+def summed_area_table(hsv, bins, shape):
+    """Histograma 3D do HSV nos bins dos candidatos, acumulado nos três eixos (com zero à frente)"""
+    pixels = hsv.reshape(-1, 3)
+    flat = np.zeros(len(pixels), dtype=np.int64)
+    for channel in range(3):
+        flat = flat * shape[channel] + bins[channel][pixels[:, channel]]
+    histogram = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    table = np.zeros(tuple(n + 1 for n in shape), dtype=np.int64)
+    table[1:, 1:, 1:] = histogram.cumsum(0).cumsum(1).cumsum(2)
+    return table
+
+
+def box_counts(table, indices):
+    """Pixels dentro de cada candidato: 8 leituras da tabela acumulada por caixa"""
+    h0, h1, s0, s1, v0, v1 = np.moveaxis(indices, -1, 0)
+    counts = (table[h1, s1, v1] - table[h0, s1, v1] - table[h1, s0, v1] - table[h1, s1, v0]
+              + table[h0, s0, v1] + table[h0, s1, v0] + table[h1, s0, v0] - table[h0, s0, v0])
+    return counts.sum(axis=-1)
+
+
+def _score_chunk(samples):
+    """Fração dos pixels centrais de cada recorte dentro de cada candidato -> (recortes, K)
+
+    É a pontuação antes da limpeza morfológica do detector; o resultado final é conferido
+    depois com o classificador real.
+    """
+    detector, indices = _worker['detector'], _worker['indices']
+    scores = np.zeros((len(samples), len(indices)), dtype=np.float32)
+    for row, (image_path, bbox) in enumerate(samples):
+        image = read_image(image_path)
+        roi = detector._center_hsv(image, bbox) if image is not None else None
+        if roi is None or roi.size == 0:
+            continue
+        table = summed_area_table(roi, _worker['bins'], _worker['shape'])
+        scores[row] = box_counts(table, indices) / (roi.shape[0] * roi.shape[1])
+    return scores
+
+
+def _classify_chunk(samples):
+    """Cor dada pelo classificador real (detect_cube_color) para cada recorte"""
+    detector = _worker['detector']
+    colors = []
+    for image_path, bbox in samples:
+        image = read_image(image_path)
+        colors.append(detector.detect_cube_color(image, bbox)[0] if image is not None else UNKNOWN)
+    return colors
+
+
+def _label_image(task):
+    """Classifica as bboxes de uma imagem com a configuração atual e salva as miniaturas"""
+    image_path, boxes, normalized = task
+    image = read_image(image_path)
+    if image is None:
+        return []
+    detector = _worker['detector']
+    height, width = image.shape[:2]
+    stem = os.path.splitext(os.path.normpath(image_path))[0].lstrip(os.sep).replace(os.sep, '_')
+
+    rows = []
+    for index, box in enumerate(boxes):
+        if normalized:
+            cx, cy, w, h = box
+            bbox = (int((cx - w / 2) * width), int((cy - h / 2) * height),
+                    int((cx + w / 2) * width), int((cy + h / 2) * height))
+        else:
+            bbox = tuple(int(v) for v in box)
+        color, confidence = detector.detect_cube_color(image, bbox)
+
+        # Miniatura da bbox com a região central (a que é classificada) marcada
+        thumbnail = os.path.join(_worker['thumbnails'], f"{stem}_{index}.jpg")
+        x1, y1, x2, y2 = max(bbox[0], 0), max(bbox[1], 0), min(bbox[2], width), min(bbox[3], height)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        crop = image[y1:y2, x1:x2].copy()
+        rect = detector._center_rect(image, bbox)
+        if rect:
+            cv2.rectangle(crop, (rect[0] - x1, rect[1] - y1), (rect[2] - x1, rect[3] - y1), (255, 0, 255), 1)
+        cv2.imwrite(thumbnail, crop)
+
+        rows.append({'image': image_path, 'box': ' '.join(str(v) for v in bbox), 'color': color,
+                     'confidence': f"{confidence:.3f}", 'thumbnail': thumbnail})
+    return rows
+
+
+def run_pool(function, tasks, workers, initargs):
+    """Executa function em cada tarefa num pool de processos, na ordem das tarefas"""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        return list(pool.map(function, tasks))
+
+
+def chunks(items, size=CHUNK_SIZE):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# -------------------------------
+# BUSCA DA MELHOR CONFIGURAÇÃO
+# -------------------------------
+def predict(scores, thresholds):
+    """Pontuações (n, cores) -> índice da cor prevista, -1 = desconhecida (como detect_cube_color)"""
+    best = scores.argmax(axis=1)
+    confident = scores[np.arange(len(scores)), best] >= thresholds[best]
+    return np.where(confident, best, -1)
+
+
+def sweep_color(current, color, options, thresholds, labels):
+    """Precisão com cada candidato de uma cor (as outras fixas) -> (K,)
+
+    O empate segue o argmax do detector: vence a cor que vem primeiro.
+    """
+    others = current.copy()
+    others[:, color] = -1
+    other_best = others.argmax(axis=1)
+    other_score = others.max(axis=1)
+
+    before = current[:, :color].max(axis=1) if color else np.full(len(current), -np.inf)
+    after = (current[:, color + 1:].max(axis=1) if color + 1 < current.shape[1]
+             else np.full(len(current), -np.inf))
+    wins = (options > before[:, None]) & (options >= after[:, None])
+
+    predicted = np.where(wins, color, other_best[:, None])
+    score = np.where(wins, options, other_score[:, None])
+    predicted = np.where(score >= thresholds[predicted], predicted, -1)
+    return (predicted == labels[:, None]).mean(axis=0)
+
+
+def optimize(scores, slices, labels, thresholds, rounds=3):
+    """Busca coordenada: troca o range ou o threshold de uma cor por vez, com as outras fixas
+
+    Começa da configuração atual (candidato 0 de cada cor) e só aceita melhoras estritas.
+    Retorna (candidato escolhido por cor, thresholds, precisão).
+    """
+    choice = [0] * len(slices)
+    thresholds = thresholds.copy()
+    current = np.stack([scores[:, color_slice.start] for color_slice in slices], axis=1)
+    best = (predict(current, thresholds) == labels).mean()
+
+    for _ in range(rounds):
+        improved = False
+        for color, color_slice in enumerate(slices):
+            accuracy = sweep_color(current, color, scores[:, color_slice], thresholds, labels)
+            k = int(accuracy.argmax())
+            if accuracy[k] > best:
+                choice[color], best, improved = k, accuracy[k], True
+                current[:, color] = scores[:, color_slice.start + k]
+
+            for threshold in THRESHOLDS:
+                trial = thresholds.copy()
+                trial[color] = threshold
+                accuracy = (predict(current, trial) == labels).mean()
+                if accuracy > best:
+                    thresholds, best, improved = trial, accuracy, True
+        if not improved:
+            break
+    return choice, thresholds, best
+
+
+# -------------------------------
+# RÓTULOS
+# -------------------------------
+def dataset_tasks(dataset_dirs):
+    """Imagens com bboxes anotadas (formato YOLO) -> [(imagem, bboxes normalizadas, True)]"""
+    tasks = []
+    for dataset_dir in dataset_dirs:
+        for image_path in sorted(glob.glob(os.path.join(dataset_dir, '*', 'images', '*'))):
+            stem = os.path.splitext(os.path.basename(image_path))[0]
+            label_path = os.path.join(os.path.dirname(os.path.dirname(image_path)), 'labels', stem + '.txt')
+            if not os.path.exists(label_path):
+                continue
+            with open(label_path, 'r', encoding='utf-8') as f:
+                boxes = [tuple(float(v) for v in line.split()[1:5]) for line in f if line.strip()]
+            if boxes:
+                tasks.append((image_path, boxes, True))
+    return tasks
+
+
+def footage_tasks(videos, every, model_paths, frames_dir):
+    """Salva um frame a cada `every` dos vídeos e detecta os cubos neles -> [(frame, bboxes, False)]"""
+    backend = load_first_backend(model_paths)
+    if backend is None:
+        print("Nenhum modelo encontrado para detectar os cubos nos vídeos")
+        return []
+
+    os.makedirs(frames_dir, exist_ok=True)
+    tasks = []
+    for video in videos:
+        cap = cv2.VideoCapture(video)
+        stem = os.path.splitext(os.path.basename(video))[0]
+        index = -1
+        while cap.grab():
+            index += 1
+            if index % every:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            boxes = [bbox for bbox, _ in backend.predict(frame, DETECTION_CONFIDENCE)]
+            if boxes:
+                # PNG: o recorte guarda exatamente as cores do vídeo
+                path = os.path.join(frames_dir, f"{stem}_{index:06d}.png")
+                cv2.imwrite(path, frame)
+                tasks.append((path, boxes, False))
+        cap.release()
+    return tasks
+
+
+def init_labels(args, detector):
+    """Gera o CSV de rótulos pré-preenchido e as miniaturas para revisão"""
+    base_dir = os.path.dirname(os.path.abspath(args.init_labels))
+    thumbnails = os.path.join(base_dir, 'recortes')
+    os.makedirs(thumbnails, exist_ok=True)
+
+    tasks = dataset_tasks(args.datasets)
+    if args.video:
+        tasks += footage_tasks(args.video, args.every, [args.model] if args.model else MODEL_PATHS,
+                               os.path.join(base_dir, 'frames'))
+
+    start = time.perf_counter()
+    results = run_pool(_label_image, tasks, args.workers,
+                       (detector.color_ranges, detector.color_thresholds, thumbnails))
+    rows = [row for image_rows in results for row in image_rows]
+
+    with open(args.init_labels, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{len(rows)} recortes de {len(tasks)} imagens em {time.perf_counter() - start:.1f}s -> {args.init_labels}")
+    print(f"Revise a coluna 'color' olhando as miniaturas em {thumbnails} "
+          f"(cores: {', '.join(detector.lut_colors)}, {UNKNOWN}; vazio ou 'skip' ignora a linha)")
+
+
+def read_labels(path, colors):
+    """CSV revisado -> (amostras [(imagem, bbox)], cores rotuladas)"""
+    samples, labels = [], []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            color = row['color'].strip().lower()
+            if color in SKIP_LABELS:
+                continue
+            if color != UNKNOWN and color not in colors:
+                raise ValueError(f"{path}:{line}: cor desconhecida '{row['color']}'")
+            samples.append((row['image'], tuple(int(v) for v in row['box'].split())))
+            labels.append(color)
+
+    # Recortes da mesma imagem juntos: cada processo lê cada imagem uma vez
+    order = sorted(range(len(samples)), key=lambda i: samples[i][0])
+    return [samples[i] for i in order], [labels[i] for i in order]
+
+
+# -------------------------------
+# CALIBRAÇÃO
+# -------------------------------
+def print_accuracy(title, predicted, labels, colors):
+    predicted, labels = np.asarray(predicted), np.asarray(labels)
+    print(f"{title}: {(predicted == labels).mean():.1%} de {len(labels)} recortes")
+    for color in list(colors) + [UNKNOWN]:
+        selected = labels == color
+        if selected.any():
+            print(f"  {color:<8} {(predicted[selected] == color).mean():6.1%} ({selected.sum()})")
+
+
+def save_calibration(path, calibration):
+    """Grava a calibração de forma atômica (arquivo temporário + rename)"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def calibrate(args, detector):
+    """Varre os ranges candidatos nos recortes rotulados e grava a melhor configuração"""
+    colors, names, candidates, slices = build_candidates(detector.color_ranges)
+    samples, labels = read_labels(args.labels, colors)
+    if not samples:
+        print(f"Nenhum recorte rotulado em {args.labels}")
+        return
+    label_codes = np.array([colors.index(label) if label != UNKNOWN else -1 for label in labels])
+    thresholds = np.array([detector.color_thresholds.get(color, 0.05) for color in colors])
+
+    # 1) Pontua todos os candidatos em todos os recortes (uma passada por recorte)
+    start = time.perf_counter()
+    edges = box_edges(candidates)
+    indices = box_indices(candidates, edges)
+    scores = np.concatenate(run_pool(_score_chunk, chunks(samples), args.workers,
+                                     (detector.color_ranges, detector.color_thresholds,
+                                      None, edges, indices)))
+    print(f"{len(candidates)} ranges candidatos x {len(samples)} recortes pontuados em "
+          f"{time.perf_counter() - start:.1f}s ({args.workers} processos)")
+
+    # 2) Escolhe os ranges e thresholds (só operações em matriz)
+    start = time.perf_counter()
+    choice, best_thresholds, accuracy = optimize(scores, slices, label_codes, thresholds, args.rounds)
+    print(f"Busca concluída em {time.perf_counter() - start:.1f}s (precisão estimada {accuracy:.1%})")
+
+    color_ranges = {}
+    for color, color_slice, k in zip(colors, slices, choice):
+        for name, (lower, upper) in zip(names[color], candidates[color_slice.start + k]):
+            color_ranges[name] = (lower, upper)
+    color_thresholds = dict(detector.color_thresholds)
+    color_thresholds.update({color: float(t) for color, t in zip(colors, best_thresholds)})
+
+    # 3) Confere com o classificador real (com a limpeza morfológica)
+    before = sum(run_pool(_classify_chunk, chunks(samples), args.workers,
+                          (detector.color_ranges, detector.color_thresholds)), [])
+    after = sum(run_pool(_classify_chunk, chunks(samples), args.workers,
+                         (color_ranges, color_thresholds)), [])
+    print_accuracy("Configuração atual", before, labels, colors)
+    print_accuracy("Configuração calibrada", after, labels, colors)
+
+    accuracy_before = float(np.mean(np.array(before) == np.array(labels)))
+    accuracy_after = float(np.mean(np.array(after) == np.array(labels)))
+    if accuracy_after < accuracy_before:
+        print(f"A calibração não melhorou o classificador real; {args.output} não foi alterado")
+        return
+
+    save_calibration(args.output, {
+        'color_ranges': color_ranges,
+        'color_thresholds': color_thresholds,
+        'accuracy': accuracy_after,
+        'baseline_accuracy': accuracy_before,
+        'samples': len(samples),
+        'labels': args.labels,
+        'created': datetime.now().isoformat()
+    })
+    for name, (lower, upper) in color_ranges.items():
+        print(f"  {name:<7} {lower} - {upper} (threshold {color_thresholds.get(name, '-')})")
+    print(f"Calibração salva em {args.output}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibração offline dos ranges HSV de cor dos cubos")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--init-labels', metavar='CSV',
+                      help="gera o CSV de rótulos (pré-preenchido com a classificação atual) e as miniaturas")
+    mode.add_argument('--labels', metavar='CSV', help="CSV revisado: varre os ranges e grava a calibração")
+    parser.add_argument('--datasets', nargs='*', default=list(DEFAULT_DATASETS),
+                        help="datasets YOLO com as bboxes dos cubos (padrão: dataset dataset2)")
+    parser.add_argument('--video', nargs='*', default=[],
+                        help="vídeos gravados (ex.: clips/*.mp4); um frame a cada --every vira recorte")
+    parser.add_argument('--every', type=int, default=15, help="com --video, usa um frame a cada N (padrão 15)")
+    parser.add_argument('--model', help="modelo que encontra os cubos nos vídeos (padrão: o do detector)")
+    parser.add_argument('--output', default=CALIBRATION_FILE,
+                        help=f"arquivo de calibração lido pelo detector (padrão {CALIBRATION_FILE})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processos do pool (padrão: todos os núcleos)")
+    parser.add_argument('--rounds', type=int, default=3, help="rodadas da busca coordenada (padrão 3)")
+    args = parser.parse_args(argv)
+
+    # Parte da calibração existente (se houver), senão dos ranges padrão do detector
+    detector = CubeDetector(None, calibration_file=args.output)
+    if args.init_labels:
+        init_labels(args, detector)
+    else:
+        calibrate(args, detector)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,51 @@
 import json
 import os
+import queue
+import threading
 from datetime import datetime
 from collections import defaultdict
 
+from online_stats import DelayBaselines
+
+PERSISTENCE_MODES = ('rewrite', 'append')
+FLUSH_POLICIES = ('group', 'none')
+BASELINES_FILE = "delay_baselines.json"
+BASELINE_SAVE_EVERY = 20  # grupos entre gravações das estatísticas aprendidas
+
+def load_jsonl_groups(path):
+    """Lê os grupos de um .jsonl, ignorando uma última linha truncada por queda"""
+    groups = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                groups.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return groups
+
 class CubeTimeLogger:
-    def __init__(self):
-        """Inicializa o logger de tempos dos cubos"""
+    def __init__(self, persistence='rewrite', flush_policy='group', fsync_every=0, async_io=False,
+                 baselines_file=BASELINES_FILE, station=None):
+        """Inicializa o logger de tempos dos cubos
+        
+        persistence: 'rewrite' reescreve .txt/.json a cada grupo; 'append' grava uma linha
+        JSON por grupo no .jsonl e só reconstrói .txt/.json na compactação.
+        flush_policy: 'group' faz flush a cada grupo; 'none' deixa o buffer do SO decidir.
+        fsync_every: com 'append', faz fsync a cada N grupos (0 = nunca).
+        async_io: grava arquivos e imprime a análise de atrasos numa thread separada,
+        para o loop de frames nunca esperar disco ou terminal.
+        baselines_file: onde ficam os tempos esperados aprendidos entre sessões.
+        station: nome da estação (ex.: 'cam0') incluído nos nomes dos arquivos, para
+        várias câmeras gravarem em paralelo sem misturar os relatórios.
+        """
+        if persistence not in PERSISTENCE_MODES:
+            raise ValueError(f"Modo de persistência desconhecido: {persistence}")
+        if flush_policy not in FLUSH_POLICIES:
+            raise ValueError(f"Política de flush desconhecida: {flush_policy}")
+        
         # Mapeamento de cores para faces do cubo mágico
         self.color_mapping = {
             'white': 'Frente',
@@ -22,8 +62,40 @@ class CubeTimeLogger:
         self.all_groups = []  # Todos os grupos finalizados
         
         # Arquivo de log
-        self.log_file = f"cube_times_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        self.json_file = f"cube_times_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.station = station
+        file_id = f"{station}_{self.session_id}" if station else self.session_id
+        self.log_file = f"cube_times_{file_id}.txt"
+        self.json_file = f"cube_times_{file_id}.json"
+        self.perf_file = f"perf_{file_id}.json"
+        self.jsonl_file = f"cube_times_{file_id}.jsonl"
+        
+        # Persistência incremental (append-only)
+        self.persistence = persistence
+        self.flush_policy = flush_policy
+        self.fsync_every = fsync_every
+        self._jsonl_handle = None
+        self._groups_since_fsync = 0
+        
+        # Tempos esperados por cor/grupo, aprendidos ao longo das sessões
+        self.baselines_file = baselines_file
+        self.baselines = DelayBaselines()
+        self.baselines.load(baselines_file)
+        self._groups_since_baseline_save = 0
+        
+        # Chamado com o grupo quando a análise acusa atraso (ex.: exportar o trecho gravado)
+        self.on_late_group = None
+        
+        # Publica cada grupo completo como evento binário (EventPublisher); None = desligado
+        self.events = None
+        
+        # Escrita em segundo plano (grupos finalizados vão por uma fila)
+        self._write_queue = None
+        self._writer = None
+        if async_io:
+            self._write_queue = queue.Queue()
+            self._writer = threading.Thread(target=self._writer_loop, name='logger-writer', daemon=True)
+            self._writer.start()
         
         # Logger de tempos iniciado silenciosamente
     
@@ -71,25 +143,104 @@ class CubeTimeLogger:
         
         # Adiciona aos grupos
         self.all_groups.append(group_data)
+        if self.events is not None:
+            self.events.group_completed(self.group_number, group_total_time, len(group_data['cubes']))
         
-        # Salva no arquivo
-        self.save_to_files()
-
-        # Executa análise de atrasos (única saída no terminal)
-        self.analyze_delays()
+        # Salva e analisa aqui ou na thread de escrita
+        if self._write_queue is not None:
+            self._write_queue.put((group_data, len(self.all_groups)))
+        else:
+            self._persist_group(group_data, len(self.all_groups))
 
         # Limpa grupo atual e incrementa número
         self.current_group = []
         self.group_number += 1
     
-    def save_to_files(self):
+    def _persist_group(self, group_data, group_count):
+        """Grava um grupo finalizado e executa a análise de atrasos"""
+        # Salva no arquivo (custo constante no modo append)
+        if self.persistence == 'append':
+            self.append_group(group_data)
+        elif group_count == len(self.all_groups):
+            # Se já existe grupo mais novo, a reescrita dele inclui este
+            self.save_to_files(self.all_groups[:group_count])
+
+        # Executa análise de atrasos (única saída no terminal)
+        self.analyze_delays(group_data)
+    
+    def _writer_loop(self):
+        """Thread de escrita: consome os grupos finalizados da fila"""
+        while True:
+            item = self._write_queue.get()
+            try:
+                if item is None:
+                    return
+                self._persist_group(*item)
+            except Exception as e:
+                print(f"Erro ao gravar grupo: {e}")
+            finally:
+                self._write_queue.task_done()
+    
+    def flush(self):
+        """Espera a thread de escrita terminar tudo que está na fila"""
+        if self._write_queue is not None:
+            self._write_queue.join()
+    
+    def append_group(self, group_data):
+        """Acrescenta um grupo como uma linha JSON no .jsonl da sessão"""
+        if self._jsonl_handle is None:
+            self._jsonl_handle = open(self.jsonl_file, 'a', encoding='utf-8')
+        
+        self._jsonl_handle.write(json.dumps(group_data, ensure_ascii=False) + "\n")
+        if self.flush_policy == 'group':
+            self._jsonl_handle.flush()
+        
+        if self.fsync_every:
+            self._groups_since_fsync += 1
+            if self._groups_since_fsync >= self.fsync_every:
+                self._jsonl_handle.flush()
+                os.fsync(self._jsonl_handle.fileno())
+                self._groups_since_fsync = 0
+    
+    def compact(self):
+        """Reconstrói o relatório .txt e o .json a partir do .jsonl da sessão"""
+        if self._jsonl_handle is not None:
+            self._jsonl_handle.flush()
+        if not os.path.exists(self.jsonl_file):
+            return
+        self.save_to_files(load_jsonl_groups(self.jsonl_file))
+    
+    def close(self):
+        """Fecha o .jsonl (modo append) e gera os relatórios finais"""
+        # Esvazia a fila e encerra a thread de escrita
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._write_queue = None
+        
+        if self._jsonl_handle is not None:
+            self._jsonl_handle.flush()
+            os.fsync(self._jsonl_handle.fileno())
+            self._jsonl_handle.close()
+            self._jsonl_handle = None
+            self.compact()
+        
+        if self._groups_since_baseline_save:
+            self.baselines.save(self.baselines_file)
+            self._groups_since_baseline_save = 0
+    
+    def save_to_files(self, groups=None):
         """Salva os dados nos arquivos de texto e JSON"""
-        # Salva em arquivo de texto simples
-        with open(self.log_file, 'w', encoding='utf-8') as f:
+        if groups is None:
+            groups = self.all_groups
+        
+        # Salva em arquivo de texto simples (arquivo temporário + rename: nunca fica pela metade)
+        with open(self.log_file + '.tmp', 'w', encoding='utf-8') as f:
             f.write("=== RELATÓRIO DE TEMPOS DOS CUBOS ===\n")
             f.write(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n\n")
             
-            for group in self.all_groups:
+            for group in groups:
                 f.write(f"GRUPO {group['group_number']}:\n")
                 f.write(f"Data/Hora: {group['timestamp']}\n")
                 f.write("-" * 40 + "\n")
@@ -101,16 +252,18 @@ class CubeTimeLogger:
                 
                 f.write(f"TEMPO TOTAL DO GRUPO: {group['total_group_time']:.1f}s\n")
                 f.write("=" * 50 + "\n\n")
+        os.replace(self.log_file + '.tmp', self.log_file)
         
         # Salva em arquivo JSON para dados estruturados
         json_data = {
             'session_start': datetime.now().isoformat(),
-            'groups_of_three': self.all_groups,
-            'total_groups': len(self.all_groups)
+            'groups_of_three': groups,
+            'total_groups': len(groups)
         }
         
-        with open(self.json_file, 'w', encoding='utf-8') as f:
+        with open(self.json_file + '.tmp', 'w', encoding='utf-8') as f:
             json.dump(json_data, f, indent=2, ensure_ascii=False)
+        os.replace(self.json_file + '.tmp', self.json_file)
     
     def get_current_group_info(self):
         """Retorna informações do grupo atual"""
@@ -126,6 +279,7 @@ class CubeTimeLogger:
         """Força a finalização do grupo atual (mesmo que não tenha 3 cubos)"""
         if self.current_group:
             self.finalize_group()
+        self.flush()
     
     def get_summary(self):
         """Retorna um resumo dos dados"""
@@ -144,21 +298,17 @@ class CubeTimeLogger:
   # -------------------------------
     # ANÁLISE DE DESEMPENHO E ATRASOS
     # -------------------------------
-    def analyze_delays(self):
+    def analyze_delays(self, group=None):
         """
-        Analisa o último grupo comparando com a média esperada:
-        - Tempo médio por cubo: 5s
-        - Tempo médio total: 15s
-        Detecta cubos ou grupos adiantados/atrasados em ±5s
+        Analisa o grupo informado (ou o último) comparando com os tempos esperados
+        aprendidos por cor e por grupo (começam em 5s por cubo e 15s por grupo, ±5s).
+        Depois da análise o grupo entra nas estatísticas, em tempo constante.
         """
         if not self.all_groups:
             return
 
-        expected_cube_time = 5.0       # tempo esperado por cubo (s)
-        expected_group_time = 15.0     # tempo esperado por grupo (s)
-        tolerance = 5.0                # margem de tolerância (s)
-
-        last_group = self.all_groups[-1]
+        baselines = self.baselines
+        last_group = group if group is not None else self.all_groups[-1]
         total_time = last_group["total_group_time"]
 
         print("\n=== ANÁLISE DE DESEMPENHO ===")
@@ -171,19 +321,21 @@ class CubeTimeLogger:
         for cube in last_group["cubes"]:
             tempo = cube["individual_time"]
             cor = cube["color"]
-            diferenca = tempo - expected_cube_time
-            
+            diferenca = tempo - baselines.expected(cor)
+            tolerance = baselines.tolerance(cor)
 
             if diferenca > tolerance:
                 atraso_cubos.append((cor, tempo, diferenca))
             elif diferenca < -tolerance:
                 adiantados_cubos.append((cor, tempo, diferenca))
 
-            print(f"- {cor.upper()}: {tempo:.2f}s (diferença: {diferenca:+.2f}s)")
+            print(f"- {cor.upper()}: {tempo:.2f}s (esperado {baselines.expected(cor):.2f}s, diferença: {diferenca:+.2f}s)")
 
         # Análise do grupo total
+        expected_group_time = baselines.expected('group')
+        tolerance = baselines.tolerance('group')
         total_diff = total_time - expected_group_time
-        print("\nTempo total esperado: 15.00s")
+        print(f"\nTempo total esperado: {expected_group_time:.2f}s (±{tolerance:.2f}s)")
         print(f"Desvio total do grupo: {total_diff:+.2f}s")
 
         # Diagnóstico geral
@@ -193,6 +345,8 @@ class CubeTimeLogger:
                 print("Causado por:")
                 for cor, tempo, dif in atraso_cubos:
                     print(f"  -> {cor.upper()} demorou {dif:+.2f}s a mais ({tempo:.2f}s)")
+            if self.on_late_group is not None:
+                self.on_late_group(last_group)
         elif total_diff < -tolerance:
             print("⚡ O grupo foi mais rápido que o esperado!")
             if adiantados_cubos:
@@ -204,9 +358,29 @@ class CubeTimeLogger:
 
         print("=" * 50)
 
-def create_logger():
+        # Atualiza as estatísticas com o grupo recém-analisado
+        for cube in last_group["cubes"]:
+            baselines.update(cube["color"], cube["individual_time"])
+        baselines.update('group', total_time)
+
+        self._groups_since_baseline_save += 1
+        if self._groups_since_baseline_save >= BASELINE_SAVE_EVERY:
+            baselines.save(self.baselines_file)
+            self._groups_since_baseline_save = 0
+
+def create_logger(**kwargs):
     """Cria uma instância do logger para usar no detector principal"""
-    return CubeTimeLogger()
+    return CubeTimeLogger(**kwargs)
+
+def compact_file(jsonl_path):
+    """Compacta um .jsonl de sessão nos relatórios .txt/.json equivalentes"""
+    logger = CubeTimeLogger()
+    base, _ = os.path.splitext(jsonl_path)
+    logger.jsonl_file = jsonl_path
+    logger.log_file = base + '.txt'
+    logger.json_file = base + '.json'
+    logger.compact()
+    return logger.log_file, logger.json_file
 
 # Exemplo de uso no webcam_detect_adaptive.py:
 """
@@ -223,3 +397,14 @@ logger.add_cube(color, total_time)
 elif key == ord('f'):  # Tecla 'f' para finalizar grupo
     logger.force_finalize_group()
 """
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Compacta sessões gravadas no modo append")
+    parser.add_argument('jsonl', nargs='+', help="arquivos cube_times_*.jsonl")
+    args = parser.parse_args()
+    
+    for path in args.jsonl:
+        log_file, json_file = compact_file(path)
+        print(f"{path} -> {log_file}, {json_file}")
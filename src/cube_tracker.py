@@ -0,0 +1,123 @@
+import numpy as np
+
+# Custo de um par proibido (longe demais e sem sobreposição)
+INFEASIBLE = 1e6
+
+
+def as_boxes(boxes):
+    """Lista de (x1, y1, x2, y2) -> array (N, 4) float"""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU entre todas as bboxes de boxes_a (N, 4) e boxes_b (M, 4) -> (N, M)"""
+    a, b = as_boxes(boxes_a), as_boxes(boxes_b)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def centroid_distances(boxes_a, boxes_b):
+    """Distância entre os centroides de todas as bboxes -> (N, M)"""
+    a, b = as_boxes(boxes_a), as_boxes(boxes_b)
+    centers_a = (a[:, :2] + a[:, 2:]) / 2
+    centers_b = (b[:, :2] + b[:, 2:]) / 2
+    return np.linalg.norm(centers_a[:, None, :] - centers_b[None, :, :], axis=2)
+
+
+def linear_assignment(cost):
+    """Atribuição ótima (algoritmo húngaro) para uma matriz de custos (N, M)
+
+    Retorna (linhas, colunas) dos pares escolhidos, com min(N, M) pares.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty
+
+    # Potenciais de linha/coluna e caminho aumentante (indexação a partir de 1)
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_column = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+
+    for row in range(1, n + 1):
+        row_of_column[0] = row
+        column = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = row_of_column[column]
+            free = ~used[1:]
+
+            # Atualiza as folgas de todas as colunas livres de uma vez
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = column
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            used_columns = np.flatnonzero(used)
+            u[row_of_column[used_columns]] += delta
+            v[used_columns] -= delta
+            min_slack[1:][free] -= delta
+
+            column = next_column
+            if row_of_column[column] == 0:
+                break
+
+        # Inverte o caminho aumentante
+        while column:
+            previous = way[column]
+            row_of_column[column] = row_of_column[previous]
+            column = previous
+
+    assigned = np.flatnonzero(row_of_column[1:])
+    rows = row_of_column[1:][assigned] - 1
+    columns = assigned
+    if transposed:
+        rows, columns = columns, rows
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+
+def match_boxes(track_boxes, detection_boxes, max_distance=120.0, min_iou=0.1):
+    """Associa bboxes de tracks às detecções do frame
+
+    Custo = (1 - IoU) + distância dos centroides / max_distance. Pares com centroides
+    a mais de max_distance e IoU abaixo de min_iou não podem ser associados.
+    Retorna (pares [(track, detecção)], tracks sem detecção, detecções sem track).
+    """
+    n_tracks, n_detections = len(track_boxes), len(detection_boxes)
+    if not n_tracks or not n_detections:
+        return [], list(range(n_tracks)), list(range(n_detections))
+
+    iou = iou_matrix(track_boxes, detection_boxes)
+    distance = centroid_distances(track_boxes, detection_boxes)
+    feasible = (distance <= max_distance) | (iou >= min_iou)
+    cost = np.where(feasible, (1.0 - iou) + distance / max_distance, INFEASIBLE)
+
+    rows, columns = linear_assignment(cost)
+    valid = feasible[rows, columns]
+    pairs = list(zip(rows[valid].tolist(), columns[valid].tolist()))
+
+    matched_tracks = set(rows[valid].tolist())
+    matched_detections = set(columns[valid].tolist())
+    unmatched_tracks = [i for i in range(n_tracks) if i not in matched_tracks]
+    unmatched_detections = [j for j in range(n_detections) if j not in matched_detections]
+    return pairs, unmatched_tracks, unmatched_detections
@@ -0,0 +1,288 @@
+"""Cache pré-decodificado dos datasets de treino (dataset/, dataset2/ e footage anotado).
+
+Cada imagem é decodificada e redimensionada uma única vez (lado maior = imgsz, como o
+ultralytics faz a cada época) e guardada num slot fixo imgsz x imgsz de shards uint8
+mapeados em memória. O índice (index.json) guarda split, rótulos e duplicatas.
+
+Uso:
+    python src/dataset_cache.py build                          # dataset/ e dataset2/
+    python src/dataset_cache.py build dataset dataset2 estacao  # + footage no formato YOLO
+    python src/dataset_cache.py train --model runs-cube/yolov8n-cube5/weights/best.pt
+    python src/dataset_cache.py val --model runs-cube/yolov8n-cube6/weights/best.pt
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+DEFAULT_DATASETS = ('dataset', 'dataset2')
+DEFAULT_CACHE = '.dataset_cache'
+CACHE_VERSION = 1
+INDEX_FILE = 'index.json'
+DATA_FILE = 'data.yaml'
+
+SHARD_SIZE = 256  # imagens por shard (~315 MB a 640x640)
+SPLITS = ('train', 'valid', 'test')
+# Com uma imagem repetida em splits diferentes, fica a cópia de validação/teste (evita vazamento)
+SPLIT_PRIORITY = {'valid': 0, 'test': 1, 'train': 2}
+DUPLICATE_DISTANCE = 4.0  # diferença média máxima (0-255) entre miniaturas 32x32 de duplicatas
+
+# Os datasets são de classe única ('cubos', 'Cube-3x3'): todos viram a classe 0
+CLASS_NAMES = ['cube']
+
+
+def resize_long_side(image, imgsz):
+    """Redimensiona como o ultralytics: lado maior = imgsz, mantendo a proporção"""
+    h0, w0 = image.shape[:2]
+    ratio = imgsz / max(h0, w0)
+    if ratio != 1:
+        size = (min(math.ceil(w0 * ratio), imgsz), min(math.ceil(h0 * ratio), imgsz))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+    return image
+
+
+def dhash(image):
+    """Hash de diferença de 64 bits (igual para a mesma foto em resoluções diferentes)"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes().hex()
+
+
+def read_labels(label_path):
+    """Linhas 'classe cx cy w h' (normalizadas); sem arquivo = imagem de fundo"""
+    if not os.path.exists(label_path):
+        return []
+    labels = []
+    with open(label_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            values = line.split()
+            if len(values) >= 5:
+                labels.append([0.0] + [float(v) for v in values[1:5]])
+    return labels
+
+
+def find_sources(dataset_dirs):
+    """Imagens dos datasets no formato YOLO (<dataset>/<split>/images + labels)"""
+    sources = []
+    for dataset_dir in dataset_dirs:
+        for split in SPLITS:
+            for image_path in sorted(glob.glob(os.path.join(dataset_dir, split, 'images', '*'))):
+                stem = os.path.splitext(os.path.basename(image_path))[0]
+                label_path = os.path.join(dataset_dir, split, 'labels', stem + '.txt')
+                stat = os.stat(image_path)
+                sources.append({'source': image_path, 'dataset': dataset_dir, 'split': split,
+                                'label_file': label_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return sources
+
+
+class DatasetCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE):
+        """Shards e índice do cache; as imagens são lidas sob demanda (sem copiar o shard)"""
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        self.imgsz = None
+        self.all_entries = []
+        self._shards = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == CACHE_VERSION:
+                self.imgsz = index['imgsz']
+                self.all_entries = index['entries']
+
+    def __getstate__(self):
+        # Workers do DataLoader reabrem os shards (mapear de novo é barato; copiar não)
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def shard_path(self, shard):
+        return os.path.join(self.cache_dir, f"shard_{shard:03d}.npy")
+
+    def shard(self, shard):
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self.shard_path(shard), mmap_mode='r')
+        return self._shards[shard]
+
+    def entries(self, split):
+        """Entradas de um split, sem as duplicatas"""
+        return [entry for entry in self.all_entries if entry['split'] == split and not entry['duplicate_of']]
+
+    def image(self, entry):
+        """View (somente leitura) da imagem redimensionada dentro do shard"""
+        h, w = entry['resized']
+        return self.shard(entry['shard'])[entry['slot'], :h, :w]
+
+    def build(self, dataset_dirs=DEFAULT_DATASETS, imgsz=640, workers=8, rebuild=False):
+        """Decodifica só as imagens novas ou alteradas; retorna (decodificadas, reaproveitadas)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if rebuild or self.imgsz != imgsz:
+            previous = {}
+            for path in glob.glob(os.path.join(self.cache_dir, 'shard_*.npy')):
+                os.remove(path)
+        else:
+            previous = {entry['source']: entry for entry in self.all_entries}
+        self._shards = {}
+
+        # Reaproveita os slots de arquivos sem mudança (mesmo tamanho e data de modificação)
+        entries, pending, used = [], [], set()
+        for source in find_sources(dataset_dirs):
+            old = previous.get(source['source'])
+            if old and old['size'] == source['size'] and old['mtime_ns'] == source['mtime_ns']:
+                entry = dict(old, split=source['split'], dataset=source['dataset'])
+                used.add((entry['shard'], entry['slot']))
+            else:
+                entry = dict(source)
+                pending.append(entry)
+            # Rótulos são relidos sempre (baratos); só a decodificação fica em cache
+            entry['labels'] = read_labels(source['label_file'])
+            entries.append(entry)
+
+        # Novas imagens ocupam os slots livres (de arquivos removidos) e depois novos shards
+        free_slots = self._free_slots(used)
+        for entry in pending:
+            entry['shard'], entry['slot'] = next(free_slots)
+
+        writers = {}
+        for shard in sorted({entry['shard'] for entry in pending}):
+            path = self.shard_path(shard)
+            if os.path.exists(path):
+                writers[shard] = np.load(path, mmap_mode='r+')
+            else:
+                writers[shard] = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                                           shape=(SHARD_SIZE, imgsz, imgsz, 3))
+
+        def decode(entry):
+            image = cv2.imread(entry['source'], cv2.IMREAD_COLOR)
+            if image is None:
+                return entry, False
+            resized = resize_long_side(image, imgsz)
+            h, w = resized.shape[:2]
+            writers[entry['shard']][entry['slot'], :h, :w] = resized
+            entry['shape'] = list(image.shape[:2])
+            entry['resized'] = [h, w]
+            entry['hash'] = dhash(resized)
+            return entry, True
+
+        # cv2 libera o GIL na decodificação e no resize: threads bastam
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            failed = {id(entry) for entry, ok in pool.map(decode, pending) if not ok}
+        for writer in writers.values():
+            writer.flush()
+        del writers
+        entries = [entry for entry in entries if id(entry) not in failed]
+
+        self.imgsz = imgsz
+        self.all_entries = entries
+        self.mark_duplicates()
+        self.save()
+        return len(pending) - len(failed), len(entries) - len(pending) + len(failed)
+
+    def _free_slots(self, used):
+        """Gera (shard, slot) livres em ordem"""
+        shard = 0
+        while True:
+            for slot in range(SHARD_SIZE):
+                if (shard, slot) not in used:
+                    yield shard, slot
+            shard += 1
+
+    def mark_duplicates(self):
+        """Mesma foto em mais de um lugar (mesmo dhash e miniaturas quase iguais): fica uma cópia"""
+        buckets = {}
+        for entry in self.all_entries:
+            entry['duplicate_of'] = None
+            buckets.setdefault(entry['hash'], []).append(entry)
+
+        for bucket in buckets.values():
+            if len(bucket) < 2:
+                continue
+            # Preferência: validação/teste, depois a maior resolução
+            bucket.sort(key=lambda e: (SPLIT_PRIORITY[e['split']], -e['shape'][0] * e['shape'][1], e['source']))
+            thumbs = [cv2.resize(np.asarray(self.image(e)), (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+                      for e in bucket]
+            for i, entry in enumerate(bucket):
+                if entry['duplicate_of']:
+                    continue
+                for j in range(i + 1, len(bucket)):
+                    other = bucket[j]
+                    if not other['duplicate_of'] and np.abs(thumbs[i] - thumbs[j]).mean() <= DUPLICATE_DISTANCE:
+                        other['duplicate_of'] = entry['source']
+
+    def save(self):
+        """Grava índice e data.yaml (pastas vazias por split: o ultralytics exige que existam)"""
+        index = {'version': CACHE_VERSION, 'imgsz': self.imgsz, 'shard_size': SHARD_SIZE,
+                 'entries': self.all_entries}
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(temp_path, self.index_path)
+
+        for split in SPLITS:
+            os.makedirs(os.path.join(self.cache_dir, split), exist_ok=True)
+        with open(os.path.join(self.cache_dir, DATA_FILE), 'w', encoding='utf-8') as f:
+            f.write(f"path: {os.path.abspath(self.cache_dir)}\n")
+            f.write("train: train\nval: valid\ntest: test\n\n")
+            f.write(f"nc: {len(CLASS_NAMES)}\nnames: {CLASS_NAMES}\n")
+
+    def summary(self):
+        """Imagens e duplicatas por split"""
+        summary = {}
+        for split in SPLITS:
+            in_split = [entry for entry in self.all_entries if entry['split'] == split]
+            duplicates = sum(1 for entry in in_split if entry['duplicate_of'])
+            summary[split] = {'images': len(in_split) - duplicates, 'duplicates': duplicates}
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cache pré-decodificado dos datasets de treino do YOLO")
+    parser.add_argument('command', choices=('build', 'train', 'val'))
+    parser.add_argument('datasets', nargs='*', default=list(DEFAULT_DATASETS),
+                        help="datasets no formato YOLO (padrão: dataset dataset2)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help=f"pasta do cache (padrão {DEFAULT_CACHE})")
+    parser.add_argument('--imgsz', type=int, default=640, help="tamanho das imagens do cache e do treino (padrão 640)")
+    parser.add_argument('--workers', type=int, default=8, help="threads de decodificação no build (padrão 8)")
+    parser.add_argument('--rebuild', action='store_true', help="descarta os shards e decodifica tudo de novo")
+    parser.add_argument('--model', help="pesos de partida (train) ou avaliados (val)")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--name', default='yolov8n-cube', help="nome da execução em runs-cube/")
+    args = parser.parse_args(argv)
+
+    cache = DatasetCache(args.cache)
+    if args.command == 'build':
+        start = time.perf_counter()
+        decoded, reused = cache.build(args.datasets, args.imgsz, args.workers, args.rebuild)
+        print(f"{decoded} imagens decodificadas, {reused} reaproveitadas do cache "
+              f"em {time.perf_counter() - start:.1f}s")
+        for split, counts in cache.summary().items():
+            print(f"  {split:<6} {counts['images']} imagens ({counts['duplicates']} duplicatas removidas)")
+        return
+
+    if not cache.all_entries:
+        print(f"Cache vazio em {args.cache}; rode 'python src/dataset_cache.py build' antes")
+        return
+    if not args.model:
+        parser.error("--model é obrigatório para train/val")
+
+    # Só o treino/validação dependem do ultralytics
+    from cached_training import train_cached, validate_cached
+
+    data = os.path.join(args.cache, DATA_FILE)
+    if args.command == 'train':
+        train_cached(args.model, data, epochs=args.epochs, batch=args.batch, imgsz=cache.imgsz,
+                     device=args.device, workers=0, project='runs-cube', name=args.name)
+    else:
+        validate_cached(args.model, data, batch=args.batch, imgsz=cache.imgsz, device=args.device)
+
+
+if __name__ == '__main__':
+    main()
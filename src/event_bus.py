@@ -0,0 +1,211 @@
+"""Eventos binários de entrada/saída de cubos e grupos completos num socket Unix local.
+
+Cada evento é um struct de tamanho fixo (EVENT_FORMAT), sem JSON. O detector publica num
+socket SOCK_SEQPACKET (uma mensagem = um evento) e qualquer processo pode se inscrever
+conectando nele; cada inscrito recebe todos os eventos a partir da conexão. O envio nunca
+bloqueia: se um inscrito não lê e o buffer dele enche, o evento é descartado só para ele
+(o número de sequência permite detectar a perda).
+
+Uso:
+    python src/webcam_detect_adaptive.py --events                 # publica em cube_events.sock
+    python src/event_bus.py cube_events.sock                      # mostra os eventos recebidos
+
+Formato (little-endian, 28 bytes):
+    tipo u8 | cor u8 | quantidade u16 | sequência u32 | id u32 | instante f64 | duração f64
+
+O instante é o relógio do tracking (time.time() com câmera; no --source, o tempo do vídeo
+para entrada/saída de cubos).
+"""
+import argparse
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+from collections import namedtuple
+
+EVENTS_SOCKET = "cube_events.sock"
+
+EVENT_ENTER = 1  # cubo confirmado na tela (instante = entrada)
+EVENT_EXIT = 2   # cubo saiu (instante = saída, duração = tempo na tela)
+EVENT_GROUP = 3  # grupo de 3 cores completo (id = número do grupo, duração = tempo total)
+EVENT_NAMES = {EVENT_ENTER: 'entrada', EVENT_EXIT: 'saida', EVENT_GROUP: 'grupo'}
+
+# Código da cor = índice nesta tupla
+COLORS = ('white', 'yellow', 'red', 'orange', 'blue', 'green')
+NO_COLOR = 255
+
+EVENT_FORMAT = struct.Struct('<BBHIIdd')
+EVENT_SIZE = EVENT_FORMAT.size
+
+Event = namedtuple('Event', 'type color count sequence id timestamp duration')
+
+
+def color_code(color):
+    return COLORS.index(color) if color in COLORS else NO_COLOR
+
+
+def unpack_event(data):
+    """bytes -> Event (cor como nome; None quando o evento não tem cor)"""
+    event_type, color, count, sequence, event_id, timestamp, duration = EVENT_FORMAT.unpack(data)
+    return Event(event_type, COLORS[color] if color < len(COLORS) else None, count, sequence,
+                 event_id, timestamp, duration)
+
+
+class EventPublisher:
+    def __init__(self, path=EVENTS_SOCKET, send_buffer=16384):
+        """Socket de eventos em `path`; inscritos conectam a qualquer momento
+
+        send_buffer: bytes enfileirados por inscrito antes de começar a descartar.
+        """
+        self.path = path
+        self.send_buffer = send_buffer
+
+        # Socket de uma sessão anterior que caiu sem apagar o arquivo
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.server.bind(path)
+        self.server.listen(16)
+        self.server.setblocking(False)
+
+        self.subscribers = []
+        self.lock = threading.Lock()  # tracking e teclas/HTTP podem publicar de threads diferentes
+        self.sequence = 0
+        self.published = 0
+        self.dropped = 0  # entregas descartadas (inscrito com o buffer cheio)
+
+    def _accept(self):
+        """Aceita os inscritos que conectaram desde o último evento (não bloqueia)"""
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+            self.subscribers.append(conn)
+
+    def publish(self, event_type, event_id, color=None, timestamp=None, duration=0.0, count=0):
+        with self.lock:
+            self._accept()
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            packet = EVENT_FORMAT.pack(event_type, color_code(color), count, self.sequence, event_id,
+                                       time.time() if timestamp is None else timestamp, duration)
+            self.published += 1
+            for conn in list(self.subscribers):
+                try:
+                    conn.send(packet)
+                except BlockingIOError:
+                    self.dropped += 1
+                except OSError:
+                    # Inscrito desconectou
+                    self.subscribers.remove(conn)
+                    conn.close()
+
+    def cube_entered(self, number, color, entry_time):
+        self.publish(EVENT_ENTER, number, color, entry_time)
+
+    def cube_exited(self, number, color, exit_time, duration):
+        self.publish(EVENT_EXIT, number, color, exit_time, duration)
+
+    def group_completed(self, group_number, total_time, cubes=3):
+        self.publish(EVENT_GROUP, group_number, duration=total_time, count=cubes)
+
+    def stats(self):
+        return {'subscribers': len(self.subscribers), 'published': self.published, 'dropped': self.dropped}
+
+    def close(self):
+        with self.lock:
+            for conn in self.subscribers:
+                conn.close()
+            self.subscribers = []
+            self.server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class EventSubscriber:
+    def __init__(self, path=EVENTS_SOCKET, timeout=None):
+        """Conecta no socket de eventos do detector (timeout em segundos para recv; None = espera)"""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(path)
+        self.sock.settimeout(timeout)
+        self.last_sequence = None
+        self.lost = 0  # eventos descartados pelo publicador para este inscrito
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self):
+        """Próximo evento; None quando o detector fecha o socket (socket.timeout se passar do timeout)"""
+        data = self.sock.recv(EVENT_SIZE)
+        if not data:
+            return None
+        event = unpack_event(data)
+        if self.last_sequence is not None:
+            self.lost += (event.sequence - self.last_sequence - 1) & 0xFFFFFFFF
+        self.last_sequence = event.sequence
+        return event
+
+    def __iter__(self):
+        while True:
+            event = self.recv()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.sock.close()
+
+
+def events_path(path, station=None):
+    """Socket de uma estação: cube_events.sock -> cube_events_cam0.sock"""
+    if not station:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{station}{ext}"
+
+
+def open_publisher(path, station=None):
+    """EventPublisher da estação, ou None (com aviso) se o sistema não tem sockets Unix"""
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(socket, 'SOCK_SEQPACKET'):
+        print("Eventos indisponíveis: o sistema não suporta sockets Unix SOCK_SEQPACKET")
+        return None
+    path = events_path(path, station)
+    try:
+        return EventPublisher(path)
+    except OSError as error:
+        print(f"Não foi possível abrir o socket de eventos {path}: {error}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mostra os eventos publicados pelo detector")
+    parser.add_argument('path', nargs='?', default=EVENTS_SOCKET,
+                        help=f"socket de eventos (padrão {EVENTS_SOCKET}; com --cameras, cube_events_cam0.sock...)")
+    args = parser.parse_args(argv)
+
+    subscriber = EventSubscriber(args.path)
+    print(f"Conectado em {args.path}")
+    try:
+        for event in subscriber:
+            delay_ms = (time.time() - event.timestamp) * 1000
+            if event.type == EVENT_GROUP:
+                detail = f"grupo {event.id}: {event.count} cubos, {event.duration:.2f}s"
+            elif event.type == EVENT_EXIT:
+                detail = f"cubo {event.id} ({event.color}) saiu após {event.duration:.2f}s"
+            else:
+                detail = f"cubo {event.id} ({event.color}) entrou"
+            print(f"#{event.sequence:<6} {EVENT_NAMES.get(event.type, event.type):<8} {detail} "
+                  f"[{delay_ms:.2f}ms após o evento]")
+    except KeyboardInterrupt:
+        pass
+    if subscriber.lost:
+        print(f"{subscriber.lost} eventos perdidos (inscrito lento)")
+    subscriber.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+class RecordingCapture:
+    def __init__(self, cap, recorder):
+        """Câmera que lê cada frame direto no buffer circular do gravador"""
+        self.cap = cap
+        self.recorder = recorder
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.recorder.read(self.cap)
+
+    def set(self, *args):
+        return self.cap.set(*args)
+
+    def release(self):
+        self.cap.release()
+
+
+class FrameRecorder:
+    def __init__(self, seconds=20, fps=30, output_dir='clips', name='clip', margin_seconds=2, padding=1.0):
+        """Guarda os últimos `seconds` segundos de frames num buffer circular pré-alocado
+
+        A câmera decodifica direto no slot do buffer (sem cópia nem alocação por frame) e o
+        loop recebe o próprio slot, somente para leitura: o overlay é desenhado num frame de
+        exibição à parte (display_frame), então o buffer guarda só o vídeo cru. Os clipes são
+        exportados por uma thread que copia a janela para um arquivo de staging mapeado em
+        memória e codifica o vídeo a partir dele.
+        """
+        self.seconds = seconds
+        self.fps = fps
+        self.output_dir = output_dir
+        self.name = name
+        self.padding = padding  # segundos extras antes da entrada do primeiro cubo
+
+        # Folga além da janela: a exportação copia os frames mais antigos antes de serem sobrescritos
+        self.capacity = int((seconds + margin_seconds) * fps)
+        self.frames = None  # alocado no primeiro frame (formato da câmera)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.sequence = np.full(self.capacity, -1, dtype=np.int64)  # -1 = slot vazio/sendo escrito
+        self.next_sequence = 0
+
+        self.requests = queue.Queue()
+        self.clips = []  # caminhos dos clipes gravados
+        self.lost_frames = 0  # frames sobrescritos antes de serem copiados
+        self.worker = threading.Thread(target=self._export_loop, name='gravador', daemon=True)
+        self.worker.start()
+
+    def wrap(self, cap):
+        return RecordingCapture(cap, self)
+
+    def read(self, cap):
+        """cap.read() decodificando direto no próximo slot do buffer; retorna o slot (não escrever nele)"""
+        if self.frames is None:
+            ret, frame = cap.read()
+            if not ret:
+                return ret, frame
+            self.frames = np.empty((self.capacity, *frame.shape), dtype=frame.dtype)
+            slot = self.next_sequence % self.capacity
+            self.frames[slot] = frame
+            self._commit(slot)
+            return True, frame
+
+        slot = self.next_sequence % self.capacity
+        self.sequence[slot] = -1  # invalida o slot enquanto a câmera escreve nele
+        buffer = self.frames[slot]
+        ret, frame = cap.read(buffer)
+        if not ret:
+            return ret, frame
+        if frame is not buffer and frame.ctypes.data != buffer.ctypes.data:
+            # Câmera mudou de resolução: devolve o frame sem gravar
+            return ret, frame
+        self._commit(slot)
+        return True, buffer
+
+    def _commit(self, slot):
+        self.timestamps[slot] = time.time()
+        self.sequence[slot] = self.next_sequence
+        self.next_sequence += 1
+
+    def request_clip(self, start, end, reason='manual'):
+        """Pede a exportação dos frames entre start e end (time.time()); não bloqueia"""
+        self.requests.put((start, end, reason))
+
+    def request_last(self, seconds=None, reason='manual'):
+        """Pede os últimos `seconds` segundos (padrão: a janela inteira)"""
+        end = time.time()
+        self.request_clip(end - (seconds or self.seconds), end, reason)
+
+    def clip_group(self, group):
+        """Pede o trecho que cobre um grupo (da entrada do primeiro cubo até agora)
+
+        O horário de saída de cada cubo é o do registro no logger; a duração do cubo na
+        tela dá o horário de entrada.
+        """
+        starts, ends = [], []
+        for cube in group['cubes']:
+            exit_time = datetime.fromisoformat(cube['timestamp']).timestamp()
+            starts.append(exit_time - cube['individual_time'])
+            ends.append(exit_time)
+        if starts:
+            self.request_clip(min(starts) - self.padding, max(max(ends), time.time()),
+                              f"grupo{group['group_number']}")
+
+    def _export_loop(self):
+        while True:
+            request = self.requests.get()
+            try:
+                if request is None:
+                    return
+                self._export(*request)
+            except Exception as error:
+                print(f"Falha ao exportar clipe: {error}")
+            finally:
+                self.requests.task_done()
+
+    def _export(self, start, end, reason):
+        if self.frames is None:
+            return
+
+        # Slots da janela, do mais antigo para o mais novo
+        sequences = self.sequence.copy()
+        timestamps = self.timestamps.copy()
+        slots = np.flatnonzero((sequences >= 0) & (timestamps >= start) & (timestamps <= end))
+        slots = slots[np.argsort(sequences[slots])]
+        if not len(slots):
+            return
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Sequência do primeiro frame no nome: dois clipes no mesmo segundo não colidem
+        stamp = datetime.fromtimestamp(timestamps[slots[0]]).strftime('%Y%m%d_%H%M%S')
+        clip_id = f"{self.name}_{stamp}_{sequences[slots[0]]}_{reason}"
+        path = os.path.join(self.output_dir, f"{clip_id}.mp4")
+        staging_path = os.path.join(self.output_dir, f".{clip_id}.staging.npy")
+
+        # 1) Copia para o staging em disco antes que a câmera sobrescreva os slots
+        staging = np.lib.format.open_memmap(staging_path, mode='w+', dtype=self.frames.dtype,
+                                            shape=(len(slots), *self.frames.shape[1:]))
+        copied = []
+        for slot in slots:
+            expected = sequences[slot]
+            staging[len(copied)] = self.frames[slot]
+            # Se o slot foi reescrito durante a cópia, o frame é descartado
+            if self.sequence[slot] != expected:
+                self.lost_frames += 1
+                continue
+            copied.append(timestamps[slot])
+
+        # 2) Codifica a partir do staging, sem segurar nada do buffer circular
+        if copied:
+            # FPS real da captura (arredondado: o codec não aceita frações arbitrárias)
+            duration = copied[-1] - copied[0]
+            fps = round((len(copied) - 1) / duration, 1) if duration > 0 else self.fps
+            height, width = self.frames.shape[1:3]
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+            if writer.isOpened():
+                for index in range(len(copied)):
+                    writer.write(staging[index])
+                writer.release()
+                self.clips.append(path)
+                print(f"Clipe salvo: {path} ({len(copied)} frames, {duration:.1f}s)")
+            else:
+                print(f"Não foi possível gravar o clipe {path}")
+
+        del staging
+        os.remove(staging_path)
+
+    def flush(self):
+        """Espera as exportações pendentes"""
+        self.requests.join()
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
@@ -0,0 +1,142 @@
+import os
+import threading
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class VideoFileSource:
+    def __init__(self, path, fps=None):
+        """Lê frames de um vídeo gravado, com o tempo vindo do próprio arquivo"""
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_index = -1
+        self.current_timestamp = 0.0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if ret:
+            self.frame_index += 1
+            # Usa o timestamp do container; se não existir, deriva do índice do frame
+            position_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+            if position_ms > 0:
+                self.current_timestamp = position_ms / 1000.0
+            else:
+                self.current_timestamp = self.frame_index / self.fps
+        return ret, frame
+
+    def timestamp(self):
+        """Tempo (s) do último frame lido, relativo ao início do vídeo"""
+        return self.current_timestamp
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirectorySource:
+    def __init__(self, path, fps=None):
+        """Lê frames de uma pasta de imagens em ordem alfabética"""
+        self.path = path
+        self.fps = fps or 30.0
+        self.files = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.frame_index = -1
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def read(self):
+        while self.frame_index + 1 < len(self.files):
+            self.frame_index += 1
+            frame = cv2.imread(self.files[self.frame_index])
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def timestamp(self):
+        """Tempo (s) do último frame lido, derivado do índice e do FPS configurado"""
+        return self.frame_index / self.fps
+
+    def release(self):
+        self.files = []
+
+
+def open_replay_source(path, fps=None):
+    """Abre um vídeo ou uma pasta de frames para reprodução offline"""
+    if os.path.isdir(path):
+        return ImageDirectorySource(path, fps)
+    return VideoFileSource(path, fps)
+
+
+def open_camera(source, width=640, height=480, fps=30):
+    """Abre uma câmera (índice) ou stream/vídeo (caminho/URL) já configurada para 640x480@30"""
+    cap = cv2.VideoCapture(source)
+    if cap.isOpened():
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap
+
+
+class CameraProbe:
+    def __init__(self, sources):
+        """Abre várias câmeras ao mesmo tempo, cada uma na sua thread
+
+        Cada driver pode levar segundos para responder (ou desistir); em paralelo o
+        custo total é o da câmera mais lenta, e o modelo pode carregar enquanto isso.
+        """
+        self.sources = list(sources)
+        self.caps = [None] * len(self.sources)
+        self.threads = [
+            threading.Thread(target=self._open, args=(index,), name=f'camera-{source}', daemon=True)
+            for index, source in enumerate(self.sources)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _open(self, index):
+        self.caps[index] = open_camera(self.sources[index])
+
+    def _opened(self, index):
+        return self.caps[index] is not None and self.caps[index].isOpened()
+
+    def all(self):
+        """Espera todas; retorna uma lista alinhada com sources (None para as que não abriram)"""
+        caps = []
+        for index, thread in enumerate(self.threads):
+            thread.join()
+            if self._opened(index):
+                caps.append(self.caps[index])
+            else:
+                if self.caps[index] is not None:
+                    self.caps[index].release()
+                caps.append(None)
+        return caps
+
+    def first(self):
+        """Primeira câmera que abriu, na ordem de prioridade; as outras são liberadas"""
+        chosen = None
+        for index, thread in enumerate(self.threads):
+            thread.join()
+            if self._opened(index):
+                chosen = index
+                break
+
+        # Libera as demais em segundo plano, sem esperar drivers lentos
+        def release_others():
+            for index, thread in enumerate(self.threads):
+                if index == chosen:
+                    continue
+                thread.join()
+                if self.caps[index] is not None:
+                    self.caps[index].release()
+
+        threading.Thread(target=release_others, name='camera-release', daemon=True).start()
+        return self.caps[chosen] if chosen is not None else None
@@ -0,0 +1,186 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+# Dataset usado na calibração int8 (a divisão 'val' aponta para dataset2/valid)
+CALIBRATION_DATA = "dataset2/data.yaml"
+CALIBRATION_IMAGES = "dataset2/valid/images"
+
+
+def letterbox(image, size=640, color=(114, 114, 114)):
+    """Redimensiona mantendo a proporção e completa com borda até size x size (igual ao YOLO)"""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = image
+    return canvas, scale, (left, top)
+
+
+def exported_model_path(model_path, backend, int8=False):
+    """Caminho do artefato exportado a partir de um best.pt"""
+    stem, _ = os.path.splitext(model_path)
+    if backend == 'onnx':
+        return f"{stem}_int8.onnx" if int8 else f"{stem}.onnx"
+    if backend == 'openvino':
+        return f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+    return model_path
+
+
+def quantize_onnx_int8(onnx_path, output_path, calibration_images=CALIBRATION_IMAGES,
+                       imgsz=640, max_images=200):
+    """Quantiza um ONNX para int8 (estático) calibrando com as imagens de validação"""
+    import onnxruntime
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat,
+                                          QuantType, quantize_static)
+
+    input_name = onnxruntime.InferenceSession(
+        onnx_path, providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+    files = sorted(glob.glob(os.path.join(calibration_images, '*')))[:max_images]
+    if not files:
+        raise FileNotFoundError(f"Nenhuma imagem de calibração em {calibration_images}")
+
+    class ValidationReader(CalibrationDataReader):
+        def __init__(self):
+            self.files = iter(files)
+
+        def get_next(self):
+            for path in self.files:
+                image = cv2.imread(path)
+                if image is None:
+                    continue
+                image, _, _ = letterbox(image, imgsz)
+                blob = image[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+                return {input_name: np.ascontiguousarray(blob)}
+            return None
+
+    quantize_static(onnx_path, output_path, ValidationReader(),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8)
+    return output_path
+
+
+def export_model(model_path, backend, int8=False, imgsz=640):
+    """Exporta best.pt para ONNX/OpenVINO (fp32 ou int8) e retorna o caminho do artefato
+
+    A exportação tem eixos dinâmicos: o mesmo artefato roda em qualquer imgsz (ver
+    YoloBackend.fixed_imgsz para os exportados antes, de tamanho fixo).
+    """
+    from ultralytics import YOLO
+
+    target = exported_model_path(model_path, backend, int8)
+    if backend == 'pytorch' or os.path.exists(target):
+        return target
+
+    model = YOLO(model_path)
+    if backend == 'onnx':
+        onnx_path = exported_model_path(model_path, 'onnx')
+        if not os.path.exists(onnx_path):
+            onnx_path = model.export(format='onnx', imgsz=imgsz, dynamic=True)
+        if int8:
+            return quantize_onnx_int8(onnx_path, target, imgsz=imgsz)
+        return onnx_path
+
+    if backend == 'openvino':
+        exported = model.export(format='openvino', imgsz=imgsz, int8=int8, dynamic=True,
+                                data=CALIBRATION_DATA if int8 else None)
+        # Mantém o nome esperado para as próximas inicializações
+        if os.path.abspath(exported) != os.path.abspath(target):
+            os.replace(exported, target)
+        return target
+
+    raise ValueError(f"Backend desconhecido: {backend}")
+
+
+class YoloBackend:
+    def __init__(self, model_path, backend='pytorch', int8=False, imgsz=640, device=None):
+        """Carrega o modelo no backend escolhido (exporta na primeira vez, se preciso)
+
+        device: dispositivo do ultralytics ('cpu', '0'...); None deixa o ultralytics escolher.
+        """
+        from ultralytics import YOLO
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend desconhecido: {backend} (opções: {', '.join(BACKENDS)})")
+        if backend == 'pytorch' and int8:
+            raise ValueError("int8 só está disponível nos backends onnx e openvino")
+
+        self.name = backend if not int8 else f"{backend}-int8"
+        self.source_path = model_path
+        self.model_path = export_model(model_path, backend, int8, imgsz)
+        self.imgsz = imgsz
+        self.device = device
+        self.model = YOLO(self.model_path, task='detect')
+
+    def warmup(self, shape=(480, 640, 3), batch=1):
+        """Inferência num frame vazio: paga a inicialização preguiçosa antes do primeiro frame real"""
+        frame = np.zeros(shape, dtype=np.uint8)
+        if batch > 1:
+            self.predict_batch([frame] * batch, conf=0.5)
+        else:
+            self.predict(frame, conf=0.5)
+
+    def fixed_imgsz(self):
+        """Tamanho de entrada de um modelo exportado sem eixos dinâmicos (None = aceita qualquer imgsz)
+
+        Um ONNX/OpenVINO estático roda sempre no tamanho da exportação, qualquer que seja o imgsz pedido.
+        """
+        if self.name == 'pytorch':
+            return None
+        if self.model.predictor is None:
+            self.warmup()  # o AutoBackend (com os metadados da exportação) nasce na primeira inferência
+        model = self.model.predictor.model
+        if getattr(model, 'dynamic', False):
+            return None
+        return int(np.max(model.imgsz))
+
+    def _boxes(self, result):
+        """Converte um resultado do ultralytics em [(bbox, confiança)]"""
+        if result.boxes is None or len(result.boxes) == 0:
+            return []
+        xyxy = result.boxes.xyxy.cpu().numpy().astype(int)
+        confs = result.boxes.conf.cpu().numpy()
+        return [((x1, y1, x2, y2), box_conf) for (x1, y1, x2, y2), box_conf in zip(xyxy.tolist(), confs.tolist())]
+
+    def predict(self, frame, conf, imgsz=None):
+        """Retorna [(bbox, confiança)] com bbox = (x1, y1, x2, y2) em pixels do frame
+
+        imgsz: tamanho de entrada desta chamada (padrão self.imgsz); as bboxes voltam sempre
+        na resolução original do frame.
+        """
+        results = self.model(frame, conf=conf, imgsz=imgsz or self.imgsz, device=self.device, verbose=False)
+
+        boxes = []
+        for r in results:
+            boxes.extend(self._boxes(r))
+        return boxes
+
+    def predict_batch(self, frames, conf, imgsz=None):
+        """Uma única chamada do modelo para vários frames; retorna uma lista de [(bbox, confiança)] por frame"""
+        if not frames:
+            return []
+        results = self.model(list(frames), conf=conf, imgsz=imgsz or self.imgsz, device=self.device,
+                             verbose=False)
+        return [self._boxes(r) for r in results]
+
+
+def load_first_backend(model_paths, backend='pytorch', int8=False, imgsz=640):
+    """Carrega uma única vez o primeiro modelo da lista que existir e abrir sem erro"""
+    for path in model_paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            return YoloBackend(path, backend, int8, imgsz)
+        except Exception as error:
+            print(f"Falha ao carregar {path}: {error}")
+    return None
@@ -0,0 +1,283 @@
+"""Benchmark de seleção de modelo: precisão (mAP) x latência de CPU por execução e imgsz.
+
+Avalia todos os runs-cube/*/weights/best.pt (e as variantes já exportadas em ONNX/OpenVINO)
+nos splits de validação e teste do dataset2, em vários tamanhos de entrada, e grava um
+manifesto ordenado pela latência. O detector lê o manifesto e carrega o modelo mais rápido
+que atinge o mAP mínimo.
+
+Uso:
+    python src/model_benchmark.py                                   # grava model_benchmark.json
+    python src/model_benchmark.py --backends pytorch onnx --int8 --export
+    python src/webcam_detect_adaptive.py --min-map 0.9              # usa o manifesto
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from inference_backends import BACKENDS, YoloBackend, exported_model_path
+
+MODEL_MANIFEST = "model_benchmark.json"
+MANIFEST_VERSION = 1
+RUNS_PATTERN = "runs-cube/*/weights/best.pt"
+BENCHMARK_DATA = "dataset2/data.yaml"
+SPLITS = ('val', 'test')
+IMAGE_SIZES = (320, 416, 512, 640)
+DEFAULT_MIN_MAP = 0.90  # mAP50 mínimo (no pior split) para um modelo ser escolhido
+DETECTION_CONFIDENCE = 0.5  # mesma confiança do detector em tempo real
+WARMUP_FRAMES = 3
+
+
+def find_weights(pattern=RUNS_PATTERN):
+    return sorted(glob.glob(pattern))
+
+
+def variants(weights, backends, int8=False, export=False):
+    """(pesos, backend, int8) de cada modelo: pytorch sempre; os exportados se existirem (ou com export)"""
+    found = []
+    for path in weights:
+        for backend in backends:
+            for quantized in ((False, True) if int8 and backend != 'pytorch' else (False,)):
+                if backend == 'pytorch' or export or os.path.exists(exported_model_path(path, backend, quantized)):
+                    found.append((path, backend, quantized))
+    return found
+
+
+def split_images(data, splits=SPLITS):
+    """Imagens dos splits do data.yaml (caminhos resolvidos pelo ultralytics)"""
+    from ultralytics.data.utils import check_det_dataset
+
+    dataset = check_det_dataset(data)
+    images = []
+    for split in splits:
+        folders = dataset.get(split) or []
+        for folder in folders if isinstance(folders, list) else [folders]:
+            images.extend(sorted(glob.glob(os.path.join(folder, '*'))))
+    frames = [cv2.imread(path) for path in images]
+    return [frame for frame in frames if frame is not None]
+
+
+def isolated_data(data, directory, splits=SPLITS):
+    """Copia os splits avaliados para `directory` e grava um data.yaml apontando para a cópia
+
+    O val() do ultralytics grava labels.cache ao lado das pastas de labels; avaliando a cópia,
+    os arquivos versionados do dataset não são tocados.
+    """
+    from ultralytics.data.utils import check_det_dataset
+
+    dataset = check_det_dataset(data)
+    paths = {}
+    for split in splits:
+        folders = dataset.get(split) or []
+        paths[split] = []
+        for i, folder in enumerate(folders if isinstance(folders, list) else [folders]):
+            target = os.path.join(directory, f"{split}{i}")
+            shutil.copytree(folder, os.path.join(target, 'images'))
+            labels = os.path.join(os.path.dirname(folder), 'labels')
+            if os.path.isdir(labels):
+                shutil.copytree(labels, os.path.join(target, 'labels'),
+                                ignore=shutil.ignore_patterns('*.cache'))
+            paths[split].append(os.path.join(target, 'images'))
+
+    path = os.path.join(directory, 'data.yaml')
+    with open(path, 'w', encoding='utf-8') as f:
+        # O ultralytics exige um split de treino; não é usado na validação
+        f.write(f"train: {paths[splits[0]]}\n")
+        for split in splits:
+            f.write(f"{split}: {paths[split]}\n")
+        f.write(f"\nnc: {dataset['nc']}\nnames: {list(dataset['names'].values())}\n")
+    return path
+
+
+def latency_stats(durations):
+    ms = np.array(durations) * 1000
+    return {
+        'mean': round(float(ms.mean()), 2),
+        'p50': round(float(np.percentile(ms, 50)), 2),
+        'p90': round(float(np.percentile(ms, 90)), 2),
+        'p99': round(float(np.percentile(ms, 99)), 2)
+    }
+
+
+def measure_latency(backend, frames, imgsz, repeats=2):
+    """Latência de backend.predict (pré-processamento + inferência + NMS), um frame por vez"""
+    for frame in frames[:WARMUP_FRAMES]:
+        backend.predict(frame, DETECTION_CONFIDENCE, imgsz)
+    durations = []
+    for _ in range(repeats):
+        for frame in frames:
+            start = time.perf_counter()
+            backend.predict(frame, DETECTION_CONFIDENCE, imgsz)
+            durations.append(time.perf_counter() - start)
+    return latency_stats(durations)
+
+
+def measure_accuracy(backend, data, imgsz, splits=SPLITS):
+    """mAP50 e mAP50-95 em cada split (validação padrão do ultralytics, sem gravar nada no projeto)
+
+    data: data.yaml de isolated_data (o val() grava labels.cache ao lado dos labels).
+    """
+    accuracy = {}
+    with tempfile.TemporaryDirectory() as project:
+        for split in splits:
+            metrics = backend.model.val(data=data, split=split, imgsz=imgsz, batch=1,
+                                        device=backend.device, project=project, plots=False,
+                                        verbose=False)
+            accuracy[split] = {
+                'map50': round(float(metrics.box.map50), 4),
+                'map50_95': round(float(metrics.box.map), 4)
+            }
+    return accuracy
+
+
+def benchmark(candidates, sizes, data, frames, repeats=2, device='cpu'):
+    """Mede cada variante em cada imgsz; retorna as entradas do manifesto (não ordenadas)
+
+    Cada variante é exportada (e calibrada, no int8) uma única vez, no maior imgsz; os
+    tamanhos menores usam o mesmo artefato, passando o imgsz em cada chamada.
+    """
+    entries = []
+    for weights, backend_name, int8 in candidates:
+        try:
+            backend = YoloBackend(weights, backend_name, int8, max(sizes), device=device)
+        except Exception as error:
+            print(f"Falha ao carregar {weights} ({backend_name}{'-int8' if int8 else ''}): {error}")
+            continue
+
+        backend.warmup()
+        fixed = backend.fixed_imgsz()
+        for imgsz in sizes:
+            if fixed and imgsz != fixed:
+                print(f"  {backend.model_path}: exportado em {fixed}, pulando imgsz={imgsz}")
+                continue
+            latency = measure_latency(backend, frames, imgsz, repeats)
+            accuracy = measure_accuracy(backend, data, imgsz)
+            entry = {
+                'weights': weights,
+                'weights_mtime': os.path.getmtime(weights),
+                'backend': backend_name,
+                'int8': int8,
+                'model_path': backend.model_path,
+                'imgsz': imgsz,
+                'accuracy': accuracy,
+                'map50': min(split['map50'] for split in accuracy.values()),
+                'latency_ms': latency
+            }
+            entries.append(entry)
+            print(f"  {backend.model_path} ({backend.name}) imgsz={imgsz}: mAP50 {entry['map50']:.3f} | "
+                  f"p50 {latency['p50']:.1f}ms p90 {latency['p90']:.1f}ms p99 {latency['p99']:.1f}ms")
+    return entries
+
+
+def rank(entries):
+    """Mais rápido primeiro (p50, depois p90); empate decidido pelo maior mAP"""
+    ranked = sorted(entries, key=lambda e: (e['latency_ms']['p50'], e['latency_ms']['p90'], -e['map50']))
+    for position, entry in enumerate(ranked, 1):
+        entry['rank'] = position
+    return ranked
+
+
+def save_manifest(path, manifest):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_manifest(path=MODEL_MANIFEST):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def select_model(path=MODEL_MANIFEST, min_map=DEFAULT_MIN_MAP, backend='pytorch', int8=False):
+    """Entrada mais rápida do manifesto com mAP50 >= min_map no backend pedido (None se não houver)
+
+    Pesos retreinados depois do benchmark (mtime diferente) ou apagados não são considerados.
+    """
+    manifest = load_manifest(path)
+    if manifest is None:
+        return None
+    for entry in manifest['models']:
+        if entry['backend'] != backend or entry['int8'] != int8 or entry['map50'] < min_map:
+            continue
+        weights = entry['weights']
+        if os.path.exists(weights) and os.path.getmtime(weights) == entry['weights_mtime']:
+            return entry
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de precisão x latência dos modelos treinados")
+    parser.add_argument('--weights', nargs='*',
+                        help=f"pesos avaliados (padrão: todos os {RUNS_PATTERN})")
+    parser.add_argument('--imgsz', type=int, nargs='+', default=list(IMAGE_SIZES),
+                        help="tamanhos de entrada avaliados (padrão 320 416 512 640)")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                        help="backends avaliados (os exportados só se o artefato existir)")
+    parser.add_argument('--int8', action='store_true', help="inclui as variantes int8 dos backends exportados")
+    parser.add_argument('--export', action='store_true', help="exporta as variantes que ainda não existem")
+    parser.add_argument('--data', default=BENCHMARK_DATA,
+                        help=f"dataset da avaliação (splits val e test, padrão {BENCHMARK_DATA})")
+    parser.add_argument('--repeats', type=int, default=2,
+                        help="passadas pelas imagens na medição de latência (padrão 2)")
+    parser.add_argument('--device', default='cpu', help="dispositivo da medição (padrão cpu, como nas estações)")
+    parser.add_argument('--min-map', type=float, default=DEFAULT_MIN_MAP,
+                        help=f"mAP50 mínimo usado no resumo (padrão {DEFAULT_MIN_MAP})")
+    parser.add_argument('--output', default=MODEL_MANIFEST, help=f"manifesto (padrão {MODEL_MANIFEST})")
+    args = parser.parse_args(argv)
+
+    weights = args.weights if args.weights is not None else find_weights()
+    candidates = variants(weights, args.backends, args.int8, args.export)
+    if not candidates:
+        print(f"Nenhum modelo encontrado em {RUNS_PATTERN}")
+        return
+    frames = split_images(args.data)
+    if not frames:
+        print(f"Nenhuma imagem nos splits {', '.join(SPLITS)} de {args.data}")
+        return
+
+    start = time.perf_counter()
+    print(f"{len(candidates)} variantes x {len(args.imgsz)} tamanhos, latência em {len(frames)} imagens")
+    with tempfile.TemporaryDirectory() as directory:
+        data = isolated_data(args.data, directory)
+        entries = rank(benchmark(candidates, args.imgsz, data, frames, args.repeats, args.device))
+    if not entries:
+        return
+
+    save_manifest(args.output, {
+        'version': MANIFEST_VERSION,
+        'created': datetime.now().isoformat(),
+        'data': args.data,
+        'splits': list(SPLITS),
+        'device': args.device,
+        'images': len(frames),
+        'models': entries
+    })
+
+    print(f"\nRanking ({time.perf_counter() - start:.0f}s):")
+    for entry in entries:
+        mark = '*' if entry['map50'] >= args.min_map else ' '
+        print(f" {mark}{entry['rank']:>3}. {entry['model_path']} imgsz={entry['imgsz']:<4} "
+              f"mAP50 {entry['map50']:.3f}  p50 {entry['latency_ms']['p50']:.1f}ms")
+    chosen = next((e for e in entries if e['map50'] >= args.min_map), None)
+    if chosen:
+        print(f"Mais rápido com mAP50 >= {args.min_map}: {chosen['model_path']} imgsz={chosen['imgsz']}")
+    else:
+        print(f"Nenhum modelo atinge mAP50 >= {args.min_map}")
+    print(f"Manifesto salvo em {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import cv2
+
+
+class MotionGate:
+    def __init__(self, scale=0.25, pixel_threshold=25, min_changed_fraction=0.005, motion_threshold=5,
+                 min_moving_fraction=0.001, refresh_interval=30):
+        """Decide se vale rodar o YOLO comparando o frame com o da última inferência e com o anterior
+
+        A comparação com a última inferência pega a mudança acumulada; a com o frame anterior,
+        com um limiar mais baixo, pega movimento lento e contínuo antes de ele se acumular.
+        Depois de should_infer, `large_change` diz qual das duas acusou: mudança grande em
+        relação à última inferência (ou refresh) exige o YOLO; só movimento pode ser resolvido
+        por propagação, e nesse caso a referência só muda quando o YOLO rodar (inferred).
+        """
+        self.scale = scale
+        self.pixel_threshold = pixel_threshold  # Diferença mínima (0-255) para um pixel contar como mudado
+        self.min_changed_fraction = min_changed_fraction  # Fração de pixels mudados que libera a inferência
+        self.motion_threshold = motion_threshold  # Idem, entre frames consecutivos
+        self.min_moving_fraction = min_moving_fraction
+        self.refresh_interval = refresh_interval  # Força uma inferência a cada N frames parados
+
+        self.reference = None  # Frame da última inferência
+        self.previous = None  # Frame anterior
+        self.frames_since_refresh = 0
+        self.large_change = False  # Resultado da última chamada: mudança grande (ou refresh)
+
+        # Estatísticas
+        self.frames = 0
+        self.skipped = 0
+
+    def _prepare(self, frame):
+        """Versão reduzida, em cinza e suavizada do frame (barata de comparar)"""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    @staticmethod
+    def _changed(gray, other, threshold, min_fraction):
+        diff = cv2.absdiff(gray, other)
+        _, changed = cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) >= min_fraction * changed.size
+
+    def should_infer(self, frame):
+        """True se a cena mudou (ou venceu o refresh); False para reaproveitar as detecções anteriores"""
+        self.frames += 1
+        gray = self._prepare(frame)
+        previous, self.previous = self.previous, gray
+
+        self.large_change = (self.reference is None or self.frames_since_refresh >= self.refresh_interval
+                             or self._changed(gray, self.reference, self.pixel_threshold, self.min_changed_fraction))
+        if self.large_change:
+            self.inferred()
+            return True
+        if self._changed(gray, previous, self.motion_threshold, self.min_moving_fraction):
+            return True
+
+        self.frames_since_refresh += 1
+        self.skipped += 1
+        return False
+
+    def inferred(self):
+        """O YOLO rodou no último frame passado a should_infer: ele vira a referência"""
+        self.reference = self.previous
+        self.frames_since_refresh = 0
+
+    def skip_rate(self):
+        """Fração dos frames em que a inferência foi pulada"""
+        return self.skipped / self.frames if self.frames else 0.0
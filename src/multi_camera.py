@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+
+from perf_stats import PerfMonitor
+from pipeline import put_drop_oldest
+
+
+class MultiCameraService:
+    def __init__(self, caps, detectors, backend):
+        """Várias câmeras, um único modelo: captura por câmera e inferência em lote
+
+        caps e detectors são listas alinhadas (um CubeDetector por câmera, com seu
+        próprio tracking e logger); backend é o YoloBackend compartilhado.
+        """
+        self.caps = caps
+        self.detectors = detectors
+        self.backend = backend
+
+        # Um frame pendente por câmera (sempre o mais recente) e um resultado por câmera
+        self.frames = [queue.Queue(maxsize=1) for _ in caps]
+        self.results = [queue.Queue(maxsize=1) for _ in caps]
+        self.frame_ready = threading.Event()
+
+        # Protege o estado de cada detector/logger entre inferência e renderização
+        self.locks = [threading.Lock() for _ in caps]
+        self.stop_event = threading.Event()
+        self.capture_done = [False] * len(caps)
+
+        # Estatísticas do serviço (lotes); cada detector mantém as suas
+        self.perf = PerfMonitor()
+        self.dropped_frames = [0] * len(caps)
+
+        # Controle de resolução do lote (ResolutionController); None = imgsz fixo do backend
+        self.resolution = None
+
+    def _capture_loop(self, index):
+        """Lê frames de uma câmera continuamente, guardando só o mais recente"""
+        cap = self.caps[index]
+        perf = self.detectors[index].perf
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            captured_at = time.time()
+            captured_perf = time.perf_counter()
+            perf.record('captura', captured_perf - start, captured_perf)
+
+            self.dropped_frames[index] += put_drop_oldest(self.frames[index], (frame, captured_at, captured_perf))
+            self.frame_ready.set()
+
+        self.capture_done[index] = True
+        self.frame_ready.set()
+
+    def _collect(self):
+        """Pega o frame mais recente de cada câmera que tem um frame novo"""
+        pending = []
+        for index, frames in enumerate(self.frames):
+            try:
+                pending.append((index, *frames.get_nowait()))
+            except queue.Empty:
+                pass
+        return pending
+
+    def _inference_loop(self):
+        """Junta os frames novos de todas as câmeras numa única chamada do YOLO"""
+        while True:
+            self.frame_ready.wait(timeout=0.1)
+            self.frame_ready.clear()
+            pending = self._collect()
+            if not pending:
+                if self.stop_event.is_set() or all(self.capture_done):
+                    break
+                continue
+
+            # Gate e propagação resolvem alguns frames sem YOLO
+            boxes_by_camera = {}
+            for index, frame, _, _ in pending:
+                with self.locks[index]:
+                    boxes_by_camera[index] = self.detectors[index].reuse_or_propagate(frame)
+
+            batch = [(index, frame) for index, frame, _, _ in pending if boxes_by_camera[index] is None]
+            if batch:
+                imgsz = self.resolution.imgsz if self.resolution is not None else None
+                start = time.perf_counter()
+                batch_boxes = self.backend.predict_batch([frame for _, frame in batch],
+                                                         self.detectors[batch[0][0]].confidence, imgsz)
+                end = time.perf_counter()
+                if self.resolution is not None:
+                    self.resolution.update(end - start)
+                self.perf.record('lote', end - start, end)
+                self.perf.count('lotes')
+                self.perf.count('frames_em_lote', len(batch))
+
+                for (index, frame), boxes in zip(batch, batch_boxes):
+                    boxes_by_camera[index] = boxes
+                    with self.locks[index]:
+                        self.detectors[index].accept_detection(frame, boxes, end - start)
+
+            for index, frame, captured_at, captured_perf in pending:
+                start = time.perf_counter()
+                with self.locks[index]:
+                    # O tempo de tracking é o instante da captura, não o da inferência
+                    detections = self.detectors[index].track_boxes(frame, boxes_by_camera[index], captured_at)
+                end = time.perf_counter()
+                self.detectors[index].perf.record('tracking_lote', end - start, end)
+                put_drop_oldest(self.results[index], (frame, detections, captured_at, captured_perf))
+
+    def mean_batch_size(self):
+        batches = self.perf.counters.get('lotes', 0)
+        return self.perf.counters.get('frames_em_lote', 0) / batches if batches else 0.0
+
+    def run(self, render):
+        """Executa o serviço; render(index, frame, detections, current_time) roda na thread principal
+
+        render é chamado a cada resultado novo de qualquer câmera e retorna False para sair.
+        """
+        inference = threading.Thread(target=self._inference_loop, name='inferencia-lote', daemon=True)
+        workers = [
+            threading.Thread(target=self._capture_loop, args=(index,), name=f'captura-{index}', daemon=True)
+            for index in range(len(self.caps))
+        ] + [inference]
+        for worker in workers:
+            worker.start()
+
+        try:
+            keep_running = True
+            while keep_running:
+                rendered = False
+                for index, results in enumerate(self.results):
+                    try:
+                        frame, detections, captured_at, captured_perf = results.get_nowait()
+                    except queue.Empty:
+                        continue
+
+                    rendered = True
+                    start = time.perf_counter()
+                    keep_running = render(index, frame, detections, captured_at)
+                    end = time.perf_counter()
+                    perf = self.detectors[index].perf
+                    perf.record('render', end - start, end)
+                    perf.record('ponta-a-ponta', end - captured_perf, end)
+                    if not keep_running:
+                        break
+
+                if not rendered:
+                    # Todas as câmeras terminaram e a inferência já processou o que restava
+                    if not inference.is_alive() and all(r.empty() for r in self.results):
+                        break
+                    time.sleep(0.002)
+        finally:
+            self.stop_event.set()
+            for worker in workers:
+                worker.join(timeout=2.0)
@@ -0,0 +1,117 @@
+import json
+import math
+import os
+
+
+class RunningStats:
+    def __init__(self, alpha=0.05):
+        """Média/variância acumuladas (Welford) e média/variância móveis exponenciais, O(1) por amostra"""
+        self.alpha = alpha
+
+        # Welford: histórico completo
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # EWMA: acompanha mudanças de ritmo da estação
+        self.ewma = 0.0
+        self.ewm_var = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.count == 1:
+            self.ewma = value
+            self.ewm_var = 0.0
+        else:
+            diff = value - self.ewma
+            increment = self.alpha * diff
+            self.ewma += increment
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + diff * increment)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def ewm_std(self):
+        return math.sqrt(self.ewm_var)
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'ewma': self.ewma, 'ewm_var': self.ewm_var}
+
+    @classmethod
+    def from_dict(cls, data, alpha=0.05):
+        stats = cls(alpha)
+        stats.count = data.get('count', 0)
+        stats.mean = data.get('mean', 0.0)
+        stats.m2 = data.get('m2', 0.0)
+        stats.ewma = data.get('ewma', stats.mean)
+        stats.ewm_var = data.get('ewm_var', 0.0)
+        return stats
+
+
+class DelayBaselines:
+    def __init__(self, expected_cube_time=5.0, expected_group_time=15.0, tolerance=5.0,
+                 min_samples=20, sigmas=2.0, min_tolerance=1.0, alpha=0.05):
+        """Tempos esperados aprendidos por cor e por grupo
+
+        Até juntar min_samples amostras de uma chave usa os valores fixos (5s por cubo,
+        15s por grupo, ±5s); depois disso o esperado é a EWMA e a tolerância é
+        sigmas desvios-padrão móveis (nunca menos que min_tolerance).
+        """
+        self.expected_cube_time = expected_cube_time
+        self.expected_group_time = expected_group_time
+        self.default_tolerance = tolerance
+        self.min_samples = min_samples
+        self.sigmas = sigmas
+        self.min_tolerance = min_tolerance
+        self.alpha = alpha
+        self.stats = {}  # 'group' ou cor -> RunningStats
+
+    def _default_expected(self, key):
+        return self.expected_group_time if key == 'group' else self.expected_cube_time
+
+    def learned(self, key):
+        stats = self.stats.get(key)
+        return stats is not None and stats.count >= self.min_samples
+
+    def expected(self, key):
+        """Tempo esperado (s) para uma cor ou para o grupo ('group')"""
+        if self.learned(key):
+            return self.stats[key].ewma
+        return self._default_expected(key)
+
+    def tolerance(self, key):
+        """Margem (s) a partir da qual o tempo conta como atraso/adiantamento"""
+        if self.learned(key):
+            return max(self.min_tolerance, self.sigmas * self.stats[key].ewm_std())
+        return self.default_tolerance
+
+    def update(self, key, value):
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RunningStats(self.alpha)
+        stats.update(value)
+
+    def save(self, path):
+        """Grava as estatísticas (arquivo temporário + rename)"""
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({key: stats.to_dict() for key, stats in self.stats.items()}, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        """Carrega estatísticas de sessões anteriores, se existirem"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        self.stats = {key: RunningStats.from_dict(values, self.alpha) for key, values in data.items()}
@@ -0,0 +1,133 @@
+import cv2
+import numpy as np
+
+# Cor de desenho (BGR) de cada cor de cubo
+COLOR_BGR = {
+    'white': (255, 255, 255),
+    'yellow': (0, 255, 255),
+    'red': (0, 0, 255),
+    'orange': (0, 165, 255),
+    'blue': (255, 0, 0),
+    'green': (0, 255, 0),
+    'unknown': (128, 128, 128)
+}
+
+
+class OverlaySprite:
+    def __init__(self):
+        """Textos e contornos pré-renderizados; só são redesenhados quando o conteúdo muda"""
+        self.key = None
+        self.image = None
+        self.inverse_alpha = None
+        self.offset = (0, 0)  # posição do canto da imagem em relação à origem do blit
+        self.rebuilds = 0
+
+    def update(self, texts, rects=()):
+        """texts: [(texto, (x, y), escala, cor, espessura)]; rects: [((x1, y1), (x2, y2), cor, espessura)]
+
+        Coordenadas relativas à origem do blit. Retorna True se o sprite foi refeito.
+        """
+        key = (tuple(texts), tuple(rects))
+        if key == self.key:
+            return False
+        self.key = key
+        self.rebuilds += 1
+
+        # Limites de tudo que será desenhado (espessura como folga)
+        left, top, right, bottom = [], [], [], []
+        for (x1, y1), (x2, y2), _, thickness in rects:
+            left.append(x1 - thickness)
+            top.append(y1 - thickness)
+            right.append(x2 + thickness)
+            bottom.append(y2 + thickness)
+        for text, (x, y), scale, _, thickness in texts:
+            (width, height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+            left.append(x - thickness)
+            top.append(y - height - thickness)
+            right.append(x + width + thickness)
+            bottom.append(y + baseline + thickness)
+
+        if not left:
+            self.image = self.inverse_alpha = None
+            return True
+
+        x0, y0 = min(left), min(top)
+        self.offset = (x0, y0)
+        shape = (max(bottom) - y0 + 1, max(right) - x0 + 1)
+        self.image = np.zeros((*shape, 3), dtype=np.uint8)
+        mask = np.zeros(shape, dtype=np.uint8)
+
+        # Mesma ordem de desenho do overlay original: contornos e depois textos.
+        # Sobre fundo preto a imagem já sai multiplicada pela cobertura (antialiasing),
+        # e a máscara guarda essa cobertura (0-255)
+        for (x1, y1), (x2, y2), color, thickness in rects:
+            for canvas, value in ((self.image, color), (mask, 255)):
+                cv2.rectangle(canvas, (x1 - x0, y1 - y0), (x2 - x0, y2 - y0), value, thickness)
+        for text, (x, y), scale, color, thickness in texts:
+            for canvas, value in ((self.image, color), (mask, 255)):
+                cv2.putText(canvas, text, (x - x0, y - y0), cv2.FONT_HERSHEY_SIMPLEX, scale, value, thickness)
+
+        # Quanto do fundo sobra em cada pixel (255 = intocado)
+        self.inverse_alpha = cv2.cvtColor(255 - mask, cv2.COLOR_GRAY2BGR)
+        return True
+
+    def blit(self, frame, origin=(0, 0)):
+        """Mistura o sprite no frame, só na região que ele ocupa (recortando nas bordas)"""
+        if self.image is None:
+            return
+        x = origin[0] + self.offset[0]
+        y = origin[1] + self.offset[1]
+        h, w = self.image.shape[:2]
+
+        fx1, fy1 = max(x, 0), max(y, 0)
+        fx2, fy2 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+        if fx1 >= fx2 or fy1 >= fy2:
+            return
+        sx1, sy1 = fx1 - x, fy1 - y
+        sx2, sy2 = sx1 + (fx2 - fx1), sy1 + (fy2 - fy1)
+
+        # fundo * (1 - cobertura) + cor já multiplicada pela cobertura
+        roi = frame[fy1:fy2, fx1:fx2]
+        cv2.multiply(roi, self.inverse_alpha[sy1:sy2, sx1:sx2], dst=roi, scale=1 / 255)
+        cv2.add(roi, self.image[sy1:sy2, sx1:sx2], dst=roi)
+
+
+class TimePanel:
+    def __init__(self, width=300, height=200, margin=20, top=20):
+        """Bloco de tempos totais por cor (canto superior direito) com fundo escurecido"""
+        self.width = width
+        self.height = height
+        self.margin = margin  # distância da borda direita
+        self.top = top
+        self.sprite = OverlaySprite()
+        self.black = None
+
+    def draw(self, frame, color_total_times):
+        if not color_total_times:
+            return
+
+        block_x = frame.shape[1] - self.width - self.margin
+        block_y = self.top
+
+        # Fundo: escurece apenas a região do bloco (70% preto), não o frame inteiro
+        x1, y1 = max(block_x, 0), max(block_y, 0)
+        x2 = min(block_x + self.width + 1, frame.shape[1])
+        y2 = min(block_y + self.height + 1, frame.shape[0])
+        if x1 < x2 and y1 < y2:
+            roi = frame[y1:y2, x1:x2]
+            if self.black is None or self.black.shape != roi.shape:
+                self.black = np.zeros_like(roi)
+            cv2.addWeighted(self.black, 0.7, roi, 0.3, 0, dst=roi)
+
+        # Borda, título e uma linha por cor, relativos ao canto do bloco
+        title_y = 25
+        texts = [("TEMPOS TOTAIS POR COR", (10, title_y), 0.6, (255, 255, 255), 2)]
+        y_offset = title_y + 30
+        for color, total_time in color_total_times.items():
+            texts.append((f"{color.upper()}: {total_time:.1f}s", (15, y_offset), 0.5,
+                          COLOR_BGR.get(color, (255, 255, 255)), 2))
+            y_offset += 25
+        rects = [((0, 0), (self.width, self.height), (255, 255, 255), 2)]
+
+        self.sprite.update(texts, rects)
+        self.sprite.blit(frame, (block_x, block_y))
@@ -0,0 +1,148 @@
+import bisect
+import json
+import time
+
+import numpy as np
+
+# Limites (ms) dos baldes do histograma acumulado - escala aproximadamente logarítmica
+HISTOGRAM_BOUNDS_MS = [
+    0.1, 0.2, 0.5, 1, 2, 3, 5, 7, 10, 15, 20, 30, 40, 50, 70,
+    100, 150, 200, 300, 500, 1000, 2000, 5000
+]
+
+
+class StageStats:
+    def __init__(self, name, window=512):
+        """Acumula tempos de um estágio de processamento (latência, percentis e FPS)"""
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+        # Instantes da primeira e da última amostra, para calcular o FPS
+        self.first_time = None
+        self.last_time = None
+
+        # Janela circular pré-alocada com as últimas durações (percentis móveis)
+        self.window = np.zeros(window, dtype=np.float64)
+
+        # Histograma de toda a sessão
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, duration, now=None):
+        """Registra a duração (em segundos) de uma execução do estágio"""
+        if now is None:
+            now = time.perf_counter()
+        if self.first_time is None:
+            self.first_time = now
+        self.last_time = now
+
+        self.window[self.count % self.window.size] = duration
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, duration * 1000)] += 1
+
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def fps(self):
+        """Execuções por segundo entre a primeira e a última amostra"""
+        if self.count < 2 or self.last_time == self.first_time:
+            return 0.0
+        return (self.count - 1) / (self.last_time - self.first_time)
+
+    def mean_ms(self):
+        """Latência média em milissegundos"""
+        return self.total_time / self.count * 1000 if self.count else 0.0
+
+    def percentiles_ms(self):
+        """p50/p95/p99 (ms) das últimas amostras da janela"""
+        samples = self.window[:min(self.count, self.window.size)]
+        if samples.size == 0:
+            return 0.0, 0.0, 0.0
+        p50, p95, p99 = np.percentile(samples, (50, 95, 99)) * 1000
+        return float(p50), float(p95), float(p99)
+
+    def summary(self):
+        """Retorna um resumo do estágio"""
+        p50, p95, p99 = self.percentiles_ms()
+        return {
+            'stage': self.name,
+            'count': self.count,
+            'fps': self.fps(),
+            'mean_ms': self.mean_ms(),
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'max_ms': self.max_time * 1000
+        }
+
+
+class PerfMonitor:
+    def __init__(self, window=512):
+        """Conjunto de estágios medidos no caminho quente de cada frame"""
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+
+        # Cache das linhas do overlay (percentis não precisam ser recalculados todo frame)
+        self.overlay_interval = 0.5
+        self._overlay_cache = []
+        self._overlay_time = 0.0
+
+    def stage(self, name):
+        """Retorna (criando se preciso) as estatísticas de um estágio"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name, self.window)
+        return stats
+
+    def record(self, name, duration, now=None):
+        """Registra a duração (s) de um estágio"""
+        self.stage(name).add(duration, now)
+
+    def count(self, name, amount=1):
+        """Incrementa um contador simples (ex.: frames pulados)"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def overlay_lines(self):
+        """Linhas de texto com os percentis de cada estágio para o overlay"""
+        now = time.perf_counter()
+        if now - self._overlay_time >= self.overlay_interval:
+            lines = []
+            for stats in list(self.stages.values()):
+                p50, p95, p99 = stats.percentiles_ms()
+                lines.append(f"{stats.name:<12} p50 {p50:6.1f} | p95 {p95:6.1f} | p99 {p99:6.1f} ms")
+            self._overlay_cache = lines
+            self._overlay_time = now
+        return self._overlay_cache
+
+    def to_dict(self):
+        """Resumo completo (incluindo histogramas) para salvar em JSON"""
+        return {
+            'histogram_bounds_ms': HISTOGRAM_BOUNDS_MS,
+            'stages': {
+                name: dict(stats.summary(), histogram=list(stats.histogram))
+                for name, stats in list(self.stages.items())
+            },
+            'counters': dict(self.counters)
+        }
+
+    def dump(self, path):
+        """Salva o resumo de desempenho em JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+def format_stats(stats):
+    """Formata o resumo de vários estágios para o terminal"""
+    lines = ["\n=== DESEMPENHO POR ESTÁGIO ==="]
+    for stage in stats:
+        info = stage.summary()
+        lines.append(
+            f"{info['stage']:<13} {info['count']:>6} amostras | "
+            f"{info['fps']:6.1f} FPS | média {info['mean_ms']:7.2f}ms | "
+            f"p50 {info['p50_ms']:7.2f} | p95 {info['p95_ms']:7.2f} | "
+            f"p99 {info['p99_ms']:7.2f} | máx {info['max_ms']:7.2f}ms"
+        )
+    lines.append("=" * 50)
+    return "\n".join(lines)
@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+
+
+def put_drop_oldest(q, item):
+    """Coloca item na fila; se estiver cheia descarta o mais antigo. Retorna quantos foram descartados"""
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class CubePipeline:
+    def __init__(self, cap, detector, queue_size=1, lock=None):
+        """Pipeline captura -> inferência -> renderização ligado por filas limitadas
+
+        lock: lock que protege o detector; passe um existente para compartilhá-lo (ex.: servidor HTTP).
+        """
+        self.cap = cap
+        self.detector = detector
+
+        # Filas pequenas: o tracker sempre recebe o frame mais recente
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+
+        # Protege o estado do detector/logger entre inferência e renderização
+        self.lock = lock if lock is not None else threading.Lock()
+        self.stop_event = threading.Event()
+
+        # Tempos de cada estágio vão para o mesmo monitor do detector
+        self.perf = detector.perf
+        self.dropped_frames = 0
+        self.dropped_results = 0
+
+    def _capture_loop(self):
+        """Lê frames da câmera continuamente para não acumular frames velhos no buffer"""
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                self.stop_event.set()
+                break
+
+            captured_at = time.time()
+            captured_perf = time.perf_counter()
+            self.perf.record('captura', captured_perf - start, captured_perf)
+
+            self.dropped_frames += put_drop_oldest(self.frames, (frame, captured_at, captured_perf))
+
+    def _inference_loop(self):
+        """Roda detecção e tracking sempre no frame mais recente"""
+        while True:
+            try:
+                frame, captured_at, captured_perf = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    break
+                continue
+
+            start = time.perf_counter()
+            with self.lock:
+                # O tempo de tracking é o instante da captura, não o da inferência
+                detections = self.detector.detect_cubes(frame, captured_at)
+            end = time.perf_counter()
+            self.perf.record('inferencia', end - start, end)
+
+            result = (frame, detections, captured_at, captured_perf)
+            self.dropped_results += put_drop_oldest(self.results, result)
+
+    def run(self, render):
+        """Executa o pipeline; render(frame, detections, current_time) roda na thread principal e retorna False para sair"""
+        inference = threading.Thread(target=self._inference_loop, name='inferencia', daemon=True)
+        workers = [
+            threading.Thread(target=self._capture_loop, name='captura', daemon=True),
+            inference
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                try:
+                    frame, detections, captured_at, captured_perf = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    # Captura terminou e a inferência já processou o que restava
+                    if not inference.is_alive():
+                        break
+                    continue
+
+                start = time.perf_counter()
+                keep_running = render(frame, detections, captured_at)
+                end = time.perf_counter()
+                self.perf.record('render', end - start, end)
+                self.perf.record('ponta-a-ponta', end - captured_perf, end)
+
+                if not keep_running:
+                    break
+        finally:
+            self.stop_event.set()
+            for worker in workers:
+                worker.join(timeout=2.0)
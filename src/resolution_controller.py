@@ -0,0 +1,77 @@
+# Tamanhos de entrada do YOLO (múltiplos do stride 32), do menor para o maior
+IMAGE_SIZES = (320, 384, 448, 512, 576, 640)
+
+
+class ResolutionController:
+    def __init__(self, target_fps=30, max_imgsz=640, sizes=IMAGE_SIZES, inference_share=0.7,
+                 smoothing=0.1, cooldown=15, headroom=0.8):
+        """Ajusta o tamanho de entrada do YOLO para a inferência caber no orçamento do frame
+
+        O orçamento do YOLO é uma fração (inference_share) do tempo de frame alvo; o resto fica
+        para cor, tracking e desenho. A latência é suavizada (EWMA) e o tamanho só muda a cada
+        `cooldown` inferências. Para baixar, pula direto para o maior tamanho que deve caber;
+        para subir, vai um passo por vez e só com folga (headroom), evitando oscilar.
+        """
+        self.budget = inference_share / target_fps  # segundos de YOLO por frame
+        self.sizes = [size for size in sorted(sizes) if size <= max_imgsz] or [max_imgsz]
+        self.index = len(self.sizes) - 1  # começa na resolução máxima
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self.headroom = headroom
+
+        self.latency = None  # EWMA da inferência no tamanho atual (s)
+        self.since_change = 0
+        self.changes = 0
+        self.frames_by_size = {size: 0 for size in self.sizes}
+
+    @property
+    def imgsz(self):
+        return self.sizes[self.index]
+
+    def estimate(self, size):
+        """Latência esperada em outro tamanho (o custo cresce com o número de pixels)"""
+        return self.latency * (size / self.imgsz) ** 2
+
+    def update(self, inference_time):
+        """Registra uma inferência no tamanho atual e escolhe o tamanho da próxima"""
+        self.frames_by_size[self.imgsz] += 1
+        if self.latency is None:
+            self.latency = inference_time
+        else:
+            self.latency += self.smoothing * (inference_time - self.latency)
+
+        self.since_change += 1
+        if self.since_change < self.cooldown:
+            return
+
+        if self.latency > self.budget and self.index > 0:
+            # Estourou: maior tamanho que cabe no orçamento (ou o menor de todos)
+            fits = [i for i in range(self.index) if self.estimate(self.sizes[i]) <= self.budget * self.headroom]
+            self._change(fits[-1] if fits else 0)
+        elif self.index < len(self.sizes) - 1:
+            # Sobrou tempo: um passo acima, se ainda couber com folga
+            if self.estimate(self.sizes[self.index + 1]) <= self.budget * self.headroom:
+                self._change(self.index + 1)
+
+    def _change(self, index):
+        self.latency = self.estimate(self.sizes[index])
+        self.index = index
+        self.since_change = 0
+        self.changes += 1
+
+    def to_dict(self):
+        return {
+            'imgsz': self.imgsz,
+            'budget_ms': self.budget * 1000,
+            'latency_ms': self.latency * 1000 if self.latency is not None else None,
+            'changes': self.changes,
+            'frames_by_size': {str(size): frames for size, frames in self.frames_by_size.items()}
+        }
+
+    def summary(self):
+        """Distribuição das inferências por tamanho (ex.: '640: 80%, 512: 20%')"""
+        total = sum(self.frames_by_size.values())
+        if not total:
+            return "-"
+        shares = [(size, frames / total) for size, frames in self.frames_by_size.items() if frames]
+        return ", ".join(f"{size}: {share:.0%}" for size, share in sorted(shares, reverse=True))
@@ -0,0 +1,306 @@
+"""Análise conjunta de várias sessões gravadas (cube_times_*.json / *.jsonl).
+
+Uso:
+    python src/session_analytics.py                    # sessões da pasta atual
+    python src/session_analytics.py pasta1 pasta2 --json relatorio.json
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from cube_time_logger import load_jsonl_groups
+
+COLORS = ('white', 'yellow', 'red', 'orange', 'blue', 'green')
+UNKNOWN_COLOR = len(COLORS)
+COLOR_CODES = {color: code for code, color in enumerate(COLORS)}
+FACES = ('Frente', 'Atras', 'Encima', 'Embaixo', 'Direita', 'Esquerda')
+
+DEFAULT_CACHE = '.analytics_cache'
+CACHE_VERSION = 1
+
+# Registro sem timestamp: NaT do datetime64 convertido para int64
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+
+# Colunas por cubo e por grupo guardadas no cache
+CUBE_COLUMNS = {
+    'cube_color': np.uint8,
+    'cube_face': np.uint8,
+    'cube_time': np.float32,
+    'cube_group': np.int64,       # índice global do grupo (linha nas colunas de grupo)
+    'cube_timestamp': np.int64,   # microssegundos (hora local da estação); MISSING_TIMESTAMP sem horário
+    'cube_file': np.int32
+}
+GROUP_COLUMNS = {
+    'group_number': np.int32,
+    'group_time': np.float32,
+    'group_timestamp': np.int64,
+    'group_file': np.int32
+}
+
+
+def find_session_files(paths):
+    """Lista os arquivos de sessão; se houver .jsonl e .json da mesma sessão, usa o .jsonl"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, 'cube_times_*.json')))
+            files.extend(glob.glob(os.path.join(path, 'cube_times_*.jsonl')))
+        elif os.path.exists(path):
+            files.append(path)
+
+    stems = {os.path.splitext(f)[0] for f in files if f.endswith('.jsonl')}
+    files = [f for f in files if f.endswith('.jsonl') or os.path.splitext(f)[0] not in stems]
+    return sorted(os.path.abspath(f) for f in set(files))
+
+
+def iter_groups(path):
+    """Percorre os grupos de um arquivo de sessão, um arquivo por vez"""
+    if path.endswith('.jsonl'):
+        yield from load_jsonl_groups(path)
+        return
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    yield from document.get('groups_of_three', [])
+
+
+def to_microseconds(timestamps):
+    """Converte timestamps ISO (vetorizado pelo NumPy) para microssegundos (None vira MISSING_TIMESTAMP)"""
+    if not timestamps:
+        return np.empty(0, dtype=np.int64)
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64)
+
+
+def parse_session(path, file_index, first_group):
+    """Lê um arquivo de sessão e devolve suas colunas de cubos e de grupos"""
+    colors, times, cube_groups, cube_stamps = [], [], [], []
+    numbers, group_times, group_stamps = [], [], []
+
+    for group_offset, group in enumerate(iter_groups(path)):
+        numbers.append(group.get('group_number', group_offset + 1))
+        group_times.append(group.get('total_group_time', 0.0))
+        group_stamps.append(group.get('timestamp'))
+        for cube in group.get('cubes', []):
+            colors.append(COLOR_CODES.get(cube.get('color'), UNKNOWN_COLOR))
+            times.append(cube.get('individual_time', 0.0))
+            cube_groups.append(first_group + group_offset)
+            cube_stamps.append(cube.get('timestamp') or group.get('timestamp'))
+
+    color_codes = np.array(colors, dtype=np.uint8)
+    cubes = {
+        'cube_color': color_codes,
+        'cube_face': color_codes.copy(),  # a face é determinada pela cor
+        'cube_time': np.array(times, dtype=np.float32),
+        'cube_group': np.array(cube_groups, dtype=np.int64),
+        'cube_timestamp': to_microseconds(cube_stamps),
+        'cube_file': np.full(len(colors), file_index, dtype=np.int32)
+    }
+    groups = {
+        'group_number': np.array(numbers, dtype=np.int32),
+        'group_time': np.array(group_times, dtype=np.float32),
+        'group_timestamp': to_microseconds(group_stamps),
+        'group_file': np.full(len(numbers), file_index, dtype=np.int32)
+    }
+    return cubes, groups
+
+
+def empty_columns(spec):
+    return {name: np.empty(0, dtype=dtype) for name, dtype in spec.items()}
+
+
+class SessionArchive:
+    def __init__(self, paths, cache_dir=DEFAULT_CACHE):
+        """Colunas de todas as sessões, lidas do cache e completadas com arquivos novos/alterados"""
+        self.cache_dir = cache_dir
+        self.files = find_session_files(paths)
+        self.parsed_files = 0
+        self.columns = self._load()
+
+    def _cache_paths(self):
+        return (os.path.join(self.cache_dir, 'sessions.npz'),
+                os.path.join(self.cache_dir, 'manifest.json'))
+
+    def _load(self):
+        data_path, manifest_path = self._cache_paths()
+        signatures = {}
+        for path in self.files:
+            stat = os.stat(path)
+            signatures[path] = [stat.st_size, stat.st_mtime_ns]
+
+        cached_files, cached = [], None
+        if os.path.exists(data_path) and os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == CACHE_VERSION:
+                cached_files = manifest['files']
+                with np.load(data_path) as npz:
+                    cached = {name: npz[name] for name in npz.files}
+
+        # Tudo igual ao cache: nenhum arquivo precisa ser relido
+        if cached is not None and cached_files == [[p] + signatures[p] for p in self.files]:
+            return cached
+
+        cubes, groups = empty_columns(CUBE_COLUMNS), empty_columns(GROUP_COLUMNS)
+        cube_parts = {name: [] for name in CUBE_COLUMNS}
+        group_parts = {name: [] for name in GROUP_COLUMNS}
+        reusable = {entry[0]: index for index, entry in enumerate(cached_files)
+                    if entry[0] in signatures and entry[1:] == signatures[entry[0]]}
+
+        total_groups = 0
+        for file_index, path in enumerate(self.files):
+            if cached is not None and path in reusable:
+                # Reaproveita as linhas do cache, renumerando arquivo e grupos
+                old_index = reusable[path]
+                group_mask = cached['group_file'] == old_index
+                cube_mask = cached['cube_file'] == old_index
+                old_group_ids = np.flatnonzero(group_mask)
+                file_cubes = {name: cached[name][cube_mask] for name in CUBE_COLUMNS}
+                file_groups = {name: cached[name][group_mask] for name in GROUP_COLUMNS}
+                file_cubes['cube_group'] = np.searchsorted(old_group_ids, file_cubes['cube_group']) + total_groups
+                file_cubes['cube_file'][:] = file_index
+                file_groups['group_file'][:] = file_index
+            else:
+                file_cubes, file_groups = parse_session(path, file_index, total_groups)
+                self.parsed_files += 1
+
+            for name in CUBE_COLUMNS:
+                cube_parts[name].append(file_cubes[name])
+            for name in GROUP_COLUMNS:
+                group_parts[name].append(file_groups[name])
+            total_groups += len(file_groups['group_number'])
+
+        if self.files:
+            cubes = {name: np.concatenate(parts).astype(CUBE_COLUMNS[name]) for name, parts in cube_parts.items()}
+            groups = {name: np.concatenate(parts).astype(GROUP_COLUMNS[name]) for name, parts in group_parts.items()}
+        columns = dict(cubes, **groups)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(data_path, **columns)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION,
+                       'files': [[p] + signatures[p] for p in self.files]}, f)
+        return columns
+
+    def color_percentiles(self, percentiles=(50, 90, 95, 99)):
+        """Percentis do tempo individual por cor (vetorizado: ordena uma vez por cor)"""
+        colors, times = self.columns['cube_color'], self.columns['cube_time']
+        order = np.lexsort((times, colors))
+        sorted_colors, sorted_times = colors[order], times[order]
+        bounds = np.searchsorted(sorted_colors, np.arange(len(COLORS) + 1))
+
+        report = {}
+        for code, color in enumerate(COLORS):
+            values = sorted_times[bounds[code]:bounds[code + 1]]
+            if values.size == 0:
+                continue
+            stats = {'face': FACES[code], 'count': int(values.size), 'mean': float(values.mean())}
+            stats.update({f'p{p}': float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))})
+            report[color] = stats
+        return report
+
+    def hourly_throughput(self):
+        """Cubos por hora: média por hora do dia e pico entre todas as horas do arquivo
+
+        Cubos sem timestamp ficam de fora (contados em missing_timestamps).
+        """
+        stamps = self.columns['cube_timestamp']
+        stamps = stamps[stamps != MISSING_TIMESTAMP]
+        if stamps.size == 0:
+            return {}
+        hour_index = stamps // 3_600_000_000
+        hours, counts = np.unique(hour_index, return_counts=True)
+        hour_of_day = hours % 24
+
+        cubes_per_hour = np.bincount(hour_of_day, weights=counts, minlength=24)
+        active_hours = np.bincount(hour_of_day, minlength=24)
+        report = {}
+        for hour in np.flatnonzero(active_hours):
+            report[f'{hour:02d}h'] = {
+                'mean_cubes_per_hour': float(cubes_per_hour[hour] / active_hours[hour]),
+                'peak_cubes_per_hour': int(counts[hour_of_day == hour].max()),
+                'hours_observed': int(active_hours[hour])
+            }
+        return report
+
+    def missing_timestamps(self):
+        """Cubos sem timestamp (nem no cubo nem no grupo), fora da vazão por hora"""
+        return int(np.count_nonzero(self.columns['cube_timestamp'] == MISSING_TIMESTAMP))
+
+    def group_time_distribution(self, bin_width=5.0):
+        """Histograma e percentis do tempo total dos grupos"""
+        group_times = self.columns['group_time']
+        if group_times.size == 0:
+            return {}
+        upper = max(bin_width, float(np.ceil(group_times.max() / bin_width) * bin_width))
+        counts, edges = np.histogram(group_times, bins=np.arange(0.0, upper + bin_width, bin_width))
+        p50, p90, p95, p99 = np.percentile(group_times, (50, 90, 95, 99))
+        return {
+            'count': int(group_times.size),
+            'mean': float(group_times.mean()),
+            'p50': float(p50), 'p90': float(p90), 'p95': float(p95), 'p99': float(p99),
+            'histogram': [
+                {'from': float(edges[i]), 'to': float(edges[i + 1]), 'groups': int(counts[i])}
+                for i in range(len(counts)) if counts[i]
+            ]
+        }
+
+    def report(self):
+        """Relatório completo em dicionário"""
+        return {
+            'sessions': len(self.files),
+            'total_cubes': int(self.columns['cube_time'].size),
+            'total_groups': int(self.columns['group_time'].size),
+            'per_color': self.color_percentiles(),
+            'hourly_throughput': self.hourly_throughput(),
+            'missing_timestamps': self.missing_timestamps(),
+            'group_time': self.group_time_distribution()
+        }
+
+
+def print_report(report):
+    """Mostra o relatório no terminal"""
+    print("=== ANÁLISE DE SESSÕES ===")
+    print(f"Sessões: {report['sessions']} | Grupos: {report['total_groups']} | Cubos: {report['total_cubes']}\n")
+
+    print("Tempo por cor (s):")
+    for color, stats in report['per_color'].items():
+        print(f"  {color.upper():<7} ({stats['face']:<8}) n={stats['count']:<6} média {stats['mean']:6.2f} | "
+              f"p50 {stats['p50']:6.2f} | p90 {stats['p90']:6.2f} | p95 {stats['p95']:6.2f} | p99 {stats['p99']:6.2f}")
+
+    print("\nCubos por hora do dia:")
+    for hour, stats in report['hourly_throughput'].items():
+        print(f"  {hour}: média {stats['mean_cubes_per_hour']:7.1f} | pico {stats['peak_cubes_per_hour']:5d} "
+              f"({stats['hours_observed']} h observadas)")
+    if report['missing_timestamps']:
+        print(f"  {report['missing_timestamps']} cubos sem timestamp (fora da contagem por hora)")
+
+    group_time = report['group_time']
+    if group_time:
+        print(f"\nTempo dos grupos (s): média {group_time['mean']:.2f} | p50 {group_time['p50']:.2f} | "
+              f"p90 {group_time['p90']:.2f} | p95 {group_time['p95']:.2f} | p99 {group_time['p99']:.2f}")
+        for bucket in group_time['histogram']:
+            print(f"  {bucket['from']:6.1f}-{bucket['to']:6.1f}s: {bucket['groups']}")
+    print("=" * 50)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise conjunta das sessões cube_times_*.json/.jsonl")
+    parser.add_argument('paths', nargs='*', default=['.'], help="pastas ou arquivos de sessão (padrão: pasta atual)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="pasta do cache das colunas já lidas")
+    parser.add_argument('--json', help="salva o relatório neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    archive = SessionArchive(args.paths, args.cache)
+    report = archive.report()
+    print_report(report)
+    print(f"({archive.parsed_files} de {len(archive.files)} arquivos lidos; o resto veio do cache)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
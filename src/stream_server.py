@@ -0,0 +1,159 @@
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+INDEX_PAGE = b"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Detector de Cubos</title></head>
+<body style="margin:0;background:#111;color:#ddd;font-family:sans-serif">
+<img src="/stream" style="max-width:100%">
+<p><a href="/metrics" style="color:#8cf">/metrics</a></p>
+</body></html>
+"""
+
+# Comandos aceitos em POST /control/<comando> (substituem as teclas 'f', 'c' e 'q')
+COMMANDS = ('finalize', 'clip', 'quit')
+
+
+class StreamServer:
+    def __init__(self, host='127.0.0.1', port=8080, jpeg_quality=80, metrics=None):
+        """Servidor HTTP local: stream MJPEG do frame anotado, métricas em JSON e controles
+
+        metrics: função sem argumentos que devolve um dicionário serializável; é chamada
+        segurando self.lock, o mesmo lock que o loop de frames segura ao mexer no detector.
+        """
+        self.jpeg_quality = jpeg_quality
+        self.metrics = metrics
+        self.lock = threading.Lock()
+
+        # Último frame codificado, compartilhado por todos os clientes
+        self.frame_ready = threading.Condition()
+        self.jpeg = None
+        self.sequence = 0
+        self.clients = 0
+        self.frames_encoded = 0
+
+        self.commands = queue.Queue()
+        self.stopped = threading.Event()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='http', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def has_clients(self):
+        return self.clients > 0
+
+    def publish(self, frame):
+        """Codifica o frame uma única vez para todos os clientes (nada a fazer sem clientes)"""
+        if not self.clients:
+            return
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        with self.frame_ready:
+            self.jpeg = encoded.tobytes()
+            self.sequence += 1
+            self.frames_encoded += 1
+            self.frame_ready.notify_all()
+
+    def wait_frame(self, last_sequence, timeout=1.0):
+        """Espera um frame mais novo que last_sequence; retorna (jpeg, sequência) ou (None, last_sequence)"""
+        with self.frame_ready:
+            if self.sequence == last_sequence and not self.stopped.is_set():
+                self.frame_ready.wait(timeout)
+            if self.sequence == last_sequence:
+                return None, last_sequence
+            return self.jpeg, self.sequence
+
+    def poll_commands(self):
+        """Comandos recebidos desde a última chamada (executar na thread do loop de frames)"""
+        commands = []
+        while True:
+            try:
+                commands.append(self.commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # Sem log por requisição no terminal
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/':
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(INDEX_PAGE)))
+                    self.end_headers()
+                    self.wfile.write(INDEX_PAGE)
+                elif self.path == '/stream':
+                    self._stream()
+                elif self.path == '/metrics':
+                    with server.lock:
+                        data = server.metrics() if server.metrics else {}
+                    data['stream'] = {'clients': server.clients, 'frames_encoded': server.frames_encoded}
+                    self._send_json(data)
+                else:
+                    self._send_json({'error': 'não encontrado'}, 404)
+
+            def do_POST(self):
+                command = self.path.rstrip('/').rsplit('/', 1)[-1]
+                if not self.path.startswith('/control/') or command not in COMMANDS:
+                    self._send_json({'error': 'comando desconhecido', 'commands': list(COMMANDS)}, 404)
+                    return
+                server.commands.put(command)
+                self._send_json({'ok': True, 'command': command})
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+
+                with server.frame_ready:
+                    server.clients += 1
+                try:
+                    sequence = 0
+                    while not server.stopped.is_set():
+                        jpeg, sequence = server.wait_frame(sequence)
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode('ascii'))
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server.frame_ready:
+                        server.clients -= 1
+
+        return Handler
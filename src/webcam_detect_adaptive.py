@@ -1,14 +1,55 @@
+import argparse
 import cv2
-from ultralytics import YOLO
+import json
 import numpy as np
+import os
 import time
 from collections import defaultdict
-from cube_time_logger import create_logger
+from cube_time_logger import PERSISTENCE_MODES, create_logger
+from box_propagation import OpticalFlowPropagator
+from cube_tracker import match_boxes
+from event_bus import EVENTS_SOCKET, open_publisher
+from frame_recorder import FrameRecorder
+from frame_sources import CameraProbe, open_replay_source
+from inference_backends import BACKENDS, YoloBackend, load_first_backend
+from model_benchmark import DEFAULT_MIN_MAP, MODEL_MANIFEST, select_model
+from motion_gate import MotionGate
+from multi_camera import MultiCameraService
+from overlay_cache import COLOR_BGR, OverlaySprite, TimePanel
+from perf_stats import PerfMonitor, format_stats
+from pipeline import CubePipeline
+from resolution_controller import ResolutionController
+from stream_server import StreamServer
+
+# Pesos treinados, em ordem de preferência (o primeiro que existir é carregado);
+# usados quando o manifesto do src/model_benchmark.py não indica nenhum modelo
+MODEL_PATHS = [
+    "runs-cube/yolov8n-cube5/weights/best.pt",
+    "runs-cube/yolov8n-cube4/weights/best.pt",
+    "runs-cube/yolov8n-cube3/weights/best.pt"
+]
+
+# Ranges e thresholds gerados por src/color_calibration.py (carregados se existirem)
+CALIBRATION_FILE = "color_calibration.json"
+
+# Ranges alternativos comparados na tecla 't' (e testados pela calibração offline)
+ALT_COLOR_RANGES = {
+    'white_alt1': ([0, 0, 180], [180, 30, 255]),
+    'white_alt2': ([0, 0, 200], [180, 50, 255]),
+    'white_alt3': ([0, 0, 160], [180, 60, 255]),
+    'blue_alt1': ([100, 60, 60], [130, 255, 255]),
+    'blue_alt2': ([100, 80, 80], [130, 255, 255]),
+    'blue_alt3': ([95, 50, 50], [135, 255, 255])
+}
 
 class CubeDetector:
-    def __init__(self, model_path):
-        """Inicializa o detector de cubos com tracking por cor"""
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, backend='pytorch', int8=False, calibration_file=CALIBRATION_FILE):
+        """Inicializa o detector de cubos com tracking por cor (model_path=None não carrega modelo)
+        
+        calibration_file: ranges/thresholds calibrados offline; None usa só os valores abaixo.
+        """
+        # Backend de inferência escolhido na inicialização (pytorch, onnx, openvino)
+        self.backend = YoloBackend(model_path, backend, int8) if model_path else None
         self.confidence = 0.5
         
         # Mapeamento de cores para faces do cubo magico
@@ -32,18 +73,44 @@ class CubeDetector:
             'green': ([40, 100, 100], [80, 255, 255])
         }
         
-        # Sistema de tracking por cor - cada cor e um cubo diferente
-        self.active_cubes_by_color = {}  # {color: cube_data}
+        # Thresholds especificos por cor para melhor deteccao
+        self.color_thresholds = {
+            'white': 0.03,  # Threshold mais baixo para branco
+            'blue': 0.04,   # Threshold mais baixo para azul
+            'red': 0.05,
+            'orange': 0.05,
+            'yellow': 0.05,
+            'green': 0.05
+        }
+        
+        # Ranges/thresholds calibrados substituem os padrões acima
+        self.calibration_file = None
+        if calibration_file:
+            self.load_color_calibration(calibration_file)
+        
+        # Tabelas de consulta HSV -> cor (recalcular se color_ranges mudar)
+        self.build_color_lut()
+        
+        # Tracking por associacao de bboxes (IoU + distancia), varios cubos da mesma cor
+        self.active_cubes = {}  # {cube_id: cube_data}
         self.cube_history = []  # Historico de cubos que sairam
         self.color_total_times = defaultdict(float)  # Tempo total por cor
+        self.next_cube_number = 1
         
         # Parametros de tracking
-        self.max_distance_threshold = 120
+        self.max_distance_threshold = 120  # Distancia maxima (px) entre centroides para associar
+        self.min_iou = 0.1  # ...ou sobreposicao minima
+        self.max_missed_frames = 5  # Frames sem deteccao antes de o cubo contar como saido
+        self.min_hits = 3  # Deteccoes minimas para o cubo ir para o logger (descarta fragmentos)
         self.color_confidence_threshold = 0.15  # Reduzido para melhor deteccao
-        self.max_cubes_simultaneous = 6  # Uma para cada cor
         
         # Historico de cores para estabilizacao
-        self.color_detection_history = {}  # {color: [detected_colors_list]}
+        self.color_detection_history = {}  # {cube_id: [detected_colors_list]}
+        
+        # Cache de cor por cubo: com a cor estavel e a bbox parada, nao reclassifica
+        self.color_recheck_interval = 10  # Reclassifica pelo menos a cada K frames
+        self.color_cache_max_shift = 8  # Deslocamento (px) do centro que invalida o cache
+        self.color_cache_max_change = 20  # Mudanca na cor media (0-255) que invalida o cache
         
         # Parametros de estabilizacao
         self.min_color_samples = 2  # Reduzido para resposta mais rapida
@@ -53,74 +120,177 @@ class CubeDetector:
         # Debug - mostra informacoes de deteccao
         self.debug_mode = True
         
-    def detect_cube_color(self, frame, bbox):
-        """Detecta a cor dominante do cubo com filtros de ruído melhorados"""
-        x1, y1, x2, y2 = bbox
+        # Cadencia de deteccao: YOLO a cada N frames, bboxes propagadas entre eles
+        self.detect_interval = 1  # 1 = YOLO em todo frame
+        self.adaptive_interval = False  # Ajusta N pelo movimento medido e pela carga
+        self.max_detect_interval = 6
+        self.max_propagation_drift = 12  # Deriva maxima (px) aceita entre deteccoes
+        self.frame_budget = 1 / 30  # Tempo de frame alvo (s)
+        self.frames_since_detection = 0
+        self.propagator = OpticalFlowPropagator()
         
-        # Extrai região do cubo
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
-            return 'unknown', 0.0
+        # Resolução do YOLO ajustada à carga (ResolutionController); None = imgsz fixo do backend
+        self.resolution = None
+        
+        # Gate de movimento: pula o YOLO com a cena parada (None = desligado)
+        self.motion_gate = None
+        self.last_boxes = []
+        
+        # Tempos por estagio (yolo, cor, tracking, desenho...) com percentis moveis
+        self.perf = PerfMonitor()
+        self.show_perf = False  # Overlay de desempenho (tecla 'p')
+        
+        # Overlays pré-renderizados, refeitos só quando o conteúdo muda
+        self.time_panel = TimePanel()
+        self.info_sprite = OverlaySprite()
+        self.perf_sprite = OverlaySprite()
+        
+        # Instante (perf_counter) do início do programa; zerado após o primeiro frame anotado
+        self.started_at = None
+        
+        # Gravador dos últimos segundos de vídeo (--record-seconds); None = desligado
+        self.recorder = None
+        # Frame onde o overlay é desenhado quando o frame lido é um slot do gravador (alocado uma vez)
+        self.display = None
+        
+        # Eventos binários de entrada/saída (EventPublisher, --events); None = desligado
+        self.events = None
+        
+    def load_color_calibration(self, path):
+        """Lê ranges e thresholds de um arquivo de calibração; retorna False se ele não existir
         
-        # Aplica filtro gaussiano para reduzir ruído
-        roi_blurred = cv2.GaussianBlur(roi, (5, 5), 0)
+        Chame build_color_lut() depois se o detector já estiver em uso.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r', encoding='utf-8') as f:
+            calibration = json.load(f)
+        self.color_ranges = {name: (list(lower), list(upper))
+                             for name, (lower, upper) in calibration['color_ranges'].items()}
+        self.color_thresholds.update(calibration.get('color_thresholds', {}))
+        self.calibration_file = path
+        return True
+    
+    def build_color_lut(self):
+        """Pré-calcula as tabelas de consulta HSV -> cor a partir de self.color_ranges"""
+        # Cada range recebe um bit; como os ranges são caixas em H, S e V,
+        # basta uma tabela de 256 entradas por canal e um AND entre os canais
+        range_names = list(self.color_ranges)
+        if len(range_names) > 8:
+            raise ValueError("color_ranges suporta no máximo 8 ranges (1 bit cada)")
+        channel_lut = np.zeros((1, 256, 3), dtype=np.uint8)
+        values = np.arange(256)
+        for bit, name in enumerate(range_names):
+            lower, upper = self.color_ranges[name]
+            for channel in range(3):
+                inside = (values >= lower[channel]) & (values <= upper[channel])
+                channel_lut[0, inside, channel] |= np.uint8(1 << bit)
+        self.hsv_channel_lut = channel_lut
+        
+        # Converte bits de range em bits de cor (red2 soma no vermelho)
+        self.lut_colors = [name for name in range_names if name != 'red2']
+        range_to_color = np.zeros(256, dtype=np.uint8)
+        for code in range(1 << len(range_names)):
+            color_code = 0
+            for bit, name in enumerate(range_names):
+                if code & (1 << bit):
+                    color_name = 'red' if name == 'red2' else name
+                    color_code |= 1 << self.lut_colors.index(color_name)
+            range_to_color[code] = color_code
+        self.range_to_color_lut = range_to_color
         
-        # Converte para HSV
-        hsv = cv2.cvtColor(roi_blurred, cv2.COLOR_BGR2HSV)
+        # Matriz código -> cores presentes, usada depois do bincount
+        self.color_code_count = 1 << len(self.lut_colors)
+        codes = np.arange(self.color_code_count)[:, None]
+        bits = 1 << np.arange(len(self.lut_colors))[None, :]
+        self.color_code_membership = ((codes & bits) > 0).astype(np.int64)
+    
+    def _morph_bits(self, codes, erode):
+        """Erosão/dilatação 3x3 aplicada em cada bit de cor ao mesmo tempo"""
+        # Borda neutra igual à do OpenCV: 0xFF na erosão, 0 na dilatação
+        padded = np.pad(codes, 1, constant_values=0xFF if erode else 0)
+        combine = np.bitwise_and if erode else np.bitwise_or
+        rows = combine(combine(padded[:-2], padded[1:-1]), padded[2:])
+        return combine(combine(rows[:, :-2], rows[:, 1:-1]), rows[:, 2:])
+    
+    def _center_rect(self, frame, bbox):
+        """Retorna a região central da bbox (coordenadas do frame) usada na análise de cor"""
+        frame_h, frame_w = frame.shape[:2]
+        x1, y1, x2, y2 = bbox
+        # Mesmos limites do recorte frame[y1:y2, x1:x2] original: coordenada negativa conta
+        # do fim do frame (uma bbox que começa fora dele fica vazia e a cor é 'unknown')
+        x1, x2, _ = slice(x1, x2).indices(frame_w)
+        y1, y2, _ = slice(y1, y2).indices(frame_h)
         
         # Pega região central (maior área para melhor análise)
-        h, w = hsv.shape[:2]
+        h, w = y2 - y1, x2 - x1
         center_h, center_w = h // 2, w // 2
         center_size = min(h, w) // 2  # Aumentado para melhor detecção
         
-        center_roi = hsv[
-            max(0, center_h - center_size//2):min(h, center_h + center_size//2),
-            max(0, center_w - center_size//2):min(w, center_w + center_size//2)
-        ]
+        cx1 = x1 + max(0, center_w - center_size//2)
+        cy1 = y1 + max(0, center_h - center_size//2)
+        cx2 = x1 + min(w, center_w + center_size//2)
+        cy2 = y1 + min(h, center_h + center_size//2)
         
-        if center_roi.size == 0:
-            return 'unknown', 0.0
+        if cx2 <= cx1 or cy2 <= cy1:
+            return None
+        return cx1, cy1, cx2, cy2
+    
+    def prepare_frame_hsv(self, frame, bboxes):
+        """Aplica blur e conversão HSV uma única vez na união das regiões das detecções"""
+        rects = [rect for rect in (self._center_rect(frame, bbox) for bbox in bboxes) if rect]
+        if not rects:
+            return None
+        
+        # Margem do kernel 5x5 para o blur ver os mesmos vizinhos de antes
+        margin = 2
+        frame_h, frame_w = frame.shape[:2]
+        x0 = max(0, min(rect[0] for rect in rects) - margin)
+        y0 = max(0, min(rect[1] for rect in rects) - margin)
+        x1 = min(frame_w, max(rect[2] for rect in rects) + margin)
+        y1 = min(frame_h, max(rect[3] for rect in rects) + margin)
         
-        # Aplica morfologia para limpar a máscara
-        kernel = np.ones((3,3), np.uint8)
+        # Aplica filtro gaussiano para reduzir ruído e converte para HSV
+        region_blurred = cv2.GaussianBlur(frame[y0:y1, x0:x1], (5, 5), 0)
+        hsv = cv2.cvtColor(region_blurred, cv2.COLOR_BGR2HSV)
+        return hsv, (x0, y0)
+    
+    def _center_hsv(self, frame, bbox, frame_hsv=None):
+        """Retorna uma view HSV (sem cópia) da região central da bbox"""
+        rect = self._center_rect(frame, bbox)
+        if rect is None:
+            return None
         
-        # Testa cada cor com filtros melhorados
-        color_scores = {}
+        if frame_hsv is None:
+            frame_hsv = self.prepare_frame_hsv(frame, [bbox])
+        hsv, (offset_x, offset_y) = frame_hsv
         
-        for color_name, (lower, upper) in self.color_ranges.items():
-            if color_name == 'red2':
-                continue
-                
-            lower = np.array(lower, dtype=np.uint8)
-            upper = np.array(upper, dtype=np.uint8)
-            
-            mask = cv2.inRange(center_roi, lower, upper)
-            # Aplica operações morfológicas para limpar ruído
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-            
-            total_pixels = mask.size
-            color_pixels = np.sum(mask > 0)
-            percentage = color_pixels / total_pixels if total_pixels > 0 else 0
-            
-            color_scores[color_name] = percentage
+        cx1, cy1, cx2, cy2 = rect
+        return hsv[cy1 - offset_y:cy2 - offset_y, cx1 - offset_x:cx2 - offset_x]
+    
+    def detect_cube_color(self, frame, bbox, frame_hsv=None):
+        """Detecta a cor dominante do cubo com filtros de ruído melhorados"""
+        # Usa o HSV já preparado para o frame, se disponível
+        center_roi = self._center_hsv(frame, bbox, frame_hsv)
+        
+        if center_roi is None or center_roi.size == 0:
+            return 'unknown', 0.0
+        
+        # Rotula todos os pixels de uma vez pela tabela HSV -> bits de cor
+        codes = cv2.LUT(center_roi, self.hsv_channel_lut)
+        codes = codes[:, :, 0] & codes[:, :, 1] & codes[:, :, 2]
+        codes = self.range_to_color_lut[codes]
         
-        # Trata vermelho especial - combina dois ranges
-        red_lower1 = np.array(self.color_ranges['red'][0], dtype=np.uint8)
-        red_upper1 = np.array(self.color_ranges['red'][1], dtype=np.uint8)
-        red_lower2 = np.array(self.color_ranges['red2'][0], dtype=np.uint8)
-        red_upper2 = np.array(self.color_ranges['red2'][1], dtype=np.uint8)
+        # Mesma limpeza morfológica de antes (fechamento + abertura 3x3), bit a bit
+        codes = self._morph_bits(self._morph_bits(codes, False), True)
+        codes = self._morph_bits(self._morph_bits(codes, True), False)
         
-        mask1 = cv2.inRange(center_roi, red_lower1, red_upper1)
-        mask2 = cv2.inRange(center_roi, red_lower2, red_upper2)
-        red_mask = cv2.bitwise_or(mask1, mask2)
-        # Aplica morfologia também no vermelho
-        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_CLOSE, kernel)
-        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
+        # Um único bincount devolve a pontuação de todas as cores
+        code_counts = np.bincount(codes.ravel(), minlength=self.color_code_count)
+        color_pixels = code_counts @ self.color_code_membership
+        percentages = color_pixels / codes.size
         
-        total_pixels = red_mask.size
-        red_pixels = np.sum(red_mask > 0)
-        color_scores['red'] = red_pixels / total_pixels if total_pixels > 0 else 0
+        color_scores = dict(zip(self.lut_colors, percentages.tolist()))
         
         # Encontra melhor cor
         if not color_scores:
@@ -131,17 +301,7 @@ class CubeDetector:
         
         # Debug - mostra informações de detecção (removido para limpar terminal)
         
-        # Thresholds específicos por cor para melhor detecção
-        color_thresholds = {
-            'white': 0.03,  # Threshold mais baixo para branco
-            'blue': 0.04,   # Threshold mais baixo para azul
-            'red': 0.05,
-            'orange': 0.05,
-            'yellow': 0.05,
-            'green': 0.05
-        }
-        
-        min_threshold = color_thresholds.get(best_color, 0.05)
+        min_threshold = self.color_thresholds.get(best_color, 0.05)
         
         if confidence < min_threshold:
             return 'unknown', confidence
@@ -149,104 +309,29 @@ class CubeDetector:
         return best_color, confidence
     
     def test_color_ranges(self, frame, bbox):
-        """Função de teste para analisar diferentes ranges de cores"""
-        x1, y1, x2, y2 = bbox
-        roi = frame[y1:y2, x1:x2]
-        if roi.size == 0:
-            return
+        """Função de teste para analisar diferentes ranges de cores
         
-        roi_blurred = cv2.GaussianBlur(roi, (5, 5), 0)
-        hsv = cv2.cvtColor(roi_blurred, cv2.COLOR_BGR2HSV)
-        
-        h, w = hsv.shape[:2]
-        center_h, center_w = h // 2, w // 2
-        center_size = min(h, w) // 2
-        
-        center_roi = hsv[
-            max(0, center_h - center_size//2):min(h, center_h + center_size//2),
-            max(0, center_w - center_size//2):min(w, center_w + center_size//2)
-        ]
-        
-        if center_roi.size == 0:
-            return
-        
-        # Testa ranges alternativos para azul e branco
-        test_ranges = {
-            'white_alt1': ([0, 0, 180], [180, 30, 255]),
-            'white_alt2': ([0, 0, 200], [180, 50, 255]),
-            'white_alt3': ([0, 0, 160], [180, 60, 255]),
-            'blue_alt1': ([100, 60, 60], [130, 255, 255]),
-            'blue_alt2': ([100, 80, 80], [130, 255, 255]),
-            'blue_alt3': ([95, 50, 50], [135, 255, 255])
-        }
+        Retorna {range: fração dos pixels dentro dele} para os ranges alternativos de azul e branco.
+        """
+        center_roi = self._center_hsv(frame, bbox)
+        if center_roi is None:
+            return {}
         
         # Teste de ranges de cores (removido para limpar terminal)
-        for name, (lower, upper) in test_ranges.items():
+        results = {}
+        for name, (lower, upper) in ALT_COLOR_RANGES.items():
             lower = np.array(lower, dtype=np.uint8)
             upper = np.array(upper, dtype=np.uint8)
             mask = cv2.inRange(center_roi, lower, upper)
             total_pixels = mask.size
             color_pixels = np.sum(mask > 0)
-            percentage = color_pixels / total_pixels if total_pixels > 0 else 0
+            results[name] = float(color_pixels / total_pixels) if total_pixels > 0 else 0.0
+        return results
     
     def draw_time_block(self, frame, detector):
         """Desenha um bloco visual destacado com os tempos totais por cor"""
-        if not detector.color_total_times:
-            return
-        
-        # Dimensões do bloco
-        block_width = 300
-        block_height = 200
-        block_x = frame.shape[1] - block_width - 20  # 20px da borda direita
-        block_y = 20  # 20px do topo
-        
-        # Desenha fundo do bloco com transparência
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (block_x, block_y), (block_x + block_width, block_y + block_height), 
-                     (0, 0, 0), -1)  # Fundo preto
-        cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
-        
-        # Borda do bloco
-        cv2.rectangle(frame, (block_x, block_y), (block_x + block_width, block_y + block_height), 
-                     (255, 255, 255), 2)
-        
-        # Título do bloco
-        title_y = block_y + 25
-        cv2.putText(frame, "TEMPOS TOTAIS POR COR", (block_x + 10, title_y),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        # Cores para cada linha
-        color_colors = {
-            'white': (255, 255, 255),
-            'yellow': (0, 255, 255),
-            'red': (0, 0, 255),
-            'orange': (0, 165, 255),
-            'blue': (255, 0, 0),
-            'green': (0, 255, 0)
-        }
-        
-        # Desenha cada cor com seu tempo total
-        y_offset = title_y + 30
-        for color, total_time in detector.color_total_times.items():
-            face_name = detector.color_mapping.get(color, 'Desconhecida')
-            text = f"{color.upper()}: {total_time:.1f}s"
-            
-            # Cor do texto baseada na cor do cubo
-            text_color = color_colors.get(color, (255, 255, 255))
-            
-            cv2.putText(frame, text, (block_x + 15, y_offset),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 2)
-            y_offset += 25
-    
-    def calculate_distance(self, bbox1, bbox2):
-        """Calcula distância entre centroides de duas bounding boxes"""
-        x1_1, y1_1, x2_1, y2_1 = bbox1
-        x1_2, y1_2, x2_2, y2_2 = bbox2
-        
-        center1 = ((x1_1 + x2_1) // 2, (y1_1 + y2_1) // 2)
-        center2 = ((x1_2 + x2_2) // 2, (y1_2 + y2_2) // 2)
-        
-        return np.sqrt((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)
+        # Fundo escurecido só na região do bloco; textos vêm de um sprite em cache
+        detector.time_panel.draw(frame, detector.color_total_times)
     
     def get_stable_color(self, cube_id):
         """Retorna a cor mais estável baseada no histórico"""
@@ -271,151 +356,443 @@ class CubeDetector:
         else:
             return 'unknown', confidence
     
+    def _color_signature(self, frame, bbox):
+        """Cor média (BGR) da região central da bbox - barata, detecta mudança de aparência"""
+        rect = self._center_rect(frame, bbox)
+        if rect is None:
+            return None
+        cx1, cy1, cx2, cy2 = rect
+        return cv2.mean(frame[cy1:cy2, cx1:cx2])[:3]
+    
+    def _cached_color(self, cube, frame, bbox):
+        """Cor em cache do cubo se ainda vale para esta bbox; None se precisa reclassificar"""
+        cache = cube.get('color_cache')
+        if cache is None or cache['frames'] >= self.color_recheck_interval:
+            return None
+        if self.get_stable_color(cube['id'])[0] == 'unknown':
+            return None
+        
+        # Bbox andou desde a última classificação
+        (x1, y1, x2, y2), (cx1, cy1, cx2, cy2) = bbox, cache['bbox']
+        shift = max(abs((x1 + x2) - (cx1 + cx2)), abs((y1 + y2) - (cy1 + cy2))) / 2
+        if shift > self.color_cache_max_shift:
+            return None
+        
+        # Aparência mudou (ex.: cubo girado para outra face)
+        signature = self._color_signature(frame, bbox) if frame is not None else None
+        if signature is None or cache['signature'] is None:
+            return None
+        if max(abs(a - b) for a, b in zip(signature, cache['signature'])) > self.color_cache_max_change:
+            return None
+        return cube['color'], cache['confidence']
+    
+    def _store_color_cache(self, cube, frame, bbox, confidence):
+        cube['color_cache'] = {
+            'bbox': bbox,
+            'signature': self._color_signature(frame, bbox) if frame is not None else None,
+            'confidence': confidence,
+            'frames': 0
+        }
+    
     def update_tracking(self, detections, current_time):
-        """Sistema de tracking baseado em cores - cada cor é um cubo diferente"""
+        """Associa as detecções aos cubos ativos (atribuição ótima por IoU + distância)"""
         # Marca todos os cubos ativos como não detectados neste frame
-        for color in self.active_cubes_by_color:
-            self.active_cubes_by_color[color]['detected_this_frame'] = False
+        for cube_data in self.active_cubes.values():
+            cube_data['detected_this_frame'] = False
         
-        # Processa cada detecção
-        for detection in detections:
-            bbox = detection['bbox']
-            
-            # Detecta cor da detecção
-            cube_color, color_conf = self.detect_cube_color(
-                detection.get('frame', None), bbox
-            )
+        # Associa primeiro as bboxes; a cor só é calculada onde o cache não serve
+        cube_ids = list(self.active_cubes)
+        pairs, missed_tracks, new_detections = match_boxes(
+            [self.active_cubes[cube_id]['bbox'] for cube_id in cube_ids],
+            [detection['bbox'] for detection in detections],
+            self.max_distance_threshold, self.min_iou
+        )
+        
+        color_start = time.perf_counter()
+        cached_colors = {}
+        for track_index, detection_index in pairs:
+            detection = detections[detection_index]
+            cached = self._cached_color(self.active_cubes[cube_ids[track_index]],
+                                        detection.get('frame'), detection['bbox'])
+            if cached is not None:
+                cached_colors[detection_index] = cached
+        to_classify = [index for _, index in pairs if index not in cached_colors] + list(new_detections)
+        
+        # Pré-processamento compartilhado: blur + HSV uma vez por frame, só nas bboxes a classificar
+        frame = detections[0].get('frame') if detections else None
+        frame_hsv = None
+        if frame is not None and to_classify:
+            frame_hsv = self.prepare_frame_hsv(frame, [detections[index]['bbox'] for index in to_classify])
+        
+        # Detecta cor das detecções sem cache
+        detected_colors = dict(cached_colors)
+        for index in to_classify:
+            detection = detections[index]
+            detected_colors[index] = self.detect_cube_color(detection.get('frame', None), detection['bbox'], frame_hsv)
+        tracking_start = time.perf_counter()
+        self.perf.record('cor', tracking_start - color_start, tracking_start)
+        self.perf.count('cor_classificadas', len(to_classify))
+        self.perf.count('cor_cache', len(cached_colors))
+        
+        # Só entram no tracking detecções com cor confiável
+        def confident(index):
+            cube_color, color_conf = detected_colors[index]
+            return color_conf > self.color_confidence_threshold and cube_color != 'unknown'
+        
+        missed_tracks = list(missed_tracks)
+        
+        # Cubos associados: atualiza posição e histórico de cores
+        for track_index, detection_index in pairs:
+            cube_id = cube_ids[track_index]
+            if not confident(detection_index):
+                missed_tracks.append(track_index)
+                continue
             
-            if color_conf > self.color_confidence_threshold and cube_color != 'unknown':
-                # Verifica se já existe um cubo desta cor
-                if cube_color in self.active_cubes_by_color:
-                    # Atualiza cubo existente da mesma cor
-                    cube = self.active_cubes_by_color[cube_color]
-                    cube['bbox'] = bbox
-                    cube['last_seen'] = current_time
-                    cube['detected_this_frame'] = True
-                    
-                    # Adiciona cor detectada ao histórico
-                    if cube_color not in self.color_detection_history:
-                        self.color_detection_history[cube_color] = []
-                    
-                    self.color_detection_history[cube_color].append(cube_color)
-                    
-                    # Mantém apenas os últimos valores
-                    if len(self.color_detection_history[cube_color]) > self.max_color_history:
-                        self.color_detection_history[cube_color] = self.color_detection_history[cube_color][-self.max_color_history:]
-                    
-                else:
-                    # Nova cor detectada - cria novo cubo para esta cor
-                    cube_id = f"cubo_{cube_color}_{len(self.active_cubes_by_color) + 1}"
-                    self.active_cubes_by_color[cube_color] = {
-                        'id': cube_id,
-                        'color': cube_color,
-                        'entry_time': current_time,
-                        'last_seen': current_time,
-                        'bbox': bbox,
-                        'detected_this_frame': True
-                    }
-                    
-                    # Inicializa histórico de cores
-                    self.color_detection_history[cube_color] = [cube_color]
-        
-        # Remove cubos que não foram detectados neste frame
-        cubes_to_remove = []
-        for color, cube_data in self.active_cubes_by_color.items():
-            if not cube_data['detected_this_frame']:
-                cubes_to_remove.append(color)
-        
-        # Remove cubos e adiciona ao histórico
-        for color in cubes_to_remove:
-            cube_data = self.active_cubes_by_color[color]
-            # Usa o tempo atual (quando o cubo saiu) em vez da última detecção
-            total_time = current_time - cube_data['entry_time']
+            detection = detections[detection_index]
+            bbox = detection['bbox']
+            cube = self.active_cubes[cube_id]
+            cube['bbox'] = bbox
+            cube['last_seen'] = current_time
+            cube['detected_this_frame'] = True
+            cube['hits'] += 1
+            cube['missed'] = 0
+            cube['missed_since'] = None
+            if cube['hits'] == self.min_hits:
+                self.confirm_cube(cube)
             
-            # Adiciona ao tempo total desta cor
-            self.color_total_times[color] += total_time
+            if detection_index in cached_colors:
+                cube['color_cache']['frames'] += 1
+                continue
             
-            cube_data['total_time'] = total_time
-            cube_data['final_color'] = color
-            cube_data['total_time_for_color'] = self.color_total_times[color]
+            cube_color, color_conf = detected_colors[detection_index]
+            history = self.color_detection_history.setdefault(cube_id, [])
+            history.append(cube_color)
             
-            self.cube_history.append(cube_data.copy())
+            # Mantém apenas os últimos valores
+            if len(history) > self.max_color_history:
+                del history[:-self.max_color_history]
             
-            # Adiciona ao logger se estiver disponível
-            if hasattr(self, 'logger'):
-                self.logger.add_cube(color, total_time)
+            # A cor do cubo é a mais estável do histórico
+            stable_color, _ = self.get_stable_color(cube_id)
+            if stable_color != 'unknown':
+                cube['color'] = stable_color
+            self._store_color_cache(cube, detection.get('frame'), bbox, color_conf)
+        
+        # Detecções sem cubo: novos cubos
+        for detection_index in new_detections:
+            if not confident(detection_index):
+                continue
+            detection = detections[detection_index]
+            bbox = detection['bbox']
+            cube_color, color_conf = detected_colors[detection_index]
+            cube_id = f"cubo_{self.next_cube_number}"
+            self.active_cubes[cube_id] = {
+                'id': cube_id,
+                'number': self.next_cube_number,
+                'color': cube_color,
+                'entry_time': current_time,
+                'last_seen': current_time,
+                'bbox': bbox,
+                'detected_this_frame': True,
+                'hits': 1,
+                'missed': 0,
+                'missed_since': None
+            }
+            self.next_cube_number += 1
+            self._store_color_cache(self.active_cubes[cube_id], detection.get('frame'), bbox, color_conf)
             
-            del self.active_cubes_by_color[color]
-            # Limpa histórico de cores
-            if color in self.color_detection_history:
-                del self.color_detection_history[color]
+            # Inicializa histórico de cores
+            self.color_detection_history[cube_id] = [cube_color]
+            if self.min_hits <= 1:
+                self.confirm_cube(self.active_cubes[cube_id])
+        
+        # Cubos não detectados: só saem depois de max_missed_frames frames seguidos
+        for track_index in missed_tracks:
+            cube_id = cube_ids[track_index]
+            cube = self.active_cubes[cube_id]
+            cube['missed'] += 1
+            if cube['missed_since'] is None:
+                cube['missed_since'] = current_time
+            if cube['missed'] > self.max_missed_frames:
+                self.end_cube(cube_id)
+        
+        end = time.perf_counter()
+        self.perf.record('tracking', end - tracking_start, end)
     
-    def detect_cubes(self, frame, current_time):
-        """Detecta cubos no frame"""
-        # Faz predição
-        results = self.model(frame, conf=self.confidence, verbose=False)
+    def confirm_cube(self, cube):
+        """Cubo passou de min_hits detecções: deixa de ser fragmento e sua entrada é publicada"""
+        if self.events is not None:
+            self.events.cube_entered(cube['number'], cube['color'], cube['entry_time'])
+    
+    def end_cube(self, cube_id, exit_time=None):
+        """Encerra um cubo: soma o tempo na cor e envia ao logger (fragmentos são descartados)"""
+        cube_data = self.active_cubes.pop(cube_id)
+        self.color_detection_history.pop(cube_id, None)
+        
+        # Confirmado só depois de min_hits detecções: abaixo disso é ruído do detector
+        if cube_data['hits'] < self.min_hits:
+            return
+        
+        # Tempo de saída = primeiro frame em que o cubo não foi visto
+        if exit_time is None:
+            exit_time = cube_data['missed_since']
+        color = cube_data['color']
+        total_time = exit_time - cube_data['entry_time']
+        
+        # Adiciona ao tempo total desta cor
+        self.color_total_times[color] += total_time
+        
+        cube_data['total_time'] = total_time
+        cube_data['final_color'] = color
+        cube_data['total_time_for_color'] = self.color_total_times[color]
+        
+        self.cube_history.append(cube_data.copy())
+        
+        if self.events is not None:
+            self.events.cube_exited(cube_data['number'], color, exit_time, total_time)
+        
+        # Adiciona ao logger se estiver disponível
+        if hasattr(self, 'logger'):
+            self.logger.add_cube(color, total_time)
+    
+    def end_all_cubes(self, current_time):
+        """Encerra todos os cubos ativos (fim do vídeo/sessão)"""
+        for cube_id in list(self.active_cubes):
+            cube_data = self.active_cubes[cube_id]
+            self.end_cube(cube_id, cube_data['missed_since'] or current_time)
+    
+    def adjust_detect_interval(self, inference_time):
+        """Escolhe de quantos em quantos frames rodar o YOLO (movimento e carga medidos)"""
+        # Movimento: limita quanto uma bbox pode derivar até a próxima detecção
+        # (sem medida ainda, não arrisca espaçar as detecções)
+        if self.propagator.motion is None:
+            motion_interval = 1
+        else:
+            motion_interval = int(self.max_propagation_drift / max(self.propagator.motion, 0.5))
+        
+        # Carga: se o YOLO não cabe no tempo de um frame, espaça as detecções
+        load_interval = int(np.ceil(inference_time / self.frame_budget))
+        
+        interval = max(min(motion_interval, self.max_detect_interval), load_interval)
+        self.detect_interval = max(1, min(interval, self.max_detect_interval))
+    
+    def reuse_or_propagate(self, frame):
+        """Bboxes do frame sem rodar o YOLO (gate ou propagação); None quando é preciso detectar"""
+        # Gate de movimento: cena parada reaproveita as detecções anteriores
+        scene_changed = True
+        if self.motion_gate is not None:
+            start = time.perf_counter()
+            scene_changed = self.motion_gate.should_infer(frame)
+            end = time.perf_counter()
+            self.perf.record('gate', end - start, end)
+            self.perf.count('gate_frames')
+        
+        if not scene_changed:
+            self.perf.count('gate_pulados')
+            return self.last_boxes
+        # Só movimento em relação ao frame anterior: segue a cadência da propagação;
+        # mudança grande desde a última inferência (ex.: cubo entrando) detecta já
+        large_change = self.motion_gate is not None and self.motion_gate.large_change
+        if not large_change and self.propagator.has_boxes() and self.frames_since_detection < self.detect_interval:
+            # Entre detecções: apenas desloca as bboxes anteriores
+            start = time.perf_counter()
+            boxes = self.propagator.propagate(frame)
+            self.frames_since_detection += 1
+            end = time.perf_counter()
+            self.perf.record('propagacao', end - start, end)
+            return boxes
+        if self.motion_gate is not None:
+            self.motion_gate.inferred()
+        return None
+    
+    def accept_detection(self, frame, boxes, inference_time):
+        """Registra uma detecção do YOLO (feita aqui ou no serviço de inferência em lote)"""
+        # Frames desde a detecção anterior (os propagados entre elas)
+        frames_elapsed = max(1, self.frames_since_detection)
+        self.frames_since_detection = 1
+        end = time.perf_counter()
+        self.perf.record('yolo', inference_time, end)
+        
+        if self.resolution is not None:
+            self.resolution.update(inference_time)
+        if self.adaptive_interval:
+            self.propagator.observe_detection(boxes, frames_elapsed)
+            self.adjust_detect_interval(inference_time)
+        if self.detect_interval > 1:
+            self.propagator.reset(frame, boxes)
+            self.perf.record('propagacao', time.perf_counter() - end)
+    
+    def track_boxes(self, frame, boxes, current_time):
+        """Transforma as bboxes em detecções e atualiza o tracking"""
+        self.last_boxes = boxes
         
         detections = []
-        for r in results:
-            if r.boxes is not None:
-                for box in r.boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    conf = float(box.conf[0])
-                    
-                    detections.append({
-                        'bbox': (x1, y1, x2, y2),
-                        'confidence': conf,
-                        'frame': frame  # Passa o frame para detecção de cor
-                    })
+        for bbox, conf in boxes:
+            detections.append({
+                'bbox': bbox,
+                'confidence': conf,
+                'frame': frame  # Passa o frame para detecção de cor
+            })
         
         # Atualiza tracking
         self.update_tracking(detections, current_time)
         
         return detections
+    
+    def detect_cubes(self, frame, current_time):
+        """Detecta cubos no frame"""
+        boxes = self.reuse_or_propagate(frame)
+        if boxes is None:
+            # Faz predição (no tamanho escolhido pelo controle de resolução; as bboxes voltam
+            # na resolução do frame, que continua inteiro para a detecção de cor)
+            imgsz = self.resolution.imgsz if self.resolution is not None else None
+            start = time.perf_counter()
+            boxes = self.backend.predict(frame, self.confidence, imgsz)
+            self.accept_detection(frame, boxes, time.perf_counter() - start)
+        
+        return self.track_boxes(frame, boxes, current_time)
 
-def main():
-    # Carrega o melhor modelo disponível
-    model_paths = [
-        "runs-cube/yolov8n-cube5/weights/best.pt",
-        "runs-cube/yolov8n-cube4/weights/best.pt",
-        "runs-cube/yolov8n-cube3/weights/best.pt"
-    ]
-    
-    model_path = None
-    for path in model_paths:
-        try:
-            YOLO(path)
-            model_path = path
-            break
-        except:
-            continue
+def display_frame(detector, frame):
+    """Frame onde desenhar o overlay
+
+    Com o gravador, o frame lido é o próprio slot do buffer circular: o overlay vai para um
+    frame de exibição alocado uma única vez, preenchido com np.copyto a cada desenho.
+    """
+    if detector.recorder is None:
+        return frame
+    if detector.display is None or detector.display.shape != frame.shape:
+        detector.display = np.empty_like(frame)
+    np.copyto(detector.display, frame)
+    return detector.display
+
+def draw_overlays(frame, detector, current_time):
+    """Desenha contornos, tempos e informações do grupo sobre o frame"""
+    # Desenha detecções para cubos ativos
+    for cube_data in detector.active_cubes.values():
+        color = cube_data['color']
+        x1, y1, x2, y2 = cube_data['bbox']
+        
+        # Cor do contorno baseada na cor detectada
+        color_bgr = COLOR_BGR.get(color, (128, 128, 128))
+        face_name = detector.color_mapping.get(color, 'Desconhecida')
+        
+        # Desenha contorno
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color_bgr, 3)
+        
+        # Calcula tempo na tela - usa último tempo visto se não foi detectado neste frame
+        if cube_data['detected_this_frame']:
+            time_in_frame = current_time - cube_data['entry_time']
+        else:
+            time_in_frame = cube_data['last_seen'] - cube_data['entry_time']
+        
+        # Texto com tempo e face
+        label = f"Cubo {color} | {time_in_frame:.1f}s | {face_name}"
+        
+        cv2.putText(frame, label, (x1, y1 - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color_bgr, 2)
     
-    if model_path is None:
-        return
+    # Bloco de tempos totais por cor - posicionado no canto superior direito
+    detector.draw_time_block(frame, detector)
     
-    # Inicializa detector
-    detector = CubeDetector(model_path)
+    # Informações dos cubos ativos - posicionado no canto superior esquerdo
+    y_offset = 30
+    if detector.active_cubes:
+        cv2.putText(frame, f"Cubos Ativos: {len(detector.active_cubes)}", (10, y_offset),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        y_offset += 25
+        
+        for cube_data in detector.active_cubes.values():
+            color = cube_data['color']
+            face_name = detector.color_mapping.get(color, 'Desconhecida')
+            # Calcula tempo corretamente - para quando nao detectado
+            if cube_data['detected_this_frame']:
+                time_in_frame = current_time - cube_data['entry_time']
+            else:
+                time_in_frame = cube_data['last_seen'] - cube_data['entry_time']
+            
+            text = f"Cubo {color}: {time_in_frame:.1f}s | {face_name}"
+            
+            cv2.putText(frame, text, (10, y_offset),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            y_offset += 20
     
-    # Inicializa logger
-    logger = create_logger()
-    detector.logger = logger
+    # Grupo atual, controles e debug: mudam raramente, vêm de um sprite em cache
+    # (posições relativas ao fim da lista de cubos ativos)
+    texts = []
+    info_y = 0
+    if hasattr(detector, 'logger'):
+        group_info = detector.logger.get_current_group_info()
+        info_y += 10
+        texts.append((f"Grupo Atual: {group_info['current_group_size']}/3", (10, info_y), 0.5, (255, 255, 0), 2))
+        info_y += 20
+        
+        # Mostra as cores do grupo atual
+        if group_info['current_colors']:
+            colors_text = f"Cores: {', '.join(group_info['current_colors'])}"
+            texts.append((colors_text, (10, info_y), 0.4, (255, 255, 0), 1))
+            info_y += 15
+        
+        texts.append((f"Grupos Finalizados: {group_info['total_groups']}", (10, info_y), 0.5, (255, 255, 0), 2))
     
-    # Abre webcam - tenta diferentes câmeras automaticamente
-    cap = None
-    for camera_id in [1, 0, 2, 3]:  # Tenta câmera 1 primeiro, depois 0, 2, 3...
-        cap = cv2.VideoCapture(camera_id)
-        if cap.isOpened():
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            cap.set(cv2.CAP_PROP_FPS, 30)
-            break
-        else:
-            cap.release()
+    # Controles na tela
+    info_y += 30
+    controls = "Controles: 'q'=sair, 't'=testar cores, 'd'=debug, 'p'=desempenho, 'f'=finalizar grupo"
+    if detector.recorder is not None:
+        controls += ", 'c'=clipe"
+    texts.append((controls, (10, info_y), 0.4, (200, 200, 200), 1))
+    info_y += 15
+    texts.append((f"Debug: {'ON' if detector.debug_mode else 'OFF'}", (10, info_y), 0.4, (200, 200, 200), 1))
     
-    if not cap or not cap.isOpened():
-        return
+    detector.info_sprite.update(texts)
+    detector.info_sprite.blit(frame, (0, y_offset))
     
+    # Percentis de latência por estágio - canto inferior esquerdo
+    if detector.show_perf:
+        perf_lines = list(detector.perf.overlay_lines())
+        if detector.motion_gate is not None:
+            perf_lines.append(f"gate: {detector.motion_gate.skip_rate():.0%} dos frames sem YOLO")
+        if detector.resolution is not None:
+            perf_lines.append(f"imgsz: {detector.resolution.imgsz} "
+                              f"(orçamento {detector.resolution.budget * 1000:.0f}ms)")
+        # Linhas relativas à base do frame (atualizadas a cada 0,5s pelo monitor)
+        perf_texts = [(line, (10, 15 * (i + 1 - len(perf_lines)) - 10), 0.4, (0, 200, 255), 1)
+                      for i, line in enumerate(perf_lines)]
+        detector.perf_sprite.update(perf_texts)
+        detector.perf_sprite.blit(frame, (0, frame.shape[0]))
+
+def handle_key(key, detector, frame, detections):
+    """Trata as teclas de controle; retorna False quando o programa deve sair"""
+    if key == ord('q'):
+        return False
+    elif key == ord('t'):  # Tecla 't' para testar ranges de cores
+        if detections:
+            detector.test_color_ranges(frame, detections[0]['bbox'])
+    elif key == ord('d'):  # Tecla 'd' para toggle debug
+        detector.debug_mode = not detector.debug_mode
+    elif key == ord('p'):  # Tecla 'p' para mostrar latências por estágio
+        detector.show_perf = not detector.show_perf
+    elif key == ord('f'):  # Tecla 'f' para finalizar grupo atual
+        if hasattr(detector, 'logger'):
+            detector.logger.force_finalize_group()
+    elif key == ord('c'):  # Tecla 'c' para salvar os últimos segundos gravados
+        if detector.recorder is not None:
+            detector.recorder.request_last()
+    return True
+
+def mark_first_frame(detector):
+    """Mostra (uma vez) quanto tempo levou do início do programa até o primeiro frame anotado"""
+    if detector.started_at is None:
+        return
+    elapsed = time.perf_counter() - detector.started_at
+    detector.started_at = None
+    detector.perf.record('primeiro_frame', elapsed)
+    print(f"Primeiro frame anotado {elapsed:.2f}s após o início")
+
+def run_serial(cap, detector):
+    """Loop original: captura, detecção e desenho em sequência na mesma thread"""
+    perf = detector.perf
     while True:
+        frame_start = time.perf_counter()
         ret, frame = cap.read()
         if not ret:
             break
@@ -425,109 +802,492 @@ def main():
         # Detecta cubos
         detections = detector.detect_cubes(frame, current_time)
         
-        # Desenha detecções para cubos ativos
-        for color, cube_data in detector.active_cubes_by_color.items():
-            x1, y1, x2, y2 = cube_data['bbox']
-            
-            # Cor do contorno baseada na cor detectada
-            color_map = {
-                'white': (255, 255, 255),
-                'yellow': (0, 255, 255),
-                'red': (0, 0, 255),
-                'orange': (0, 165, 255),
-                'blue': (255, 0, 0),
-                'green': (0, 255, 0),
-                'unknown': (128, 128, 128)
-            }
-            
-            color_bgr = color_map.get(color, (128, 128, 128))
-            face_name = detector.color_mapping.get(color, 'Desconhecida')
-            
-            # Desenha contorno
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color_bgr, 3)
-            
-            # Calcula tempo na tela - usa último tempo visto se não foi detectado neste frame
-            if cube_data['detected_this_frame']:
-                time_in_frame = current_time - cube_data['entry_time']
-            else:
-                time_in_frame = cube_data['last_seen'] - cube_data['entry_time']
-            
-            # Texto com tempo e face
-            label = f"Cubo {color} | {time_in_frame:.1f}s | {face_name}"
-            
-            cv2.putText(frame, label, (x1, y1 - 10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color_bgr, 2)
-        
-        # Bloco de tempos totais por cor - posicionado no canto superior direito
-        detector.draw_time_block(frame, detector)
-        
-        # Informações dos cubos ativos - posicionado no canto superior esquerdo
-        y_offset = 30
-        if detector.active_cubes_by_color:
-            cv2.putText(frame, f"Cubos Ativos: {len(detector.active_cubes_by_color)}", (10, y_offset),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            y_offset += 25
-            
-            for color, cube_data in detector.active_cubes_by_color.items():
-                face_name = detector.color_mapping.get(color, 'Desconhecida')
-                # Calcula tempo corretamente - para quando nao detectado
-                if cube_data['detected_this_frame']:
-                    time_in_frame = current_time - cube_data['entry_time']
-                else:
-                    time_in_frame = cube_data['last_seen'] - cube_data['entry_time']
-                
-                text = f"Cubo {color}: {time_in_frame:.1f}s | {face_name}"
-                
-                cv2.putText(frame, text, (10, y_offset),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                y_offset += 20
-        
-        # Informações do logger
-        if hasattr(detector, 'logger'):
-            group_info = detector.logger.get_current_group_info()
-            y_offset += 10
-            cv2.putText(frame, f"Grupo Atual: {group_info['current_group_size']}/3", (10, y_offset),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
-            y_offset += 20
-            
-            # Mostra as cores do grupo atual
-            if group_info['current_colors']:
-                colors_text = f"Cores: {', '.join(group_info['current_colors'])}"
-                cv2.putText(frame, colors_text, (10, y_offset),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
-                y_offset += 15
-            
-            cv2.putText(frame, f"Grupos Finalizados: {group_info['total_groups']}", (10, y_offset),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
-        
-        # Controles na tela
-        y_offset += 30
-        cv2.putText(frame, "Controles: 'q'=sair, 't'=testar cores, 'd'=debug, 'f'=finalizar grupo", (10, y_offset),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-        y_offset += 15
-        cv2.putText(frame, f"Debug: {'ON' if detector.debug_mode else 'OFF'}", (10, y_offset),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
+        start = time.perf_counter()
+        display = display_frame(detector, frame)
+        draw_overlays(display, detector, current_time)
+        end = time.perf_counter()
+        perf.record('desenho', end - start, end)
+        mark_first_frame(detector)
         
         # Mostra frame
-        cv2.imshow("Detecção de Cubos", frame)
+        start = end
+        cv2.imshow("Detecção de Cubos", display)
         
         # Controles
         key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
+        end = time.perf_counter()
+        perf.record('exibicao', end - start, end)
+        perf.record('frame', end - frame_start, end)
+        
+        if not handle_key(key, detector, frame, detections):
             break
-        elif key == ord('t'):  # Tecla 't' para testar ranges de cores
-            if detections:
-                detector.test_color_ranges(frame, detections[0]['bbox'])
-        elif key == ord('d'):  # Tecla 'd' para toggle debug
-            detector.debug_mode = not detector.debug_mode
-        elif key == ord('f'):  # Tecla 'f' para finalizar grupo atual
-            if hasattr(detector, 'logger'):
+
+def run_pipelined(cap, detector, queue_size):
+    """Captura, inferência e renderização em estágios paralelos"""
+    pipeline = CubePipeline(cap, detector, queue_size=queue_size)
+    
+    def render(frame, detections, current_time):
+        start = time.perf_counter()
+        display = display_frame(detector, frame)
+        with pipeline.lock:
+            draw_overlays(display, detector, current_time)
+        end = time.perf_counter()
+        detector.perf.record('desenho', end - start, end)
+        mark_first_frame(detector)
+        
+        cv2.imshow("Detecção de Cubos", display)
+        
+        key = cv2.waitKey(1) & 0xFF
+        detector.perf.record('exibicao', time.perf_counter() - end)
+        with pipeline.lock:
+            return handle_key(key, detector, frame, detections)
+    
+    pipeline.run(render)
+    print(format_stats(detector.perf.stages.values()))
+    print(f"Frames descartados: {pipeline.dropped_frames} antes da inferência, "
+          f"{pipeline.dropped_results} antes da renderização")
+
+def session_metrics(detector):
+    """Estado da sessão para o endpoint /metrics (chamar com o lock do detector)"""
+    active_cubes = []
+    for cube_id, cube_data in detector.active_cubes.items():
+        color = cube_data['color']
+        active_cubes.append({
+            'id': cube_id,
+            'color': color,
+            'face': detector.color_mapping.get(color, 'Desconhecida'),
+            'bbox': [int(v) for v in cube_data['bbox']],
+            'time_on_screen': cube_data['last_seen'] - cube_data['entry_time'],
+            'detected_this_frame': cube_data['detected_this_frame']
+        })
+    
+    metrics = {
+        'active_cubes': active_cubes,
+        'color_total_times': dict(detector.color_total_times),
+        'perf': detector.perf.to_dict()
+    }
+    if hasattr(detector, 'logger'):
+        metrics['current_group'] = detector.logger.get_current_group_info()
+        metrics['summary'] = detector.logger.get_summary()
+    if detector.motion_gate is not None:
+        metrics['motion_gate'] = {'frames': detector.motion_gate.frames,
+                                  'skipped': detector.motion_gate.skipped}
+    if detector.resolution is not None:
+        metrics['resolution'] = detector.resolution.to_dict()
+    if detector.events is not None:
+        metrics['events'] = detector.events.stats()
+    return metrics
+
+def handle_commands(server, detector):
+    """Executa os comandos recebidos por HTTP; retorna False quando o programa deve sair"""
+    keep_running = True
+    for command in server.poll_commands():
+        if command == 'finalize' and hasattr(detector, 'logger'):
+            with server.lock:
                 detector.logger.force_finalize_group()
+        elif command == 'clip' and detector.recorder is not None:
+            detector.recorder.request_last()
+        elif command == 'quit':
+            keep_running = False
+    return keep_running
+
+def run_headless(cap, detector, server, pipelined=False, queue_size=1):
+    """Sem janela: o frame anotado vai para o stream MJPEG e os controles vêm por HTTP"""
+    perf = detector.perf
+    
+    def render(frame, detections, current_time):
+        # Desenha e codifica só se alguém estiver assistindo
+        if server.has_clients():
+            start = time.perf_counter()
+            display = display_frame(detector, frame)
+            with server.lock:
+                draw_overlays(display, detector, current_time)
+            end = time.perf_counter()
+            perf.record('desenho', end - start, end)
+            server.publish(display)
+            perf.record('jpeg', time.perf_counter() - end)
+        mark_first_frame(detector)
+        return handle_commands(server, detector)
+    
+    if pipelined:
+        CubePipeline(cap, detector, queue_size=queue_size, lock=server.lock).run(render)
+        return
+    
+    while True:
+        frame_start = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        
+        current_time = time.time()
+        with server.lock:
+            detections = detector.detect_cubes(frame, current_time)
+        keep_running = render(frame, detections, current_time)
+        
+        end = time.perf_counter()
+        perf.record('frame', end - frame_start, end)
+        if not keep_running:
+            break
+
+def run_replay(source, detector):
+    """Reprocessa um vídeo/pasta de frames sem janela, o mais rápido possível"""
+    perf = detector.perf
+    frames = 0
+    session_start = time.perf_counter()
+    while True:
+        start = time.perf_counter()
+        ret, frame = source.read()
+        if not ret:
+            break
+        perf.record('leitura', time.perf_counter() - start)
+        
+        # Tempo derivado do vídeo, não do relógio - resultado reproduzível
+        current_time = source.timestamp()
+        
+        start = time.perf_counter()
+        detector.detect_cubes(frame, current_time)
+        perf.record('deteccao', time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        draw_overlays(frame, detector, current_time)
+        perf.record('desenho', time.perf_counter() - start)
+        
+        frames += 1
+    
+    elapsed = time.perf_counter() - session_start
+    
+    # Cubos ainda na tela saem no último frame
+    if frames:
+        detector.end_all_cubes(source.timestamp())
+    
+    print(format_stats(perf.stages.values()))
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    print(f"Frames processados: {frames} em {elapsed:.2f}s ({fps:.1f} frames/s)")
+
+def run_multi_camera(caps, detectors, backend, names, resolution=None):
+    """Várias câmeras com um único modelo: uma janela por câmera, YOLO em lote
+    
+    resolution: ResolutionController do lote (o tempo do lote inteiro cabe num frame)
+    """
+    service = MultiCameraService(caps, detectors, backend)
+    service.resolution = resolution
+    
+    def render(index, frame, detections, current_time):
+        detector = detectors[index]
+        start = time.perf_counter()
+        display = display_frame(detector, frame)
+        with service.locks[index]:
+            draw_overlays(display, detector, current_time)
+        end = time.perf_counter()
+        detector.perf.record('desenho', end - start, end)
+        mark_first_frame(detector)
+        
+        cv2.imshow(f"Detecção de Cubos - {names[index]}", display)
+        
+        key = cv2.waitKey(1) & 0xFF
+        detector.perf.record('exibicao', time.perf_counter() - end)
+        
+        # As teclas valem para todas as estações ('t' testa a câmera da janela atual)
+        keep_running = True
+        for other, other_detector in enumerate(detectors):
+            with service.locks[other]:
+                if other == index:
+                    keep_running = handle_key(key, other_detector, frame, detections) and keep_running
+                else:
+                    keep_running = handle_key(key, other_detector, frame, []) and keep_running
+        return keep_running
+    
+    service.run(render)
+    for name, detector in zip(names, detectors):
+        print(f"\n--- {name} ---")
+        print(format_stats(detector.perf.stages.values()))
+    print(f"\n{format_stats(service.perf.stages.values())}")
+    if resolution is not None:
+        print(f"Resolução do YOLO: {resolution.summary()} ({resolution.changes} mudanças)")
+    print(f"Lotes: {service.perf.counters.get('lotes', 0)} | "
+          f"média de {service.mean_batch_size():.1f} frames por chamada do YOLO")
+    print("Frames descartados antes da inferência: " +
+          ", ".join(f"{name}={dropped}" for name, dropped in zip(names, service.dropped_frames)))
+
+def report_session(detector, logger):
+    """Salva os histogramas de latência e mostra as estatísticas finais da sessão"""
+    if detector.motion_gate is not None:
+        gate = detector.motion_gate
+        print(f"Gate de movimento: YOLO pulado em {gate.skipped}/{gate.frames} frames "
+              f"({gate.skip_rate():.0%})")
+    if detector.resolution is not None:
+        print(f"Resolução do YOLO: {detector.resolution.summary()} "
+              f"({detector.resolution.changes} mudanças)")
+    
+    # Histogramas de latência ao lado do cube_times_*.json da sessão
+    detector.perf.dump(logger.perf_file)
+
+def parse_args(argv=None):
+    """Lê as opções de linha de comando"""
+    parser = argparse.ArgumentParser(description="Detector de cubos mágicos em tempo real")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="captura, inferência e renderização em threads separadas")
+    parser.add_argument('--queue-size', type=int, default=1,
+                        help="tamanho das filas entre estágios do pipeline (descarta o mais antigo)")
+    parser.add_argument('--cameras',
+                        help="lista de câmeras separadas por vírgula (ex.: 0,1,2,3); roda uma estação por "
+                             "câmera com um único modelo e inferência em lote")
+    parser.add_argument('--serve', type=int, metavar='PORTA',
+                        help="modo sem janela: serve o vídeo anotado (MJPEG), métricas em JSON e controles "
+                             "por HTTP nesta porta")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="endereço do servidor HTTP do --serve (padrão 127.0.0.1; 0.0.0.0 para a rede)")
+    parser.add_argument('--jpeg-quality', type=int, default=80,
+                        help="qualidade JPEG do stream do --serve (padrão 80)")
+    parser.add_argument('--source',
+                        help="vídeo gravado ou pasta de frames para reprocessar sem janela")
+    parser.add_argument('--fps', type=float, default=None,
+                        help="FPS usado para derivar o tempo dos frames de uma pasta (padrão 30)")
+    parser.add_argument('--backend', choices=BACKENDS, default='pytorch',
+                        help="backend de inferência (onnx/openvino são exportados na primeira execução)")
+    parser.add_argument('--int8', action='store_true',
+                        help="usa a versão quantizada int8 (calibrada em dataset2/valid) do backend onnx/openvino")
+    parser.add_argument('--model-manifest', default=MODEL_MANIFEST,
+                        help="ranking gerado por src/model_benchmark.py: carrega o modelo/imgsz mais rápido "
+                             f"com mAP50 >= --min-map (padrão {MODEL_MANIFEST}; '' usa a lista fixa)")
+    parser.add_argument('--min-map', type=float, default=DEFAULT_MIN_MAP,
+                        help=f"mAP50 mínimo exigido na escolha pelo manifesto (padrão {DEFAULT_MIN_MAP})")
+    parser.add_argument('--detect-interval', default='1',
+                        help="roda o YOLO a cada N frames e propaga as bboxes entre eles; "
+                             "'auto' ajusta N pelo movimento e pela carga (padrão 1)")
+    parser.add_argument('--target-fps', type=float, default=0,
+                        help="reduz o tamanho de entrada do YOLO (até 320) quando a inferência não cabe "
+                             "nesse FPS e volta a aumentar quando sobra tempo (0 = tamanho fixo)")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="pula o YOLO quando a cena não mudou e reaproveita as detecções anteriores")
+    parser.add_argument('--gate-refresh', type=int, default=30,
+                        help="com --motion-gate, força uma inferência a cada N frames parados (padrão 30)")
+    parser.add_argument('--log-mode', choices=PERSISTENCE_MODES, default='rewrite',
+                        help="'append' grava uma linha JSON por grupo (.jsonl) e gera .txt/.json ao final")
+    parser.add_argument('--fsync-every', type=int, default=0,
+                        help="no modo append, faz fsync a cada N grupos (0 = nunca)")
+    parser.add_argument('--async-log', action='store_true',
+                        help="grava os relatórios e imprime a análise de atrasos numa thread separada")
+    parser.add_argument('--calibration', default=CALIBRATION_FILE,
+                        help="ranges HSV/thresholds gerados por src/color_calibration.py "
+                             f"(padrão {CALIBRATION_FILE}; ignorado se não existir)")
+    parser.add_argument('--record-seconds', type=float, default=0,
+                        help="mantém os últimos N segundos de vídeo na memória e salva um clipe quando um "
+                             "grupo atrasa ou com a tecla 'c' / POST /control/clip (0 = desligado)")
+    parser.add_argument('--events', nargs='?', const=EVENTS_SOCKET, metavar='SOCKET',
+                        help="publica entrada/saída de cubos e grupos completos como eventos binários num "
+                             f"socket Unix local (padrão {EVENTS_SOCKET}; ver src/event_bus.py)")
+    parser.add_argument('--clips-dir', default='clips',
+                        help="pasta dos clipes do --record-seconds (padrão clips)")
+    return parser.parse_args(argv)
+
+def configure_detector(detector, args):
+    """Aplica as opções de cadência e gate de movimento ao detector"""
+    if args.detect_interval == 'auto':
+        detector.adaptive_interval = True
+    else:
+        detector.detect_interval = max(1, int(args.detect_interval))
+    if args.motion_gate:
+        detector.motion_gate = MotionGate(refresh_interval=args.gate_refresh)
+    if args.target_fps:
+        detector.frame_budget = 1 / args.target_fps
+
+def resolution_controller(args, backend):
+    """Controle de resolução do --target-fps (None se desligado ou se o modelo tem tamanho fixo)"""
+    if not args.target_fps:
+        return None
+    fixed = backend.fixed_imgsz()
+    if fixed:
+        print(f"{backend.model_path} foi exportado com tamanho fixo ({fixed}); apague-o para reexportar "
+              f"com tamanho dinâmico e usar o --target-fps")
+        return None
+    return ResolutionController(args.target_fps, max_imgsz=backend.imgsz)
+
+def attach_recorder(detector, cap, args, name='clip'):
+    """Liga o gravador à câmera e ao logger; retorna a câmera que grava cada frame lido"""
+    if not args.record_seconds:
+        return cap
+    recorder = FrameRecorder(args.record_seconds, output_dir=args.clips_dir, name=name)
+    detector.recorder = recorder
+    detector.logger.on_late_group = recorder.clip_group
+    return recorder.wrap(cap)
+
+def attach_events(detector, args, station=None):
+    """Liga o socket de eventos (--events) ao tracking e ao logger"""
+    if not args.events:
+        return
+    events = open_publisher(args.events, station)
+    if events is not None:
+        detector.events = detector.logger.events = events
+        print(f"Eventos em {events.path}")
+
+def close_events(detector):
+    """Fecha o socket de eventos e mostra quantos foram entregues/descartados"""
+    if detector.events is not None:
+        stats = detector.events.stats()
+        print(f"Eventos: {stats['published']} publicados, {stats['dropped']} entregas descartadas")
+        detector.events.close()
+
+def close_recorder(detector):
+    """Espera os clipes pendentes serem gravados"""
+    if detector.recorder is not None:
+        detector.recorder.close()
+
+def run_stations(args, backend, probe, started_at):
+    """Modo multi-câmera: um modelo compartilhado, tracking e logger separados por câmera"""
+    caps, detectors, names = [], [], []
+    for index, (camera, cap) in enumerate(zip(probe.sources, probe.all())):
+        name = f"cam{camera}" if isinstance(camera, int) else f"cam{index}"
+        if cap is None:
+            print(f"Não foi possível abrir a câmera {camera}")
+            continue
+        
+        detector = CubeDetector(None, calibration_file=args.calibration)
+        detector.backend = backend
+        detector.started_at = started_at
+        configure_detector(detector, args)
+        detector.logger = create_logger(persistence=args.log_mode, fsync_every=args.fsync_every,
+                                        async_io=args.async_log, station=name,
+                                        baselines_file=f"delay_baselines_{name}.json")
+        attach_events(detector, args, name)
+        caps.append(attach_recorder(detector, cap, args, f"clip_{name}"))
+        detectors.append(detector)
+        names.append(name)
+    
+    if not caps:
+        return
+    
+    run_multi_camera(caps, detectors, backend, names, resolution_controller(args, backend))
+    
+    for detector in detectors:
+        if detector.logger.current_group:
+            detector.logger.force_finalize_group()
+        report_session(detector, detector.logger)
+        detector.logger.close()
+        close_recorder(detector)
+        close_events(detector)
+    
+    for cap in caps:
+        cap.release()
+    cv2.destroyAllWindows()
+
+def camera_sources(cameras):
+    """'0,1,rtsp://...' -> [0, 1, 'rtsp://...'] (número = câmera local)"""
+    sources = []
+    for camera in cameras.split(','):
+        camera = camera.strip()
+        sources.append(int(camera) if camera.isdigit() else camera)
+    return sources
+
+def load_selected_backend(args):
+    """Modelo e imgsz escolhidos pelo manifesto do benchmark, ou o primeiro de MODEL_PATHS"""
+    choice = None
+    if args.model_manifest:
+        choice = select_model(args.model_manifest, args.min_map, args.backend, args.int8)
+    if choice:
+        backend = load_first_backend([choice['weights']], args.backend, args.int8, choice['imgsz'])
+        if backend is not None:
+            print(f"Modelo escolhido por {args.model_manifest}: {choice['weights']} imgsz={choice['imgsz']} "
+                  f"(mAP50 {choice['map50']:.3f}, p50 {choice['latency_ms']['p50']:.1f}ms)")
+            return backend
+    elif args.model_manifest and os.path.exists(args.model_manifest):
+        print(f"Nenhum modelo atual de {args.model_manifest} atinge mAP50 >= {args.min_map}; usando a lista fixa")
+    return load_first_backend(MODEL_PATHS, args.backend, args.int8)
+
+def main(argv=None):
+    started_at = time.perf_counter()
+    args = parse_args(argv)
+    
+    # Câmeras abrem em paralelo enquanto o modelo carrega
+    probe = None
+    if args.cameras:
+        probe = CameraProbe(camera_sources(args.cameras))
+    elif not args.source:
+        probe = CameraProbe([1, 0, 2, 3])  # Prioridade: câmera 1, depois 0, 2, 3...
+    
+    # Carrega o modelo mais rápido que atinge a precisão mínima (uma única vez);
+    # sem manifesto, o primeiro disponível da lista fixa
+    backend = load_selected_backend(args)
+    if backend is None:
+        return
+    
+    # Warm-up: a primeira inferência (inicialização preguiçosa) não cai no primeiro frame real
+    start = time.perf_counter()
+    backend.warmup(batch=len(probe.sources) if args.cameras else 1)
+    print(f"Modelo {backend.model_path} ({backend.name}) pronto em {time.perf_counter() - started_at:.2f}s "
+          f"(warm-up {time.perf_counter() - start:.2f}s)")
+    
+    # Várias estações no mesmo processo
+    if args.cameras:
+        run_stations(args, backend, probe, started_at)
+        return
+    
+    # Inicializa detector com o modelo já carregado
+    detector = CubeDetector(None, calibration_file=args.calibration)
+    detector.backend = backend
+    if detector.calibration_file:
+        print(f"Cores calibradas por {detector.calibration_file}")
+    detector.started_at = started_at
+    configure_detector(detector, args)
+    detector.resolution = resolution_controller(args, backend)
+    
+    # Inicializa logger
+    logger = create_logger(persistence=args.log_mode, fsync_every=args.fsync_every,
+                           async_io=args.async_log)
+    detector.logger = logger
+    attach_events(detector, args)
+    
+    # Reprocessamento offline de vídeo/pasta de frames
+    if args.source:
+        source = open_replay_source(args.source, args.fps)
+        if not source.isOpened():
+            print(f"Não foi possível abrir {args.source}")
+            return
+        
+        run_replay(source, detector)
+        
+        if detector.logger.current_group:
+            detector.logger.force_finalize_group()
+        summary = detector.logger.get_summary()
+        print(f"Grupos: {summary['total_groups']} | Cubos: {summary['total_cubes']} | "
+              f"Tempo total: {summary['total_time']:.1f}s")
+        report_session(detector, logger)
+        logger.close()
+        close_events(detector)
+        source.release()
+        return
+    
+    # Webcam aberta pela sondagem paralela (primeira disponível na ordem de prioridade)
+    cap = probe.first()
+    if cap is None:
+        return
+    cap = attach_recorder(detector, cap, args)
+    
+    if args.serve:
+        server = StreamServer(args.host, args.serve, args.jpeg_quality,
+                              metrics=lambda: session_metrics(detector))
+        server.start()
+        print(f"Servidor em {server.address} (stream em /stream, métricas em /metrics, "
+              f"POST /control/finalize, /control/clip e /control/quit)")
+        try:
+            run_headless(cap, detector, server, args.pipeline, args.queue_size)
+        except KeyboardInterrupt:
+            pass
+        server.close()
+    elif args.pipeline:
+        run_pipelined(cap, detector, args.queue_size)
+    else:
+        run_serial(cap, detector)
     
     # Finaliza grupo restante se houver
     if hasattr(detector, 'logger') and detector.logger.current_group:
         detector.logger.force_finalize_group()
     
+    report_session(detector, logger)
+    logger.close()
+    close_recorder(detector)
+    close_events(detector)
+    
     cap.release()
     cv2.destroyAllWindows()
 